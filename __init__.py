@@ -48,10 +48,11 @@ if "bpy" in locals():
 
     reload_package(sys.modules[__name__])
 
-import bpy
-
-from . import axis, operators, panel, preferences
-from . import translations
+try:
+    import bpy
+except ImportError:
+    # outside of Blender, only the modules that don't need it (solve, stroke) can be imported
+    bpy = None
 
 bl_info = {
     'name': 'Light Painter',
@@ -66,29 +67,33 @@ bl_info = {
     'tracker_url': 'https://github.com/semagnum/light-painter/issues',
 }
 
-operators_to_register = (
-    operators.LIGHTPAINTER_OT_Lamp,
-    operators.LIGHTPAINTER_OT_Lamp_Adjust,
-    operators.LIGHTPAINTER_OT_Mesh,
-    operators.LIGHTPAINTER_OT_Tube_Light,
-    operators.LIGHTPAINTER_OT_Sky,
-    operators.LIGHTPAINTER_OT_Sun,
-    operators.LIGHTPAINTER_OT_Flag,
-    operators.LIGHTPAINTER_OT_Lamp_Texture,
-    operators.LIGHTPAINTER_OT_Lamp_Texture_Remove,
-
-    preferences.VIEW3D_AddonPreferences,
-)
-
-tools = (
-    panel.VIEW3D_T_light_paint,
-    panel.VIEW3D_T_sun_paint,
-    panel.VIEW3D_T_sky_paint,
-    panel.VIEW3D_T_mesh_light_paint,
-    panel.VIEW3D_T_tube_light_paint,
-    panel.VIEW3D_T_flag_paint,
-    panel.VIEW3D_T_light_paint_adjust,
-)
+if bpy is not None:
+    from . import axis, operators, panel, preferences
+    from . import translations
+
+    operators_to_register = (
+        operators.LIGHTPAINTER_OT_Lamp,
+        operators.LIGHTPAINTER_OT_Lamp_Adjust,
+        operators.LIGHTPAINTER_OT_Mesh,
+        operators.LIGHTPAINTER_OT_Tube_Light,
+        operators.LIGHTPAINTER_OT_Sky,
+        operators.LIGHTPAINTER_OT_Sun,
+        operators.LIGHTPAINTER_OT_Flag,
+        operators.LIGHTPAINTER_OT_Lamp_Texture,
+        operators.LIGHTPAINTER_OT_Lamp_Texture_Remove,
+
+        preferences.VIEW3D_AddonPreferences,
+    )
+
+    tools = (
+        panel.VIEW3D_T_light_paint,
+        panel.VIEW3D_T_sun_paint,
+        panel.VIEW3D_T_sky_paint,
+        panel.VIEW3D_T_mesh_light_paint,
+        panel.VIEW3D_T_tube_light_paint,
+        panel.VIEW3D_T_flag_paint,
+        panel.VIEW3D_T_light_paint_adjust,
+    )
 
 REGISTERED_WITH_UI = False
 kmi_added = []
@@ -99,6 +104,8 @@ def register():
     for cls in operators_to_register:
         bpy.utils.register_class(cls)
 
+    operators.mesh_cache.register()
+
     texture_type_items = [
         ('NOISE', 'Noise', ''),
         ('MAGIC', 'Magic', ''),
@@ -178,6 +185,8 @@ def unregister():
         bpy.utils.unregister_class(panel.LIGHTPAINTER_PT_Texture)
         translations.unregister()
 
+    operators.mesh_cache.unregister()
+
     for cls in operators_to_register[::-1]:
         bpy.utils.unregister_class(cls)
 
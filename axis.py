@@ -15,10 +15,11 @@
 #     You should have received a copy of the GNU General Public License
 #     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import math
-
 from mathutils import Vector
 
+from . import solve
+from .stroke import StrokeBuffer
+
 VECTORS = {'X': Vector((1, 0, 0)), 'Y': Vector((0, 1, 0)), 'Z': Vector((0, 0, 1))}
 """List of arbitrary axes and their given vector."""
 RAY_OFFSET = 0.001
@@ -40,33 +41,54 @@ def get_world_axis_normals(axis_val: str, count: int):
 
 
 def prep_stroke(context, vertices: list[Vector], normals: list[Vector], axis: str, offset: float):
-    """Updates vertices and normals to match the artist's chosen axis."""
-    if axis in VECTORS:
-        normals = tuple(VECTORS[axis] for _ in range(len(vertices)))
-    elif axis == 'REFLECT':
-        scene = context.scene
-        camera = scene.camera
+    """Updates vertices and normals to match the artist's chosen axis.
+
+    :return: tuple of (N, 3) arrays of offset vertices, normals and vertices without offset
+    """
+    camera = context.scene.camera
+    camera_origin = None if camera is None else camera.matrix_world.translation
+
+    return solve.prep_stroke(vertices, normals, axis, offset, camera_origin)
+
+
+class PreparedStroke:
+    """Painted strokes with normals resolved for the artist's chosen axis.
 
-        if camera is None:
-            raise ValueError('Set a camera for your scene to use rim lighting!')
+    Normals are only resolved again when the strokes, the axis or the reflecting camera change,
+    so dragging the offset just moves the stroke's vertices along the cached normals.
+    """
 
-        camera_origin = camera.matrix_world.translation
+    def __init__(self):
+        self.version = None
+        self.vertices = None
+        self.normals = None
+        self.axis_key = None
+        self.axis_normals = None
 
-        for idx, vertex, normal in zip(range(len(vertices)), vertices, normals):
-            direction = vertex - camera_origin
-            direction.normalize()
+    def prepare(self, context, strokes: StrokeBuffer, axis: str, offset: float):
+        """Updates vertices and normals to match the artist's chosen axis.
 
-            normals[idx] = reflect_vector(direction, normal)
+        :param context: Blender context, for the scene camera
+        :param strokes: painted strokes
+        :param axis: world axis, 'REFLECT' or 'NORMAL'
+        :param offset: distance to move the vertices along their normals
 
-    orig_vertices = vertices[:]
+        :return: tuple of (N, 3) arrays of offset vertices, normals and vertices without offset
+        """
+        if strokes.version != self.version:
+            self.vertices = strokes.positions
+            self.normals = strokes.normals
+            self.version = strokes.version
+            self.axis_key = None
 
-    if not math.isclose(offset, 0.0):
-        vertices = tuple(
-            v + n * offset
-            for v, n in zip(vertices, normals)
-        )
+        camera_origin = None
+        if axis == 'REFLECT':
+            camera = context.scene.camera
+            camera_origin = None if camera is None else tuple(camera.matrix_world.translation)
 
-    if offset < 0.0:
-        normals = [normal * -1 for normal in normals]
+        axis_key = (axis, camera_origin)
+        if axis_key != self.axis_key:
+            self.axis_normals = solve.resolve_normals(self.vertices, self.normals, axis, camera_origin)
+            self.axis_key = axis_key
 
-    return vertices, normals, orig_vertices
+        return solve.offset_stroke(self.vertices, self.axis_normals, offset)
@@ -145,63 +145,65 @@ AXIS_KEYMAP = tuple(name for name in UNIVERSAL_KEYMAP_NAMES if '_AXIS_' in name)
 VISIBILITY_KEYMAP = tuple(name for name in UNIVERSAL_KEYMAP_NAMES if '_VISIBILITY_' in name)
 
 
-def compare_kmi_to_event(item, event):
-    data = item.type
-    event_data = event.type
-    if item.value != 'ANY':
-        data += item.value
-        event_data += event.value
-    data += str(item.shift * 1 | item.ctrl * 2 | item.alt * 4 | item.oskey * 8)
-    event_data += str(event.shift * 1 | event.ctrl * 2 | event.alt * 4 | event.oskey * 8)
+def get_modifier_bits(item) -> int:
+    """Packs the modifier keys of a keymap item or event into one integer."""
+    return item.shift * 1 | item.ctrl * 2 | item.alt * 4 | item.oskey * 8
 
-    return data == event_data
 
+class KeymapDispatch:
+    """Light Painter commands keyed by the (type, value, modifier bits) of the events that trigger them.
 
-def get_matching_event(event) -> str | None:
-    """Checks if Blender event matches our UNIVERSAL_KEYMAP,
-    returns the matching command name (if none match, return None).
+    The table is compiled from the user keymap on first use, so each event resolves with one dict lookup.
+    It is compiled again after invalidate(), which runs when a tool starts or the keymap preferences are shown.
     """
-    from .preferences import get_lightpainter_kmi
 
-    return next(
-        (
-            item.properties.name.replace(PREFIX, '')
-            for item in get_lightpainter_kmi(bpy.context)
-            if compare_kmi_to_event(item, event)
-        ),
-        None,
-    )
+    def __init__(self):
+        self.table = None
+        self.item_strings = {}
+        self.version = 0
 
+    def invalidate(self):
+        self.table = None
 
-def is_event_command(event, command_name) -> bool:
-    from .preferences import get_lightpainter_kmi
+    def compile(self, context):
+        from .preferences import get_lightpainter_kmi
 
-    if not command_name.startswith(PREFIX):
-        command_name = PREFIX + command_name
+        # items matching any value are stored under every value an event can have
+        event_values = tuple(item.identifier for item in bpy.types.Event.bl_rna.properties['value'].enum_items)
 
-    item = next(
-        (item for item in get_lightpainter_kmi(bpy.context) if item.properties.name == command_name),
-        None,
-    )
+        table = {}
+        item_strings = {}
+        for item in get_lightpainter_kmi(context):
+            command_name = item.properties.name.replace(PREFIX, '')
+            item_strings.setdefault(command_name, item.to_string())
+            modifier_bits = get_modifier_bits(item)
+            for value in (event_values if item.value == 'ANY' else (item.value,)):
+                key = (item.type, value, modifier_bits)
+                table[key] = table.get(key, ()) + (command_name,)
+        self.table = table
+        self.item_strings = item_strings
+        self.version += 1
 
-    if item is None:
-        return False
+    def get_commands(self, event) -> tuple[str, ...]:
+        """Returns the names of the commands an event triggers, without PREFIX, in keymap order."""
+        if self.table is None:
+            self.compile(bpy.context)
+        return self.table.get((event.type, event.value, get_modifier_bits(event)), ())
 
-    return compare_kmi_to_event(item, event)
+    def get_item_string(self, command_name: str) -> str:
+        """Returns the keys of a command as displayed to the user, or an empty string if it isn't bound."""
+        if self.table is None:
+            self.compile(bpy.context)
+        return self.item_strings.get(command_name, '')
 
 
-def get_kmi_str(command_name):
-    from .preferences import get_lightpainter_kmi
+KEYMAP_DISPATCH = KeymapDispatch()
 
-    if not command_name.startswith(PREFIX):
-        command_name = PREFIX + command_name
 
-    item = next(
-        (item for item in get_lightpainter_kmi(bpy.context) if item.properties.name == command_name),
-        None,
-    )
+def get_event_commands(event) -> tuple[str, ...]:
+    """Returns the names of the Light Painter commands an event triggers, without PREFIX."""
+    return KEYMAP_DISPATCH.get_commands(event)
 
-    if item is None:
-        return ''
 
-    return item.to_string()
\ No newline at end of file
+def get_kmi_str(command_name):
+    return KEYMAP_DISPATCH.get_item_string(command_name.replace(PREFIX, ''))
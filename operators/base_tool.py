@@ -16,13 +16,18 @@
 #     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from math import floor, log10
+import time
 
 import bpy
-from bpy_extras import view3d_utils
+import numpy as np
 
 from .. import __package__ as base_package
-from ..keymap import get_kmi_str, is_event_command, get_matching_event, AXIS_KEYMAP, VISIBILITY_KEYMAP, PREFIX
-from .draw import draw_callback_px
+from ..axis import PreparedStroke
+from ..stroke import (DuplicateFilter, IngestPipeline, PendingStroke, RegionView, ScreenIndex, SpacingFilter,
+                      StrokeBuffer, get_region_rays, interpolate_coords)
+from ..keymap import KEYMAP_DISPATCH, get_event_commands, get_kmi_str
+from .draw import StrokeBatch, draw_callback_px, draw_callback_view
+from .paint_target import PaintTargets
 if bpy.app.version >= (4, 1):
     from bpy.app.translations import pgettext_rpt as rpt_
 else:
@@ -37,31 +42,105 @@ PRECISE_INCREMENT_VAL = 0.01
 SNAP_INCREMENT_VAL = 1
 SNAP_PRECISE_INCREMENT_VAL = 0.1
 
-KEYCONFIGS_CACHE = []
+NAV_KEYMAP_NAME = '3D View'
+NAV_INDEX_LIFETIME = 1.0
+"""Seconds before the '3D View' keymaps are read again, picking up keys rebound while a tool runs."""
+WILDCARD_EVENT_TYPES = {'ANY', 'TEXTINPUT', 'TABLET_STYLUS', 'TABLET_ERASER'}
+"""Keymap item types that can match events of other types."""
 
 
-def is_nav_event(keyconfigs: bpy.types.KeyConfig, event: bpy.types.Event) -> bool:
+class NavigationClassifier:
+    """'3D View' keymaps indexed by the event types they bind, so most events are rejected with one dict lookup.
+
+    The '3D View' keymap of each keyconfig is looked up again when keyconfigs are added or removed,
+    or the active keyconfig changes. Every NAV_INDEX_LIFETIME seconds, only the items of those keymaps
+    are read again, and the index is rebuilt if their bindings changed.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.build_time = 0.0
+        self.keymaps = ()
+        self.item_types = None
+        self.keymaps_by_type = {}
+        self.wildcard_keymaps = ()
+
+    def invalidate(self):
+        self.key = None
+
+    def find_keymaps(self, keyconfigs):
+        keymaps = (kc.keymaps.get(NAV_KEYMAP_NAME) for kc in keyconfigs)
+        self.keymaps = tuple(km for km in keymaps if km is not None)
+        self.item_types = None
+
+    def build(self):
+        item_types = tuple(frozenset(item.type for item in km.keymap_items) for km in self.keymaps)
+        if item_types == self.item_types:
+            return
+        self.item_types = item_types
+
+        keymaps_by_type = {}
+        wildcard_keymaps = []
+        for km, km_item_types in zip(self.keymaps, item_types):
+            if not km_item_types.isdisjoint(WILDCARD_EVENT_TYPES):
+                wildcard_keymaps.append(km)
+            for item_type in km_item_types:
+                keymaps_by_type.setdefault(item_type, []).append(km)
+
+        # keymaps that can match any event are tested for every event type
+        for item_type, keymaps in keymaps_by_type.items():
+            keymaps_by_type[item_type] = tuple(keymaps) + tuple(km for km in wildcard_keymaps if km not in keymaps)
+        self.keymaps_by_type = keymaps_by_type
+        self.wildcard_keymaps = tuple(wildcard_keymaps)
+
+    def is_nav_event(self, keyconfigs, event) -> bool:
+        key = (keyconfigs.active.name if keyconfigs.active else '', len(keyconfigs))
+        now = time.monotonic()
+        if key != self.key:
+            self.find_keymaps(keyconfigs)
+            self.key = key
+        if self.item_types is None or now - self.build_time > NAV_INDEX_LIFETIME:
+            self.build()
+            self.build_time = now
+
+        return any(
+            km.keymap_items.match_event(event)
+            for km in self.keymaps_by_type.get(event.type, self.wildcard_keymaps)
+        )
+
+
+NAVIGATION_CLASSIFIER = NavigationClassifier()
+
+
+def is_nav_event(keyconfigs: bpy.types.KeyConfigurations, event: bpy.types.Event) -> bool:
     """Returns True if user event is for 3D viewport navigation, False otherwise.
 
-    :param keyconfigs: Blender keymap configuration.
+    :param keyconfigs: Blender keymap configurations.
     :param event: user event (pressing a key, moving the mouse, etc.).
     """
-    # initialize cache
-    global KEYCONFIGS_CACHE
-    if not KEYCONFIGS_CACHE:
-        KEYCONFIGS_CACHE = [
-            km
-            for kc in keyconfigs
-            for km in kc.keymaps
-            if km is not None and km.name == '3D View'
-        ]
-
-    return any(
-        km.keymap_items.match_event(event)
-        for km in KEYCONFIGS_CACHE
+    return NAVIGATION_CLASSIFIER.is_nav_event(keyconfigs, event)
+
+
+def get_region_view(region, rv3d) -> RegionView:
+    """Snapshots the view of a 3D region, to cast rays from it later."""
+    return RegionView(
+        tuple(map(tuple, rv3d.perspective_matrix)),
+        tuple(map(tuple, rv3d.view_matrix)),
+        rv3d.is_perspective,
+        rv3d.view_perspective == 'CAMERA',
+        region.width,
+        region.height,
     )
 
 
+def get_ingest_pipeline(preferences) -> IngestPipeline:
+    """Builds the stages painted points pass through from the add-on preferences."""
+    stages = [DuplicateFilter()]
+    if preferences.min_world_spacing > 0.0 or preferences.min_screen_spacing > 0.0:
+        stages.append(SpacingFilter(preferences.min_world_spacing, preferences.min_screen_spacing))
+    return IngestPipeline(stages, preferences.simplify_tolerance)
+
+
 def is_in_area(area, mouse_x, mouse_y):
     """Checks if mouse coordinates are within Blender UI area."""
     return (
@@ -80,8 +159,19 @@ class BaseLightPaintTool:
     def __init__(self):
         """Initialize variables to play nicely with pytest usage."""
         self._handle = None
-
-        self.mouse_path = []
+        self._handle_view = None
+
+        self.mouse_path = StrokeBuffer()
+        self.pending_stroke = PendingStroke()
+        self.prepared_stroke = PreparedStroke()
+        self.screen_index = ScreenIndex()
+        self.stroke_batch = StrokeBatch()
+        self.paint_targets = None
+        self.event_commands = ()
+        self.reset_header_text()
+        self.ingest = IngestPipeline()
+        self.stroke_start = 0
+        self.last_paint_coord = None
         self.is_painting = False
         self.is_erasing = False
         self.show_eraser = False
@@ -100,6 +190,8 @@ class BaseLightPaintTool:
 
     def cancel(self, context):
         bpy.types.SpaceView3D.draw_handler_remove(self._handle, 'WINDOW')
+        bpy.types.SpaceView3D.draw_handler_remove(self._handle_view, 'WINDOW')
+        self.paint_targets.free()
         context.window.cursor_set('DEFAULT')
         context.area.header_text_set(None)
         context.workspace.status_text_set_internal(None)
@@ -124,13 +216,11 @@ class BaseLightPaintTool:
         """Callback for extra controls."""
         return False
 
-    def check_axis_event(self, event) -> bool:
+    def check_axis_event(self) -> bool:
         assert hasattr(self, 'axis')
         axis_command = next(
-            (command_name.replace(PREFIX, '')
-             for command_name in AXIS_KEYMAP
-             if is_event_command(event, command_name))
-            , None
+            (command_name for command_name in self.event_commands if command_name.startswith('AXIS_')),
+            None
         )
 
         if axis_command is None:
@@ -141,15 +231,13 @@ class BaseLightPaintTool:
 
         return True
 
-    def check_visibility_event(self, event) -> bool:
-        """Checks if Blender event matches our UNIVERSAL_KEYMAP,
-        returns the matching command name (if none match, return None).
+    def check_visibility_event(self) -> bool:
+        """Toggles a visibility setting if the current event is one of the visibility commands,
+        returns True if it was.
         """
         matching_visibility_event = next(
-            (command_name.replace(PREFIX, '')
-             for command_name in VISIBILITY_KEYMAP
-             if is_event_command(event, command_name))
-            , None
+            (command_name for command_name in self.event_commands if command_name.startswith('VISIBILITY_TOGGLE_')),
+            None
         )
 
         if matching_visibility_event is None:
@@ -188,41 +276,53 @@ class BaseLightPaintTool:
         should_update = False
         self.curr_mouse_pos = coord
 
-        if is_event_command(event, 'PAINT'):
+        if 'PAINT' in self.event_commands:
             self.is_painting = event_value == 'PRESS'
-        elif is_event_command(event, 'ERASE'):
+            self.last_paint_coord = None
+            if not self.is_painting:
+                should_update = self.project_pending_stroke(context)
+                should_update = self.finish_stroke() or should_update
+        elif 'ERASE' in self.event_commands:
             self.is_erasing = event_value == 'PRESS'
             self.show_eraser = self.is_erasing
 
-        if is_event_command(event, 'END_STROKE'):
-            self.mouse_path.append(list())
+        if 'END_STROKE' in self.event_commands:
+            should_update = self.project_pending_stroke(context) or should_update
+            should_update = self.finish_stroke() or should_update
+            self.mouse_path.new_stroke()
+            self.last_paint_coord = None
 
-        if is_event_command(event, 'ERASER_DECREASE'):
+        if 'ERASER_DECREASE' in self.event_commands:
             self.eraser_size -= ERASER_SIZE_RATE
             self.show_eraser = True
-        elif is_event_command(event, 'ERASER_INCREASE'):
+        elif 'ERASER_INCREASE' in self.event_commands:
             self.eraser_size += ERASER_SIZE_RATE
             self.show_eraser = True
 
         if self.is_erasing:
             context.window.cursor_set('ERASER')
-            self.mouse_path = self.erase_from_mouse_path(region, region_x, region_y, rv3d)
-            should_update = True
+            mouse_path = self.erase_from_mouse_path(region, region_x, region_y, rv3d)
+            should_update = mouse_path is not self.mouse_path
+            self.mouse_path = mouse_path
+            self.last_paint_coord = None
+            if should_update:
+                # erased points can't be simplified or spaced against
+                self.ingest.reset()
+                self.stroke_start = len(mouse_path)
         elif self.is_painting:
-            scene = context.scene
-            depsgraph = context.evaluated_depsgraph_get()
-            clip_end = context.space_data.clip_end
-
-            # get the ray from the viewport and mouse
-            view_vector = view3d_utils.region_2d_to_vector_3d(region, rv3d, coord)
-            ray_origin = view3d_utils.region_2d_to_origin_3d(region, rv3d, coord)
-
-            is_hit, hit_location, hit_normal, _, _, _ = scene.ray_cast(depsgraph, ray_origin, view_vector,
-                                                                       distance=clip_end)
-
-            if is_hit:
-                self.mouse_path[-1].append((hit_location, hit_normal))
-                should_update = True
+            # fill the gap since the last event, so fast drags paint as densely as slow ones
+            coords = [coord]
+            spacing = self.preferences.stroke_spacing
+            if spacing > 0.0 and self.last_paint_coord is not None:
+                coords = interpolate_coords(self.last_paint_coord, coord, spacing)
+            self.last_paint_coord = coord
+
+            view = get_region_view(region, rv3d)
+            if self.preferences.deferred_projection:
+                # rays are cast once the stroke ends
+                self.pending_stroke.extend(coords, view)
+            else:
+                should_update = self.add_ray_hits(context, coords, *get_region_rays(coords, view))
 
         result = self.extra_paint_controls(context, event)
         should_update = should_update or result
@@ -233,34 +333,91 @@ class BaseLightPaintTool:
             except ValueError as e:
                 self.report({'ERROR'}, str(e))
 
+    def project_pending_stroke(self, context) -> bool:
+        """Casts the rays of a deferred stroke in one batch, adding the hits to the mouse path.
+
+        :return: True if any points were added
+        """
+        if len(self.pending_stroke) == 0:
+            return False
+
+        coords = np.array(self.pending_stroke.coords, dtype=np.float64)
+        origins, directions = self.pending_stroke.get_rays()
+        self.pending_stroke.clear()
+        return self.add_ray_hits(context, coords, origins, directions)
+
+    def add_ray_hits(self, context, coords, origins: np.ndarray, directions: np.ndarray) -> bool:
+        """Casts paint rays in one batch, adding the points they hit and the ingest stages keep to the mouse path.
+
+        :param context: Blender context
+        :param coords: (N, 2) region coordinates the rays were cast from
+        :param origins: (N, 3) array of ray origins in world space
+        :param directions: (N, 3) array of normalized ray directions in world space
+        :return: True if any points were added
+        """
+        is_hit, hit_locations, hit_normals = self.paint_targets.ray_cast_many(context, origins, directions,
+                                                                              context.space_data.clip_end)
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)[is_hit]
+        hit_locations, hit_normals = hit_locations[is_hit], hit_normals[is_hit]
+
+        keep = self.ingest.process(hit_locations, hit_normals, coords)
+        if not keep.any():
+            return False
+
+        self.mouse_path.extend(hit_locations[keep], hit_normals[keep])
+        return True
+
+    def finish_stroke(self) -> bool:
+        """Runs when painting stops or a new stroke starts, simplifying the points just painted.
+
+        :return: True if any points were removed
+        """
+        is_simplified = self.ingest.finish(self.mouse_path, self.stroke_start)
+        self.stroke_start = len(self.mouse_path)
+        return is_simplified
+
     def erase_from_mouse_path(self, region, region_x, region_y, rv3d):
+        # only points in the grid cells under the eraser are tested
+        self.screen_index.update(self.mouse_path, rv3d.perspective_matrix, region.width, region.height)
+        erased = self.screen_index.query((region_x, region_y), self.eraser_size)
+        if len(erased) == 0:
+            return self.mouse_path
+
         # break paths into potentially new chunks and remove edges erased
-        new_mouse_path = [[]]
-        eraser_size_squared = self.eraser_size * self.eraser_size
-        for idx, path in enumerate(self.mouse_path):
-            for coord, normal in path:
-                coord_screen_x, coord_screen_y = view3d_utils.location_3d_to_region_2d(region, rv3d, coord)
-                dist_x = coord_screen_x - region_x
-                dist_y = coord_screen_y - region_y
-                distance = dist_x * dist_x + dist_y * dist_y
-                if distance > eraser_size_squared:
-                    new_mouse_path[-1].append((coord, normal))
-                elif len(new_mouse_path[-1]) != 0:
-                    new_mouse_path.append(list())
-
-            # preserve original breaks between paths
-            if len(new_mouse_path[-1]) != 0 and idx != (len(self.mouse_path) - 1):
-                new_mouse_path.append(list())
+        keep = np.ones(len(self.mouse_path), dtype=bool)
+        keep[erased] = False
+        new_mouse_path = self.mouse_path.filter(keep)
+        self.screen_index.filter(keep, new_mouse_path)
         return new_mouse_path
 
+    def reset_header_text(self):
+        self.is_header_dirty = True
+        self.header_key = None
+        self.header_text = ''
+        self.shown_header_text = None
+        self.shown_status_text = None
+        self.overlay_layout = None
+
+    def get_cached_header_text(self, context) -> str:
+        """Returns the header text, only building it again when the tool's state, keymap or language changed."""
+        header_key = (KEYMAP_DISPATCH.version, context.preferences.view.language)
+        if self.is_header_dirty or header_key != self.header_key:
+            self.header_text = self.get_header_text()
+            # building the text may compile the keymap
+            self.header_key = (KEYMAP_DISPATCH.version, header_key[1])
+            self.is_header_dirty = False
+        return self.header_text
+
     def update_keymap_text(self, context):
         preferences = self.preferences
         if preferences.keymap_header or preferences.keymap_status_bar:
-            header_text = self.get_header_text()
-            if preferences.keymap_header:
+            header_text = self.get_cached_header_text(context)
+            if preferences.keymap_header and header_text != self.shown_header_text:
                 context.area.header_text_set(header_text)
-            if preferences.keymap_status_bar:
+                self.shown_header_text = header_text
+            if preferences.keymap_status_bar and header_text != self.shown_status_text:
                 context.workspace.status_text_set_internal(header_text)
+                self.shown_status_text = header_text
 
     def modal(self, context, event):
         modal_status = 'RUNNING_MODAL'
@@ -279,20 +436,33 @@ class BaseLightPaintTool:
 
         context.window.cursor_set(cursor_type)
 
-        matching_event = get_matching_event(event)
+        # every check below branches on the commands resolved here
+        self.event_commands = get_event_commands(event)
+        matching_event = next(iter(self.event_commands), None)
         if matching_event is None and is_nav_event(context.window_manager.keyconfigs, event):
             modal_status = 'PASS_THROUGH'
 
         if not self.drag_attr:
-            if is_event_command(event, 'CANCEL'):
+            if 'CANCEL' in self.event_commands:
                 modal_status = 'CANCELLED'
-            elif is_event_command(event, 'FINISH'):
+            elif 'FINISH' in self.event_commands:
                 modal_status = 'FINISHED'
+                # confirming while still painting ends the stroke like releasing the paint button does
+                should_update = self.project_pending_stroke(context)
+                should_update = self.finish_stroke() or should_update
+                if should_update:
+                    try:
+                        self.update_light(context)
+                    except ValueError as e:
+                        self.report({'ERROR'}, str(e))
             elif modal_status == 'RUNNING_MODAL':
                 self.paint_controls(context, event)
         else:
             self.handle_drag_event(context, event, matching_event)
 
+        # the header only shows toggles and drag values, which only change on commands or while dragging
+        if self.event_commands or self.drag_attr:
+            self.is_header_dirty = True
         self.update_keymap_text(context)
 
         if modal_status in {'CANCELLED', 'FINISHED'}:
@@ -347,13 +517,30 @@ class BaseLightPaintTool:
             args = (self, context)
             self.area = context.area
             self._handle = bpy.types.SpaceView3D.draw_handler_add(draw_callback_px, args, 'WINDOW', 'POST_PIXEL')
-
-            self.mouse_path = [[]]
+            # strokes are drawn in world space from a cached batch, see draw_callback_view
+            self._handle_view = bpy.types.SpaceView3D.draw_handler_add(draw_callback_view, args, 'WINDOW',
+                                                                       'POST_VIEW')
+            self.stroke_batch = StrokeBatch()
+
+            # pick up any keymap changes made since the last tool ran
+            KEYMAP_DISPATCH.invalidate()
+            NAVIGATION_CLASSIFIER.invalidate()
+            self.event_commands = ()
+            self.reset_header_text()
+
+            self.mouse_path = StrokeBuffer()
+            self.pending_stroke = PendingStroke()
+            self.prepared_stroke = PreparedStroke()
+            self.screen_index = ScreenIndex()
+            self.stroke_start = 0
+            self.last_paint_coord = None
             self.is_erasing = False
             self.curr_mouse_pos = None
             self.eraser_size = 50
 
             self.preferences = context.preferences.addons[base_package].preferences
+            self.paint_targets = PaintTargets(context, self.preferences.paint_target)
+            self.ingest = get_ingest_pipeline(self.preferences)
 
             # force set current tool
             bpy.ops.wm.tool_set_by_id(name=self.tool_id)
@@ -378,12 +565,9 @@ class BaseLightPaintTool:
         """Run by Python API. Mainly used for testing."""
         if len(self.str_mouse_path):
             import ast
-            from mathutils import Vector
             stroke_list = ast.literal_eval(self.str_mouse_path)
-            self.mouse_path = [
-                [(Vector(coord), Vector(normal)) for coord, normal in stroke]
-                for stroke in stroke_list
-            ]
+            self.mouse_path = StrokeBuffer.from_strokes(stroke_list)
+        self.prepared_stroke = PreparedStroke()
 
         try:
             self.startup_callback(context)
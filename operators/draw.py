@@ -1,11 +1,13 @@
 import blf
 from bpy_extras import view3d_utils
 import gpu
+import numpy as np
 from gpu_extras.batch import batch_for_shader
 from gpu_extras.presets import draw_circle_2d
 from mathutils import Vector
 
 from .. import __package__ as base_package
+from ..stroke import StrokeLOD
 
 DRAW_LINE_SIZE = 5.0
 ERASE_CIRCLE_OUTLINE_SIZE = 2.0
@@ -13,6 +15,7 @@ ERASE_CIRCLE_OUTLINE_SIZE = 2.0
 PAINT_COLOR = (0.9, 0.9, 0.0, 0.5)
 SEMI_PAINT_COLOR = (0.9, 0.9, 0.0, 0.25)
 ERASE_COLOR = (1.0, 1.0, 1.0, 1.0)
+ERASE_HIGHLIGHT_COLOR = (1.0, 0.2, 0.2, 0.8)
 
 CULLING_DOT_PRODUCT_FACTOR = 0.1
 
@@ -29,6 +32,41 @@ except SystemError:
     shader = None
 
 
+def get_overlay_layout(text: str, region_width: int, region_height: int, font_size: float,
+                       anchor: str) -> list[tuple[float, float, str]]:
+    """Lays out the keymap overlay, one line per comma-separated command, aligned on their colons.
+
+    :return: list of (x, y, line) to draw, empty if the region is too small
+    """
+    line_spacing = font_size + LINE_SPACE_MARGIN
+    text_to_display = text.split(', ')
+    required_height = len(text_to_display) * line_spacing
+    max_line_length = max(map(len, text_to_display))
+    max_to_colon_line_length = max([line.index(': ') for line in text_to_display])
+    required_width = max_line_length * font_size
+
+    if region_width < required_width or region_height < required_height:
+        return []
+
+    if anchor == 'LEFT':
+        x_position = MARGIN
+    elif anchor == 'CENTER':
+        x_position = (region_width / 2) - (required_width / 2)
+    else:
+        x_position = region_width - required_width - MARGIN
+
+    layout = []
+    for idx, line in enumerate(text_to_display[::-1]):
+        # center on colon
+        colon_index = line.index(': ')
+        if colon_index != -1:
+            line = line[:colon_index].rjust(max_to_colon_line_length) + line[colon_index:]
+
+        offset = idx * line_spacing
+        layout.append((x_position, MARGIN + offset, line))
+    return layout
+
+
 def draw_text_overlay(self, context):
     """Draws keymap overlay text"""
     if self.area != context.area:
@@ -42,27 +80,18 @@ def draw_text_overlay(self, context):
     addon_preferences = preferences.addons[base_package].preferences
     DPI = preferences.system.dpi * preferences.system.pixel_size / 72
     FONT_SIZE = DPI * addon_preferences.overlay_font_scale
-    LINE_SPACING = FONT_SIZE + LINE_SPACE_MARGIN
-
-    text_to_display = self.get_header_text().split(', ')
-    required_height = len(text_to_display) * LINE_SPACING
-    max_line_length = max(map(len, text_to_display))
-    max_to_colon_line_length = max([line.index(': ') for line in text_to_display])
-    required_width = max_line_length * FONT_SIZE
 
-    if region.width < required_width or region.height < required_height:
+    # the layout is only computed again when the text or the region changes
+    layout_key = (self.get_cached_header_text(context), region.width, region.height, FONT_SIZE,
+                  addon_preferences.overlay_position)
+    if self.overlay_layout is None or self.overlay_layout[0] != layout_key:
+        self.overlay_layout = (layout_key, get_overlay_layout(*layout_key))
+    layout = self.overlay_layout[1]
+    if not layout:
         return
 
     blf.size(FONT_ID, FONT_SIZE)
 
-    anchor = addon_preferences.overlay_position
-    if anchor == 'LEFT':
-        x_position = MARGIN
-    elif anchor == 'CENTER':
-        x_position = (region.width / 2) - (required_width / 2)
-    else:
-        x_position = region.width - required_width - MARGIN
-
     try:
         FONT_COLOR = preferences.themes[0].user_interface.wcol_text.text
     except AttributeError as e:
@@ -72,19 +101,60 @@ def draw_text_overlay(self, context):
     blf.color(FONT_ID, *FONT_COLOR, 1.0)
     blf.shadow(FONT_ID, 6, 0.0, 0.0, 0.0, 1.0)
 
-    for idx, line in enumerate(text_to_display[::-1]):
-        # center on colon
-        colon_index = line.index(': ')
-        if colon_index != -1:
-            line = line[:colon_index].rjust(max_to_colon_line_length) + line[colon_index:]
-
-        offset = idx * LINE_SPACING
-        blf.position(FONT_ID, x_position, MARGIN + offset, 0)
+    for x_position, y_position, line in layout:
+        blf.position(FONT_ID, x_position, y_position, 0)
         blf.draw(FONT_ID, line)
 
 
+class StrokeBatch:
+    """GPU line batches of all painted strokes in world space, one per level of detail.
+
+    Levels are only built again when the strokes change, and each level's batch is built on first use.
+    """
+
+    def __init__(self):
+        self.lod = StrokeLOD()
+        self.batches = {}
+
+    def get(self, strokes, perspective_matrix, width: int):
+        """Returns the batch of the level of detail for a view, or None if there are no segments to draw."""
+        if self.lod.update(strokes):
+            self.batches = {}
+
+        level = self.lod.select_level(perspective_matrix, width)
+        if level not in self.batches:
+            segments = self.lod.levels[level] if self.lod.levels else ()
+            self.batches[level] = None
+            if len(segments) != 0:
+                self.batches[level] = batch_for_shader(shader, 'LINES', {'pos': strokes.positions},
+                                                       indices=segments.astype(np.int32))
+        return self.batches[level]
+
+
+def draw_callback_view(self, context):
+    """Draws painted strokes in world space, so the GPU projects them however the view moves."""
+    # the batch is cached for one view, other viewports would replace it every redraw
+    if self.area != context.area:
+        return
+
+    batch = self.stroke_batch.get(self.mouse_path, context.region_data.perspective_matrix, context.region.width)
+    if batch is None:
+        return
+
+    gpu.state.blend_set('ALPHA')
+    gpu.state.line_width_set(DRAW_LINE_SIZE)
+    gpu.state.depth_test_set('NONE')
+
+    shader.uniform_float('color', PAINT_COLOR)
+    batch.draw(shader)
+
+    # restore opengl defaults
+    gpu.state.line_width_set(1.0)
+    gpu.state.blend_set('NONE')
+
+
 def draw_callback_px(self, context):
-    """Draws light painting lines and calls for keymap overlay."""
+    """Draws the stroke being painted, the eraser, and calls for keymap overlay."""
     region = context.region
     rv3d = context.region_data
 
@@ -92,23 +162,36 @@ def draw_callback_px(self, context):
     gpu.state.blend_set('ALPHA')
     gpu.state.line_width_set(DRAW_LINE_SIZE)
 
-    paths_3d = [[coord for coord, _ in path] for path in self.mouse_path]
+    mouse_path = self.mouse_path
 
-    # draw each path
-    for path in paths_3d:
-        path_2d = [view3d_utils.location_3d_to_region_2d(region, rv3d, coord) for coord in path]
-        batch = batch_for_shader(shader, 'LINE_STRIP', {'pos': path_2d})
-        shader.uniform_float('color', PAINT_COLOR)
+    # deferred strokes are drawn as painted, until their rays are cast
+    pending_stroke = self.pending_stroke
+    if len(pending_stroke) > 1:
+        batch = batch_for_shader(shader, 'LINE_STRIP', {'pos': pending_stroke.coords})
+        shader.uniform_float('color', SEMI_PAINT_COLOR)
         batch.draw(shader)
 
-    # print(paths_3d)
-    if len(paths_3d) > 0 and len(paths_3d[-1]) > 0:
-        last_point = view3d_utils.location_3d_to_region_2d(region, rv3d, paths_3d[-1][-1])
+    last_point = None
+    if len(pending_stroke) > 0:
+        last_point = pending_stroke.coords[-1]
+    elif mouse_path.last_stroke_length > 0:
+        last_point = view3d_utils.location_3d_to_region_2d(region, rv3d, mouse_path.positions[-1])
+    if last_point is not None:
         batch = batch_for_shader(shader, 'LINE_STRIP', {'pos': [last_point, self.curr_mouse_pos]})
         shader.uniform_float('color', SEMI_PAINT_COLOR)
         batch.draw(shader)
 
-    if self.show_eraser:
+    if self.show_eraser and self.area == context.area:
+        # highlight points that would be erased, the index is only kept for the painted viewport
+        self.screen_index.update(mouse_path, rv3d.perspective_matrix, region.width, region.height)
+        erased = self.screen_index.query(self.curr_mouse_pos, self.eraser_size)
+        if len(erased) != 0:
+            gpu.state.point_size_set(DRAW_LINE_SIZE)
+            batch = batch_for_shader(shader, 'POINTS', {'pos': self.screen_index.coords[erased].tolist()})
+            shader.uniform_float('color', ERASE_HIGHLIGHT_COLOR)
+            batch.draw(shader)
+            gpu.state.point_size_set(1.0)
+
         gpu.state.line_width_set(ERASE_CIRCLE_OUTLINE_SIZE)
         draw_circle_2d(Vector(self.curr_mouse_pos), ERASE_COLOR, self.eraser_size)
 
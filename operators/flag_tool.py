@@ -21,9 +21,10 @@ import bpy
 from mathutils import Vector
 
 from .base_tool import BaseLightPaintTool
+from .paint_target import FLAG_DATA_NAME
 from .prop_util import convert_val_to_unit_str, get_drag_mode_header
 from .visibility import VisibilitySettings
-from ..keymap import get_kmi_str, is_event_command
+from ..keymap import get_kmi_str
 if bpy.app.version >= (4, 1):
     from bpy.app.translations import pgettext_rpt as rpt_
 else:
@@ -31,8 +32,6 @@ else:
 
 IS_BPY_V3 = bpy.app.version < (4, 0, 0)
 
-FLAG_DATA_NAME = 'LightPaint_Flag'
-
 
 # active object is counted twice
 def get_selected_by_type(context, obj_type: str) -> tuple:
@@ -175,16 +174,16 @@ class LIGHTPAINTER_OT_Flag(bpy.types.Operator, BaseLightPaintTool, VisibilitySet
         mouse_x = event.mouse_x
 
         # offset is for sun lamps, size is factor for the rest.
-        if is_event_command(event, 'OFFSET_MODE'):
+        if 'OFFSET_MODE' in self.event_commands:
             self.set_drag_attr('offset', mouse_x)
 
-        elif is_event_command(event, 'SIZE_MODE'):
+        elif 'SIZE_MODE' in self.event_commands:
             self.set_drag_attr('factor', mouse_x, drag_increment=0.05, drag_precise_increment=0.01)
 
-        elif is_event_command(event, 'POWER_MODE'):
+        elif 'POWER_MODE' in self.event_commands:
             self.set_drag_attr('opacity', mouse_x, drag_increment=0.05, drag_precise_increment=0.01)
        
-        elif self.check_visibility_event(event):
+        elif self.check_visibility_event():
             pass  # if True, event is handled
 
         else:
@@ -269,7 +268,7 @@ class LIGHTPAINTER_OT_Flag(bpy.types.Operator, BaseLightPaintTool, VisibilitySet
             self.report({'ERROR_INVALID_INPUT'}, 'Select lamp objects to be flagged for shadows!')
             return {'CANCELLED'}
 
-        vertices = [coord for stroke in self.mouse_path for coord, normal in stroke]
+        vertices = [Vector(coord) for coord in self.mouse_path.positions]
 
         # skip if no strokes are currently drawn
         if len(vertices) == 0:
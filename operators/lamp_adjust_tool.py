@@ -21,10 +21,13 @@ import bpy
 from mathutils import Vector
 
 from .base_tool import BaseLightPaintTool
-from ..keymap import get_kmi_str, is_event_command
-from .lamp_util import get_average_normal, get_occlusion_based_normal, LampUtils, PI_OVER_2
-from .prop_util import axis_prop, convert_val_to_unit_str, get_drag_mode_header
-from ..axis import prep_stroke
+from ..keymap import get_kmi_str
+from .lamp_util import get_average_normal, get_occlusion_based_normal, get_visibility_cache, LampUtils, PI_OVER_2
+from .prop_util import (
+    axis_prop, convert_val_to_unit_str, get_drag_mode_header, max_points_prop, occlusion_backend_prop,
+    ray_budget_prop
+)
+from ..solve import get_sun_rotation
 if bpy.app.version >= (4, 1):
     from bpy.app.translations import pgettext_rpt as rpt_
 else:
@@ -52,21 +55,9 @@ class LIGHTPAINTER_OT_Lamp_Adjust(bpy.types.Operator, BaseLightPaintTool, LampUt
         default='OCCLUSION'
     )
 
-    longitude_samples: bpy.props.IntProperty(
-        name='Azimuth Samples',
-        description='Samples of normals around the azimuth. '
-                    'Increasing samples improves precision at the cost of processing time',
-        min=4,
-        default=6,
-    )
+    ray_budget: ray_budget_prop()
 
-    latitude_samples: bpy.props.IntProperty(
-        name='Elevation Samples',
-        description='Samples of normals from the horizon to the maximum elevation. '
-                    'Increasing samples improves precision at the cost of processing time',
-        min=3,
-        default=6,
-    )
+    max_points: max_points_prop()
 
     elevation_clamp: bpy.props.FloatProperty(
         name='Max Sun Elevation',
@@ -79,6 +70,8 @@ class LIGHTPAINTER_OT_Lamp_Adjust(bpy.types.Operator, BaseLightPaintTool, LampUt
         subtype='ANGLE'
     )
 
+    occlusion_backend: occlusion_backend_prop()
+
     angle: bpy.props.FloatProperty(
         name='Angle',
         description='Angular diameter of the Sun as seen from the Earth',
@@ -113,8 +106,9 @@ class LIGHTPAINTER_OT_Lamp_Adjust(bpy.types.Operator, BaseLightPaintTool, LampUt
 
             col = layout.column()
             col.active = self.normal_method == 'OCCLUSION'
-            col.prop(self, 'longitude_samples')
-            col.prop(self, 'latitude_samples')
+            col.prop(self, 'ray_budget')
+            col.prop(self, 'max_points')
+            col.prop(self, 'occlusion_backend')
             layout.prop(self, 'elevation_clamp', slider=True)
 
             layout.separator()
@@ -166,22 +160,22 @@ class LIGHTPAINTER_OT_Lamp_Adjust(bpy.types.Operator, BaseLightPaintTool, LampUt
 
         if self.normal_method == 'OCCLUSION':
             try:
+                self.visibility_cache = get_visibility_cache(context, self.occlusion_backend,
+                                                             self.visibility_cache)
                 sun_normal = get_occlusion_based_normal(
                     context, vertices, avg_normal,
-                    self.elevation_clamp, self.latitude_samples, self.longitude_samples
+                    self.elevation_clamp, self.ray_budget,
+                    cache=self.visibility_cache, max_points=self.max_points
                 )
             except ValueError:
                 self.report({'ERROR'}, 'No valid directions found '
-                                       '(add more samples or increase the elevation clamp!), using average normal')
+                                       '(increase the ray budget or the elevation clamp!), using average normal')
                 sun_normal = Vector(avg_normal)
         else:
             sun_normal = Vector(avg_normal)
 
-        sun_normal.negate()
-
         # Sun only rotates, no location change
-        rotation = Vector((0.0, 0.0, -1.0)).rotation_difference(sun_normal).to_euler()
-        lamp.rotation_euler = rotation
+        lamp.rotation_euler = get_sun_rotation(sun_normal)
 
         # set light data properties
         lamp.data.energy = self.sun_power
@@ -227,20 +221,20 @@ class LIGHTPAINTER_OT_Lamp_Adjust(bpy.types.Operator, BaseLightPaintTool, LampUt
     def extra_paint_controls(self, context, event):
         mouse_x = event.mouse_x
 
-        if is_event_command(event, 'OFFSET_MODE'):
+        if 'OFFSET_MODE' in self.event_commands:
             self.set_drag_attr('offset', mouse_x)
 
-        elif is_event_command(event, 'SIZE_MODE') and context.active_object.data.type != 'AREA':
+        elif 'SIZE_MODE' in self.event_commands and context.active_object.data.type != 'AREA':
             self.set_drag_attr('radius', mouse_x, drag_increment=0.01, drag_precise_increment=0.001)
 
-        elif is_event_command(event, 'POWER_MODE'):
+        elif 'POWER_MODE' in self.event_commands:
             self.set_drag_attr('power', mouse_x, drag_increment=10, drag_precise_increment=1)
-        elif is_event_command(event, 'RELATIVE_POWER_TOGGLE'):
+        elif 'RELATIVE_POWER_TOGGLE' in self.event_commands:
             self.is_power_relative = not self.is_power_relative
 
-        elif self.check_axis_event(event):
+        elif self.check_axis_event():
             pass  # if True, event is handled
-        elif self.check_visibility_event(event):
+        elif self.check_visibility_event():
             pass  # if True, event is handled
 
         else:
@@ -249,15 +243,12 @@ class LIGHTPAINTER_OT_Lamp_Adjust(bpy.types.Operator, BaseLightPaintTool, LampUt
         return True
 
     def update_light(self, context):
-        stroke_vertices = [coord for stroke in self.mouse_path for coord, normal in stroke]
-        stroke_normals = [normal for stroke in self.mouse_path for coord, normal in stroke]
-        vertices, normals, orig_vertices = prep_stroke(
-            context, stroke_vertices, stroke_normals,
-            self.axis, self.offset
+        vertices, normals, orig_vertices = self.prepared_stroke.prepare(
+            context, self.mouse_path, self.axis, self.offset
         )
 
         # skip if no strokes are currently drawn
-        if len(stroke_vertices) == 0:
+        if len(vertices) == 0:
             return {'CANCELLED'}
 
         lamp = context.active_object
@@ -312,6 +303,9 @@ class LIGHTPAINTER_OT_Lamp_Adjust(bpy.types.Operator, BaseLightPaintTool, LampUt
 
         return super().invoke(context, event)
 
+    def startup_callback(self, context):
+        self.visibility_cache = None
+
     def cancel_callback(self, context):
         """Resets lamp properties."""
         lamp = context.active_object
@@ -20,8 +20,7 @@ import bpy
 from .base_tool import BaseLightPaintTool
 from .lamp_util import LampUtils
 from .prop_util import axis_prop, convert_val_to_unit_str, get_drag_mode_header
-from ..axis import prep_stroke
-from ..keymap import get_kmi_str, is_event_command
+from ..keymap import get_kmi_str
 if bpy.app.version >= (4, 1):
     from bpy.app.translations import pgettext_rpt as rpt_
 else:
@@ -123,24 +122,24 @@ class LIGHTPAINTER_OT_Lamp(bpy.types.Operator, BaseLightPaintTool, LampUtils):
     def extra_paint_controls(self, context, event):
         mouse_x = event.mouse_x
 
-        if is_event_command(event, 'TYPE_TOGGLE'):
+        if 'TYPE_TOGGLE' in self.event_commands:
             next_index = (LAMP_TYPES_ORDER.index(self.lamp_type) + 1) % len(LAMP_TYPES_ORDER)
             self.lamp_type = LAMP_TYPES_ORDER[next_index]
 
-        elif is_event_command(event, 'OFFSET_MODE'):
+        elif 'OFFSET_MODE' in self.event_commands:
             self.set_drag_attr('offset', mouse_x)
 
-        elif is_event_command(event, 'SIZE_MODE') and self.lamp_type != 'AREA':
+        elif 'SIZE_MODE' in self.event_commands and self.lamp_type != 'AREA':
             self.set_drag_attr('radius', mouse_x, drag_increment=0.01, drag_precise_increment=0.001)
 
-        elif is_event_command(event, 'POWER_MODE'):
+        elif 'POWER_MODE' in self.event_commands:
             self.set_drag_attr('power', mouse_x, drag_increment=10, drag_precise_increment=1)
-        elif is_event_command(event, 'RELATIVE_POWER_TOGGLE'):
+        elif 'RELATIVE_POWER_TOGGLE' in self.event_commands:
             self.is_power_relative = not self.is_power_relative
 
-        elif self.check_axis_event(event):
+        elif self.check_axis_event():
             pass  # if True, event is handled
-        elif self.check_visibility_event(event):
+        elif self.check_visibility_event():
             pass  # if True, event is handled
 
         else:
@@ -149,15 +148,12 @@ class LIGHTPAINTER_OT_Lamp(bpy.types.Operator, BaseLightPaintTool, LampUtils):
         return True
 
     def update_light(self, context):
-        stroke_vertices = [coord for stroke in self.mouse_path for coord, normal in stroke]
-        stroke_normals = [normal for stroke in self.mouse_path for coord, normal in stroke]
-        vertices, normals, orig_vertices = prep_stroke(
-            context, stroke_vertices, stroke_normals,
-            self.axis, self.offset
+        vertices, normals, orig_vertices = self.prepared_stroke.prepare(
+            context, self.mouse_path, self.axis, self.offset
         )
 
         # skip if no strokes are currently drawn
-        if len(stroke_vertices) == 0:
+        if len(vertices) == 0:
             return {'CANCELLED'}
 
         lamp_type = self.lamp_type
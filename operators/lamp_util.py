@@ -1,156 +1,369 @@
 import bpy
 import math
-from math import cos, pi, sin
-from mathutils import Matrix, Vector
-from mathutils.geometry import box_fit_2d
+from math import cos, pi, sin, sqrt
+from mathutils import Vector
 import numpy as np
 from typing import Iterable
 
+from .occlusion import get_occlusion_engine, SceneOcclusion, VisibilityCache
 from .prop_util import offset_prop
-from .visibility import VisibilitySettings
+from .visibility import set_visibility, VisibilitySettings
+from ..solve import (
+    average_normal, calc_power, get_area_placement, get_box, get_point_placement, get_spot_placement,
+    LampPlacements
+)
 
-EPSILON = 0.01
 PI_OVER_2 = pi / 2
+ELEVATION_TOLERANCE = 1e-6
+
+GOLDEN_ANGLE = pi * (3 - sqrt(5))
+REFINE_COUNT = 3
+"""Number of best ranked directions to refine around, per refinement step."""
+REFINE_RING_SIZE = 6
+"""Number of directions tested around each refined direction."""
+MIN_REFINE_ANGLE = 0.002
+"""Smallest angle (in radians) between a refined direction and its parent."""
+COARSE_BUDGET_FRACTION = 0.5
+"""Share of the ray budget spent on evenly spaced directions, before refining around the best ones."""
+AREA_SAMPLE_COUNT = 1024
+"""Number of hemisphere directions used to measure the solid angle of the valid directions."""
+CACHED_DIRECTIONS_PER_RAY = 4
+"""Number of sampled directions the visibility cache keeps per direction of the ray budget."""
+MIN_VOXEL_SIZE = 1e-6
+"""Smallest voxel size when grouping stroke points for occlusion testing."""
 
-NORMAL_ERROR = 'Average of normals results in a zero vector - unable to calculate average direction!'
 
+def get_average_normal(normals: Iterable[Vector]) -> Vector:
+    """Calculates average normal. Handles zero vector edge case as an error.
+
+    :param normals: list of normal vectors
+    :return: single normalized Vector representing the average
+    """
+    return Vector(average_normal(normals))
+
+
+def add_placed_lamps(collection, placements: LampPlacements, lamp_type: str, name: str = 'Light',
+                     shape='RECTANGLE', spread=pi, radius=0.1, spot_blend=0.15, color=(1.0, 1.0, 1.0),
+                     visibility=(True, True, True, True)) -> list:
+    """Adds a lamp for each placement, e.g. from `solve.get_lamp_placements`, without calling operators.
+
+    Lamps get the same settings as the lamp tool gives them. Each setting applies to all lamps or has one per lamp.
+
+    :param collection: collection to link the lamps to
+    :param placements: lamp placements
+    :param lamp_type: 'POINT', 'SPOT' or 'AREA'
+    :param name: name of the lamp objects and their data
+    :param shape: area lamp shape
+    :param spread: area lamp beam spread, in radians
+    :param radius: point and spot lamp radius
+    :param spot_blend: spot lamp beam blend
+    :param color: lamp color
+    :param visibility: whether lamps are visible to camera, diffuse, specular and volume rays
+    :return: list of the new lamp objects
+    """
+    lamp_count = len(placements.location)
+    shapes = np.broadcast_to(np.asarray(shape), (lamp_count,))
+    spreads = np.broadcast_to(np.asarray(spread, dtype=np.float64), (lamp_count,))
+    radii = np.broadcast_to(np.asarray(radius, dtype=np.float64), (lamp_count,))
+    spot_blends = np.broadcast_to(np.asarray(spot_blend, dtype=np.float64), (lamp_count,))
+    colors = np.broadcast_to(np.asarray(color, dtype=np.float64), (lamp_count, 3))
+    visibilities = np.broadcast_to(np.asarray(visibility, dtype=bool), (lamp_count, 4))
+
+    lamps = []
+    for index, (location, rotation, size, spot_size, power) in enumerate(zip(*placements)):
+        lamp_data = bpy.data.lights.new(name, lamp_type)
+        lamp_data.energy = power
+        lamp_data.color = colors[index]
+        if lamp_type == 'AREA':
+            lamp_data.shape = str(shapes[index])
+            lamp_data.spread = spreads[index]
+            lamp_data.size = size[0]
+            if lamp_data.shape in {'RECTANGLE', 'ELLIPSE'}:
+                lamp_data.size_y = size[1]
+        else:
+            lamp_data.shadow_soft_size = radii[index]
+            if lamp_type == 'SPOT':
+                lamp_data.spot_size = spot_size
+                lamp_data.spot_blend = spot_blends[index]
+
+        lamp = bpy.data.objects.new(name, lamp_data)
+        lamp.location = location
+        lamp.rotation_euler = rotation
+        collection.objects.link(lamp)
+        set_visibility(lamp, *visibilities[index].tolist())
+        lamps.append(lamp)
 
-def calc_power(power: float, distance: float) -> float:
-    """Calculates relative light power based on inverse square law.
-    relative power = initial power * squared distance
+    return lamps
 
-    :param power: light value at 1m.
-    :param distance: distance from the light to the target object.
-    :return: light power relative to distance
+
+def calc_rank(dot_product: float, count: int) -> float:
+    """Calculate the "rank" of an occlusion ray test.
+
+    :param dot_product: dot product between the current vector and the ideal normal
+    :param count: number of points that can "see" in that direction
+    :return: a rank for comparison, higher is better
     """
-    return power * (distance * distance)
+    return (dot_product + 1) * count
 
 
-def get_average_normal(normals: Iterable[Vector]) -> Vector:
-    """Calculates average normal. Handles zero vector edge case as an error.
+def get_hemisphere_directions(count: int) -> np.ndarray:
+    """Evenly distributes directions over the upper hemisphere, using a Fibonacci lattice.
 
-    :param normals: list of normal vectors
-    :return: single normalized Vector representing the average
+    Only used to estimate how much of the hemisphere lies within the elevation clamp; occlusion
+    is tested and cached on the lattices from get_lattice_directions and snap_to_lattice.
+
+    :param count: number of directions
+    :return: (count, 3) array of normalized directions
     """
-    avg_normal = sum(normals, start=Vector())
-    avg_normal.normalize()
-    if avg_normal == Vector((0, 0, 0)):
-        raise ValueError(NORMAL_ERROR)
+    indices = np.arange(count) + 0.5
+    z = indices / count
+    radius = np.sqrt(1.0 - z * z)
+    azimuth = indices * GOLDEN_ANGLE
+    return np.stack((radius * np.sin(azimuth), radius * np.cos(azimuth), z), axis=-1)
+
+
+def get_lattice_step(level: int) -> float:
+    """Returns the angle between neighbouring directions of a lattice level, in radians."""
+    return PI_OVER_2 / 2 ** level
 
-    return avg_normal
 
+def get_lattice_points(rings: np.ndarray, indices: np.ndarray, level: int) -> np.ndarray:
+    """Converts lattice coordinates to directions.
 
-def is_blocked(scene, depsgraph, origin: Vector, direction: Vector, max_distance=1.70141e+38) -> bool:
-    """Check if a given point is occluded in a given direction.
+    Each lattice level has rings of constant elevation, a lattice step apart,
+    and each ring has as many evenly spaced directions as fit in it at that step.
 
-    :param scene: scene
-    :param depsgraph: the scene dependency graph
-    :param origin: given point in world space as a Vector
-    :param direction: given direction in world space as a Vector
-    :param max_distance: maximum distance for raycast to check
-    :return: True if anything is in that direction from that point, False otherwise
+    :param rings: integer array of ring indices, 0 at the horizon
+    :param indices: integer array of direction indices within their rings
+    :param level: lattice level, each one halves the step of the previous one
+    :return: (N, 3) array of normalized directions
     """
-    offset_origin = origin + direction * EPSILON
-    is_hit, _, _, _, _, _ = scene.ray_cast(depsgraph, offset_origin, direction, distance=max_distance)
+    step = get_lattice_step(level)
+    elevations = rings * step
+    ring_sizes = np.maximum(np.round(2 * pi * np.cos(elevations) / step), 1.0)
+    azimuths = np.mod(indices, ring_sizes) * (2 * pi / ring_sizes)
+    radius = np.cos(elevations)
+    return np.stack((radius * np.sin(azimuths), radius * np.cos(azimuths), np.sin(elevations)), axis=-1)
 
-    return is_hit
 
+def get_lattice_directions(level: int) -> np.ndarray:
+    """Returns every direction of a lattice level on the upper hemisphere, including the horizon.
 
-def get_box(vertices, normal):
-    """Given a set of vertices flattened along a plane and their normal, return an aligned rectangle.
+    :param level: lattice level
+    :return: (N, 3) array of normalized directions
+    """
+    step = get_lattice_step(level)
+    rings = np.arange(2 ** level + 1)
+    ring_sizes = np.maximum(np.round(2 * pi * np.cos(rings * step) / step), 1.0).astype(np.int64)
+    all_rings = np.repeat(rings, ring_sizes)
+    indices = np.arange(len(all_rings)) - np.repeat(np.cumsum(ring_sizes) - ring_sizes, ring_sizes)
+    return get_lattice_points(all_rings, indices, level)
+
+
+def snap_to_lattice(directions: np.ndarray, level: int) -> np.ndarray:
+    """Moves directions to their nearest direction of a lattice level.
 
-    :param vertices: list of vertex coordinates in world space
-    :param normal: normal of vertices for rectangle to be projected to
-    :return: tuple of (coordinate of rect center, matrix for rotation, rect length, and rect width
+    Directions on the lattice are the same from one search to the next,
+    so the visibility cache can reuse their results instead of sampling new directions every update.
+
+    :param directions: (D, 3) array of normalized directions
+    :param level: lattice level
+    :return: (D, 3) array of lattice directions
     """
-    # rotate hull so normal is pointed up, so we can ignore Z
-    # find angle of fitted box
-    align_to_z = normal.rotation_difference(Vector((0.0, 0.0, 1.0))).to_matrix()
-    flattened_2d = [align_to_z @ v for v in vertices]
+    step = get_lattice_step(level)
+    max_ring = 2 ** level
+    rings = np.clip(np.round(np.arcsin(np.clip(directions[:, 2], -1.0, 1.0)) / step), -max_ring, max_ring)
+    ring_sizes = np.maximum(np.round(2 * pi * np.cos(rings * step) / step), 1.0)
+    azimuths = np.arctan2(directions[:, 0], directions[:, 1])
+    indices = np.round(azimuths * ring_sizes / (2 * pi))
+    return get_lattice_points(rings, indices, level)
 
-    # rotate hull by angle
-    # get length and width
-    angle = box_fit_2d([(v[0], v[1]) for v in flattened_2d])
-    box_mat = Matrix.Rotation(angle, 3, 'Z')
-    aligned_2d = [(box_mat @ Vector((co[0], co[1], 0))) for co in flattened_2d]
-    xs = tuple(co[0] for co in aligned_2d)
-    ys = tuple(co[1] for co in aligned_2d)
 
-    x_min, x_max = min(xs), max(xs)
-    y_min, y_max = min(ys), max(ys)
+def get_refined_directions(directions: np.ndarray, angle: float) -> np.ndarray:
+    """Surrounds each direction with a ring of directions at a given angle from it.
 
-    length = x_max - x_min
-    width = y_max - y_min
+    :param directions: (D, 3) array of normalized directions
+    :param angle: angle between each direction and its ring, in radians
+    :return: (D * REFINE_RING_SIZE, 3) array of normalized directions
+    """
+    # tangent basis for each direction, falling back to the X axis for directions straight up or down
+    tangents = np.cross(directions, (0.0, 0.0, 1.0))
+    tangent_lengths = np.linalg.norm(tangents, axis=1, keepdims=True)
+    tangents = np.where(tangent_lengths > 1e-6, tangents / np.maximum(tangent_lengths, 1e-6), (1.0, 0.0, 0.0))
+    bitangents = np.cross(directions, tangents)
 
-    center = align_to_z.inverted_safe() @ box_mat.inverted_safe() @ Vector((x_min + (length / 2),
-                                                                            y_min + (width / 2),
-                                                                            flattened_2d[0][2]))
+    ring_angles = np.linspace(0, 2 * pi, REFINE_RING_SIZE, endpoint=False)
+    ring = (np.cos(ring_angles)[None, :, None] * tangents[:, None, :] +
+            np.sin(ring_angles)[None, :, None] * bitangents[:, None, :])
+    refined = directions[:, None, :] * cos(angle) + ring * sin(angle)
+    refined = refined.reshape(-1, 3)
+    return refined / np.linalg.norm(refined, axis=1, keepdims=True)
 
-    # return matrix, length and width of box
-    return center, align_to_z.inverted_safe() @ box_mat.inverted_safe(), length, width
 
+def get_representative_points(vertices, max_count: int) -> tuple[list, np.ndarray]:
+    """Reduces points to at most a given count of representatives, by grouping them in a voxel grid.
 
-def calc_rank(dot_product: float, count: int) -> float:
-    """Calculate the "rank" of an occlusion ray test.
+    Each occupied voxel is represented by its first point, weighted by the number of points inside it,
+    so weighted visibility counts approximate those of the whole stroke.
+    Voxel sizes are powers of two aligned to the world origin, so painting more points
+    keeps the existing representatives until the grid has to get coarser.
 
-    :param dot_product: dot product between the current vector and the ideal normal
-    :param count: number of points that can "see" in that direction
-    :return: a rank for comparison, higher is better
+    :param vertices: list of points in world space as Vectors
+    :param max_count: maximum number of representatives
+    :return: list of representative points as tuples, and the number of points each one stands for
     """
-    return (dot_product + 1) * count
+    points = np.array(vertices, dtype=np.float64).reshape(-1, 3)
+    extent = max(float(np.ptp(points, axis=0).max()), MIN_VOXEL_SIZE)
+    voxel_size = 2.0 ** math.floor(math.log2(extent / max_count))
+
+    while True:
+        voxels = np.floor(points / voxel_size).astype(np.int64)
+        _, first_indices, counts = np.unique(voxels, axis=0, return_index=True, return_counts=True)
+        if len(first_indices) <= max_count:
+            break
+        voxel_size *= 2
 
+    # keep stroke order, so representatives appear in the cache in the order they were painted
+    order = np.argsort(first_indices)
+    return points[first_indices[order]].tolist(), counts[order]
 
-def geo_to_dir(latitude, longitude) -> Vector:
-    if latitude == pi/2:
-        return Vector((0, 0, 1))
-    x = sin(longitude)
-    y = cos(longitude)
-    z = sin(latitude)
-    return Vector((x, y, z))
+
+def get_visibility_cache(context, backend: str, cache: VisibilityCache = None) -> VisibilityCache:
+    """Returns a visibility cache for the given backend, reusing the given cache if it matches.
+
+    :param context: Blender context
+    :param backend: occlusion backend to cast rays with
+    :param cache: previously built cache, if any
+    :return: visibility cache
+    """
+    if cache is not None and cache.engine.backend == backend:
+        return cache
+
+    return VisibilityCache(get_occlusion_engine(context, backend))
+
+
+def rank_directions(
+        cache: VisibilityCache, vertices, columns: np.ndarray, dot_products: np.ndarray,
+        best_ranks: np.ndarray = (), keep: int = 1, weights: np.ndarray = None
+) -> np.ndarray:
+    """Ranks directions like calc_rank, without casting rays for directions that can't be among the best.
+
+    A direction's rank can never beat the rank it would have if every untested point could see it,
+    so directions are visited from the closest to the ideal normal,
+    and rays stop being cast for a direction as soon as it can't beat the `keep` best ranks found so far.
+
+    :param cache: visibility cache to rank directions with
+    :param vertices: list of points in world space as Vectors
+    :param columns: indices of the sampled directions to rank
+    :param dot_products: dot product between each direction and the ideal normal
+    :param best_ranks: ranks of previously ranked directions to compete with
+    :param keep: number of best ranks that must be exact
+    :param weights: number of stroke points each vertex stands for, defaults to one each
+    :return: rank of each direction, or an upper bound below the best ranks if it can't be among them
+    """
+    cache.sync(vertices, weights)
+
+    # ascending, so the first one is the rank to beat
+    best = np.full(keep, -np.inf)
+    best_ranks = np.sort(best_ranks)[-keep:]
+    best[keep - len(best_ranks):] = best_ranks
+
+    ranks = calc_rank(dot_products, cache.get_max_visible(columns))
+    max_count = cache.weights.sum()
+    for index in np.argsort(-dot_products, kind='stable'):
+        dot_product, column = dot_products[index], columns[index]
+        if calc_rank(dot_product, max_count) < best[0]:
+            # every direction left is further away from the ideal normal, so none of them can beat it either
+            break
+
+        while cache.unknown_counts[column] > 0 and ranks[index] >= best[0]:
+            cache.cast_next(column)
+            ranks[index] = calc_rank(dot_product, cache.get_max_visible(column))
+
+        if cache.unknown_counts[column] == 0 and ranks[index] > best[0]:
+            best[0] = ranks[index]
+            best.sort()
+
+    return ranks
 
 
 def get_occlusion_based_normal(
         context, vertices: Iterable, avg_normal: Vector,
-        elevation_clamp: float, latitude_samples: int, longitude_samples: int
+        elevation_clamp: float, ray_budget: int,
+        cache: VisibilityCache = None, max_points: int = None
 ) -> Vector:
     """Find a normal that best points toward a given normal that's visible by the most points.
 
+    Evenly spaced directions inside the elevation clamp and facing the given normal are tested first,
+    using part of the budget, then directions around the best ranked ones are tested until the budget runs out.
+    All directions come from fixed lattices, so updates of the same stroke reuse their cached results.
+
     :param context: Blender context
     :param vertices: list of points in world space as Vectors
     :param avg_normal: average normal as the preferred direction towards the sun lamp
     :param elevation_clamp: sun's max vertical angle
-    :param latitude_samples: number of samples for occlusion testing along the latitudinal axis
-    :param longitude_samples: number of samples for occlusion testing along the longitudinal axis
+    :param ray_budget: maximum number of directions each point is tested against
+    :param cache: visibility cache to rank directions with, defaults to casting against the scene
+    :param max_points: maximum number of points to test, nearby points are grouped together beyond it
     :return: world space Vector pointing towards the sun
     """
-    max_sun_elevation = elevation_clamp
-    latitude_sample_size = latitude_samples
-    latitude_samples = np.linspace(0, max_sun_elevation, latitude_sample_size)
-
-    # since about half of longitudinal samples will not be viable (ie pointing away from ideal normal),
-    # we will double its sample size.
-    longitude_sample_size = longitude_samples * 2
-    longitude_samples = np.linspace(0, 2 * pi, longitude_sample_size, endpoint=False)
-
-    # iterate over each axis
-    # if the resulting vector is all zeroes or the dot product of it and Z axis is too high, skip
-    # if the dot product of it and Z axis is less than zero, skip (to avoid night)
-    scene = context.scene
-    depsgraph = context.evaluated_depsgraph_get()
-
-    samples_loop = (geo_to_dir(lat, long).normalized()
-                    for long in longitude_samples
-                    for lat in latitude_samples
-                    if geo_to_dir(lat, long).normalized().dot(avg_normal) > 0)
-
-    def normal_rank(normal):
-        vertex_visibility_count = sum(1 for v in vertices
-                                      if not is_blocked(scene, depsgraph, v, normal))
-
-        curr_rank = calc_rank(normal.dot(avg_normal), vertex_visibility_count)
-        return curr_rank, normal
-
-    sun_normal = max(normal_rank(normal) for normal in samples_loop)[1]
+    if cache is None:
+        cache = VisibilityCache(SceneOcclusion(context))
+
+    weights = None
+    if max_points is not None and len(vertices) > max_points:
+        vertices, weights = get_representative_points(vertices, max_points)
+
+    avg_normal = np.array(avg_normal, dtype=np.float32)
+    max_z = sin(elevation_clamp) + ELEVATION_TOLERANCE
+
+    # only directions facing the average normal are ranked, so only geometry in that hemisphere can block them
+    cache.engine.reserve(vertices, avg_normal, PI_OVER_2)
+
+    def get_valid(directions: np.ndarray) -> np.ndarray:
+        # if the direction is below the horizon or above the max elevation, skip
+        # if the dot product of it and the ideal normal is less than zero, skip (to avoid night)
+        return directions[(directions[:, 2] >= 0.0) & (directions[:, 2] <= max_z) & (directions @ avg_normal > 0)]
+
+    def rank_new_directions(directions: np.ndarray, budget: int, columns: np.ndarray,
+                            ranks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # only valid directions that weren't ranked yet, up to the budget
+        new_columns = cache.get_columns(get_valid(directions))
+        new_columns = new_columns[~np.isin(new_columns, columns)]
+        _, first_indices = np.unique(new_columns, return_index=True)
+        new_columns = new_columns[np.sort(first_indices)][:budget]
+        # refinement needs the best few ranks, not just the best one
+        return new_columns, rank_directions(cache, vertices, new_columns, cache.directions[new_columns] @ avg_normal,
+                                            ranks, keep=REFINE_COUNT, weights=weights)
+
+    # coarsest lattice level that spends the coarse share of the budget on the valid directions
+    coarse_budget = max(int(ray_budget * COARSE_BUDGET_FRACTION), 1)
+    valid_area = 2 * pi * max(len(get_valid(get_hemisphere_directions(AREA_SAMPLE_COUNT))), 1) / AREA_SAMPLE_COUNT
+    level = max(math.floor(math.log2(PI_OVER_2 * sqrt(coarse_budget / valid_area))), 0)
+
+    columns, ranks = rank_new_directions(get_lattice_directions(level), ray_budget,
+                                         np.zeros(0, dtype=np.int64), np.zeros(0))
+    if len(columns) == 0:
+        raise ValueError('No valid directions found')
+
+    # coarse-to-fine: halve the spacing around the best directions until the budget runs out
+    remaining_budget = ray_budget - len(columns)
+    while remaining_budget > 0 and get_lattice_step(level + 1) > MIN_REFINE_ANGLE:
+        level += 1
+        best = np.argsort(ranks, kind='stable')[::-1][:REFINE_COUNT]
+        parents = cache.directions[columns[best]]
+        refined = snap_to_lattice(get_refined_directions(parents, get_lattice_step(level)), level)
+
+        refined_columns, refined_ranks = rank_new_directions(refined, remaining_budget, columns, ranks)
+        remaining_budget -= max(len(refined_columns), 1)
+        columns = np.concatenate((columns, refined_columns))
+        ranks = np.concatenate((ranks, refined_ranks))
+
+    sun_normal = Vector(cache.directions[columns[np.argmax(ranks)]])
+
+    # directions this search didn't need are dropped once there are too many, so the cache stays bounded
+    if len(cache.directions) > CACHED_DIRECTIONS_PER_RAY * ray_budget:
+        cache.keep_columns(columns)
 
     return sun_normal
 
@@ -243,23 +456,12 @@ class LampUtils(VisibilitySettings):
 
         :return: Blender lamp object
         """
-
-        vertices, normals = stroke
-        # get average, negated normal, THROWS ValueError if average is zero vector
-        avg_normal = get_average_normal(normals)
-        avg_normal.negate()
-
-        farthest_point = max((v.project(avg_normal).length_squared, v) for v in vertices)[1]
-
-        projected_vertices = tuple(v + (farthest_point - v).project(avg_normal) for v in vertices)
-
-        center, mat, x_size, y_size = get_box(projected_vertices, avg_normal)
-        rotation = mat.to_euler()
-        rotation.rotate_axis('X', math.radians(180.0))
+        placement = get_area_placement(*stroke)
+        x_size, y_size = placement.size
 
         # set light data properties
-        lamp.location = center
-        lamp.rotation_euler = rotation
+        lamp.location = placement.location
+        lamp.rotation_euler = placement.rotation
         lamp.data.energy = calc_power(self.power, self.offset) if self.is_power_relative else self.power
         lamp.data.shape = self.shape
         lamp.data.spread = self.spread
@@ -282,20 +484,8 @@ class LampUtils(VisibilitySettings):
 
         :return: Blender lamp object
         """
-        vertices, normals = stroke
-
-        # get average, negated normal, THROWS ValueError if average is zero vector
-        avg_normal = get_average_normal(normals)
-        avg_normal.negate()
-
-        farthest_point = max((v.project(avg_normal).length_squared, v) for v in vertices)[1]
-
-        projected_vertices = tuple(v + (farthest_point - v).project(avg_normal) for v in vertices)
-
-        center = sum(projected_vertices, start=Vector()) / len(projected_vertices)
-
         # set light data properties
-        lamp.location = center
+        lamp.location = get_point_placement(*stroke)
         lamp.data.shadow_soft_size = self.radius
         lamp.data.energy = calc_power(self.power, self.offset) if self.is_power_relative else self.power
         self.set_visibility(lamp)
@@ -312,27 +502,12 @@ class LampUtils(VisibilitySettings):
         :return: Blender lamp object
         """
         vertices, normals = stroke
-
-        # THROWS ValueError if average is zero vector
-        avg_normal = get_average_normal(normals)
-        avg_normal.negate()
-
-        farthest_point = max((v.project(avg_normal).length_squared, v) for v in vertices)[1]
-
-        projected_vertices = tuple(v + (farthest_point - v).project(avg_normal) for v in vertices)
-
-        center = sum(projected_vertices, start=Vector()) / len(projected_vertices)
-        rotation = Vector((0.0, 0.0, -1.0)).rotation_difference(avg_normal).to_euler()
-
-        orig_center = sum(orig_vertices, start=Vector()) / len(orig_vertices)
-        centers_dir = (orig_center - center).normalized()
-        spot_angle = 2 * max((v - center).normalized().angle(centers_dir)
-                             for v in orig_vertices)
+        placement = get_spot_placement(vertices, normals, orig_vertices)
 
         # set light data properties
-        lamp.location = center
-        lamp.rotation_euler = rotation
-        lamp.data.spot_size = spot_angle
+        lamp.location = placement.location
+        lamp.rotation_euler = placement.rotation
+        lamp.data.spot_size = placement.spot_size
         lamp.data.energy = calc_power(self.power, self.offset) if self.is_power_relative else self.power
         lamp.data.shadow_soft_size = self.radius
         lamp.data.spot_blend = self.spot_blend
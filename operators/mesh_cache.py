@@ -0,0 +1,308 @@
+#     Light Painter, Blender add-on that creates lights based on where the user paints.
+#     Copyright (C) 2024 Spencer Magnusson
+#     semagnum@gmail.com
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import bpy
+from bpy.app.handlers import persistent
+from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+import numpy as np
+
+MESH_GEOMETRY = {}
+"""Local space geometry of evaluated meshes, kept across tool sessions until the mesh changes."""
+BOUNDS_CHUNK_SIZE = 1 << 16
+"""Most ray and instance pairs tested against instance bounds at once, so batches of rays use bounded memory."""
+
+
+def get_mesh_key(instance):
+    """Returns the key that every instance sharing the same evaluated geometry has in common.
+
+    Unmodified mesh objects share the geometry of their mesh datablock, others have their own.
+
+    :param instance: depsgraph object instance
+    :return: tuple of ('MESH' or 'OBJECT', session UID), or None if the geometry can't be shared
+    """
+    original = instance.object.original
+    if instance.is_instance and instance.parent.original == original:
+        # geometry generated by the instancer itself (e.g. geometry nodes), no datablock to key it by
+        return None
+    if original.type == 'MESH' and len(original.modifiers) == 0 and original.data.shape_keys is None:
+        return 'MESH', original.data.session_uid
+    return 'OBJECT', original.session_uid
+
+
+class MeshGeometry:
+    """Triangles of one evaluated mesh in its object's local space, shared by every instance of the mesh."""
+
+    def __init__(self, coords: np.ndarray, triangles: np.ndarray):
+        self.coords = coords
+        self.triangles = triangles
+        self.bounds_min = coords.min(axis=0)
+        self.bounds_max = coords.max(axis=0)
+        self._tree = None
+
+    @property
+    def tree(self) -> BVHTree:
+        """BVH tree of the triangles, built on first use."""
+        if self._tree is None:
+            self._tree = BVHTree.FromPolygons(self.coords.tolist(), self.triangles.tolist(), all_triangles=True)
+        return self._tree
+
+
+def get_mesh_geometry(instance):
+    """Returns the local space geometry of an evaluated object instance, exporting it only if it isn't cached.
+
+    :param instance: depsgraph object instance
+    :return: MeshGeometry, or None if the instance has no triangles
+    """
+    key = get_mesh_key(instance)
+    if key in MESH_GEOMETRY:
+        return MESH_GEOMETRY[key]
+
+    obj = instance.object
+    mesh = obj.to_mesh()
+    try:
+        if mesh is None or len(mesh.vertices) == 0:
+            geometry = None
+        else:
+            mesh.calc_loop_triangles()
+
+            coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+            mesh.vertices.foreach_get('co', coords)
+
+            triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+            mesh.loop_triangles.foreach_get('vertices', triangles)
+
+            geometry = MeshGeometry(coords.reshape(-1, 3), triangles.reshape(-1, 3)) if len(triangles) else None
+    finally:
+        obj.to_mesh_clear()
+
+    if key is not None:
+        MESH_GEOMETRY[key] = geometry
+    return geometry
+
+
+class InstancedGeometry:
+    """Instances of cached mesh geometry, ray cast through their transforms.
+
+    Rays are first tested against every instance's world space bounds at once,
+    then cast against the mesh trees of the instances they hit, nearest first.
+    """
+
+    def __init__(self):
+        self.geometries = []
+        self.matrices = []
+        self.inverse_matrices = []
+        self.normal_matrices = []
+        self.instance_bounds = []
+        self._bounds = None
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def add(self, instance) -> bool:
+        """Adds an evaluated object instance.
+
+        :param instance: depsgraph object instance
+        :return: True if the instance has any triangles
+        """
+        geometry = get_mesh_geometry(instance)
+        if geometry is None:
+            return False
+
+        matrix = instance.matrix_world.copy()
+        inverse_matrix = matrix.inverted_safe()
+        self.geometries.append(geometry)
+        self.matrices.append(matrix)
+        self.inverse_matrices.append(inverse_matrix)
+        self.normal_matrices.append(inverse_matrix.to_3x3().transposed())
+
+        # world space bounds of the transformed local bounds
+        corners = np.array([(x, y, z) for x in (geometry.bounds_min[0], geometry.bounds_max[0])
+                            for y in (geometry.bounds_min[1], geometry.bounds_max[1])
+                            for z in (geometry.bounds_min[2], geometry.bounds_max[2])])
+        np_matrix = np.array(matrix)
+        corners = corners @ np_matrix[:3, :3].T + np_matrix[:3, 3]
+        self.instance_bounds.append((corners.min(axis=0), corners.max(axis=0)))
+        self._bounds = None
+        return True
+
+    @property
+    def bounds_min(self) -> np.ndarray:
+        """(M, 3) array of the minimum corner of every instance's world space bounds."""
+        return self.get_bounds()[0]
+
+    @property
+    def bounds_max(self) -> np.ndarray:
+        """(M, 3) array of the maximum corner of every instance's world space bounds."""
+        return self.get_bounds()[1]
+
+    def get_bounds(self) -> tuple[np.ndarray, np.ndarray]:
+        """Stacks the bounds of every instance, once after instances are added."""
+        if self._bounds is None:
+            bounds = np.array(self.instance_bounds, dtype=np.float64).reshape(-1, 2, 3)
+            self._bounds = bounds[:, 0], bounds[:, 1]
+        return self._bounds
+
+    def get_bounds_distances(self, origins: np.ndarray, directions: np.ndarray) -> np.ndarray:
+        """Tests rays against every instance's world space bounds at once.
+
+        :param origins: (N, 3) array of ray origins
+        :param directions: (N, 3) array of ray directions
+        :return: (N, M) array of each ray's distance to each instance's bounds, infinite where it misses them
+        """
+        origins = origins[:, None, :]
+        safe_directions = np.where(np.abs(directions) < 1e-12, 1e-12, directions)[:, None, :]
+        t1 = (self.bounds_min - origins) / safe_directions
+        t2 = (self.bounds_max - origins) / safe_directions
+        t_near = np.maximum(np.minimum(t1, t2).max(axis=2), 0.0)
+        t_far = np.maximum(t1, t2).min(axis=2)
+        return np.where(t_far >= t_near, t_near, np.inf)
+
+    def iter_bounds_distances(self, origins: np.ndarray, directions: np.ndarray):
+        """Tests rays against every instance's world space bounds, a chunk of rays at a time.
+
+        :param origins: (N, 3) array of ray origins
+        :param directions: (N, 3) array of ray directions
+        :return: iterator of the first ray index of each chunk and its rays' distances, as in get_bounds_distances
+        """
+        chunk_size = max(BOUNDS_CHUNK_SIZE // max(len(self), 1), 1)
+        for start in range(0, len(origins), chunk_size):
+            end = start + chunk_size
+            yield start, self.get_bounds_distances(origins[start:end], directions[start:end])
+
+    def cast_candidates(self, origin: Vector, direction: Vector, distance: float, bounds_distances: np.ndarray,
+                        any_hit: bool = False):
+        """Casts a ray against the instances whose bounds it passes through, nearest first."""
+        candidates = np.flatnonzero(bounds_distances <= distance)
+        candidates = candidates[np.argsort(bounds_distances[candidates], kind='stable')]
+
+        nearest = None
+        for index in candidates:
+            if nearest is not None and bounds_distances[index] > nearest[2]:
+                break
+
+            inverse_matrix = self.inverse_matrices[index]
+            local_origin = inverse_matrix @ origin
+            local_direction = inverse_matrix.to_3x3() @ direction
+
+            # the tree measures distances in local space, which is scaled by the instance's transform
+            scale = local_direction.length
+            if scale == 0.0:
+                continue
+            max_distance = (distance if nearest is None else nearest[2]) * scale
+            location, normal, _, local_distance = self.geometries[index].tree.ray_cast(
+                local_origin, local_direction / scale, max_distance
+            )
+            if location is None:
+                continue
+
+            normal = self.normal_matrices[index] @ normal
+            normal.normalize()
+            nearest = (self.matrices[index] @ location, normal, local_distance / scale)
+            if any_hit:
+                break
+
+        return nearest
+
+    def ray_cast(self, origin: Vector, direction: Vector, distance: float, any_hit: bool = False):
+        """Casts a ray against all instances.
+
+        :param origin: ray origin in world space
+        :param direction: normalized ray direction in world space
+        :param distance: maximum distance of the ray
+        :param any_hit: if True, stops at the first hit found instead of the nearest one
+        :return: tuple of world space hit location, normal and distance, or None if nothing was hit
+        """
+        bounds_distances = self.get_bounds_distances(np.array((origin,)), np.array((direction,)))[0]
+        return self.cast_candidates(origin, direction, distance, bounds_distances, any_hit)
+
+    def ray_cast_many(self, origins: np.ndarray, directions: np.ndarray,
+                      distance: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Casts many rays against all instances, testing all of them against the instance bounds at once.
+
+        :param origins: (N, 3) array of ray origins in world space
+        :param directions: (N, 3) array of normalized ray directions in world space
+        :param distance: maximum distance of the rays
+        :return: tuple of a boolean array, True for each ray that hit, and (N, 3) arrays of hit locations and normals
+        """
+        is_hit = np.zeros(len(origins), dtype=bool)
+        locations = np.zeros((len(origins), 3))
+        normals = np.zeros((len(origins), 3))
+
+        for start, bounds_distances in self.iter_bounds_distances(origins, directions):
+            for chunk_index in np.flatnonzero((bounds_distances <= distance).any(axis=1)):
+                index = start + chunk_index
+                hit = self.cast_candidates(Vector(origins[index]), Vector(directions[index]), distance,
+                                           bounds_distances[chunk_index])
+                if hit is not None:
+                    is_hit[index] = True
+                    locations[index], normals[index], _ = hit
+
+        return is_hit, locations, normals
+
+
+def forget_changed_meshes(_scene, depsgraph):
+    """Handler for depsgraph_update_post, dropping cached geometry of meshes and objects that changed."""
+    if not MESH_GEOMETRY:
+        return
+
+    for update in depsgraph.updates:
+        updated_id = update.id
+        if isinstance(updated_id, bpy.types.Mesh):
+            MESH_GEOMETRY.pop(('MESH', updated_id.original.session_uid), None)
+        elif isinstance(updated_id, bpy.types.Object) and update.is_updated_geometry:
+            original = updated_id.original
+            MESH_GEOMETRY.pop(('OBJECT', original.session_uid), None)
+            if original.type == 'MESH':
+                MESH_GEOMETRY.pop(('MESH', original.data.session_uid), None)
+
+
+def forget_object_meshes(*_args):
+    """Handler for frame changes, dropping cached geometry of objects that may deform with the frame.
+
+    Armatures, animated shape keys and modifiers don't always send depsgraph updates for the frame change,
+    unmodified meshes without shape keys can't deform so they are kept.
+    """
+    for key in [key for key in MESH_GEOMETRY if key[0] == 'OBJECT']:
+        del MESH_GEOMETRY[key]
+
+
+def forget_all_meshes(*_args):
+    """Handler for loading files and undoing, after which cached geometry may be stale."""
+    MESH_GEOMETRY.clear()
+
+
+HANDLERS = (
+    (bpy.app.handlers.depsgraph_update_post, persistent(forget_changed_meshes)),
+    (bpy.app.handlers.frame_change_post, persistent(forget_object_meshes)),
+    (bpy.app.handlers.load_post, persistent(forget_all_meshes)),
+    (bpy.app.handlers.undo_post, persistent(forget_all_meshes)),
+    (bpy.app.handlers.redo_post, persistent(forget_all_meshes)),
+)
+
+
+def register():
+    for handlers, handler in HANDLERS:
+        if handler not in handlers:
+            handlers.append(handler)
+
+
+def unregister():
+    for handlers, handler in HANDLERS:
+        if handler in handlers:
+            handlers.remove(handler)
+    MESH_GEOMETRY.clear()
@@ -1,19 +1,17 @@
 import bpy
 
 from .base_tool import BaseLightPaintTool
-from .lamp_util import get_average_normal
+from .paint_target import MESH_DATA_NAME, TUBE_DATA_NAME
 from .prop_util import axis_prop, convert_val_to_unit_str, get_drag_mode_header, offset_prop
 from .visibility import VisibilitySettings
-from ..axis import prep_stroke
-from ..keymap import get_kmi_str, is_event_command
+from ..solve import average_normal, flatten as flatten_vertices
+from ..keymap import get_kmi_str
 if bpy.app.version >= (4, 1):
     from bpy.app.translations import pgettext_rpt as rpt_
 else:
     from bpy.app.translations import pgettext_tip as rpt_
 
 EMISSIVE_MAT_NAME = 'LightPaint_Emissive'
-MESH_DATA_NAME = 'LightPaint_Convex'
-TUBE_DATA_NAME = 'LightPaint_Tube'
 
 
 def assign_emissive_material(obj, color, emit_value: float):
@@ -107,18 +105,18 @@ class LIGHTPAINTER_OT_Mesh(bpy.types.Operator, BaseLightPaintTool, VisibilitySet
     def extra_paint_controls(self, context, event):
         mouse_x = event.mouse_x
 
-        if is_event_command(event, 'OFFSET_MODE'):
+        if 'OFFSET_MODE' in self.event_commands:
             self.set_drag_attr('offset', mouse_x)
 
-        elif is_event_command(event, 'POWER_MODE'):
+        elif 'POWER_MODE' in self.event_commands:
             self.set_drag_attr('emit_value', mouse_x)
 
-        elif is_event_command(event, 'FLATTEN_TOGGLE'):
+        elif 'FLATTEN_TOGGLE' in self.event_commands:
             self.flatten = not self.flatten
 
-        elif self.check_axis_event(event):
+        elif self.check_axis_event():
             pass  # if True, event is handled
-        elif self.check_visibility_event(event):
+        elif self.check_visibility_event():
             pass  # if True, event is handled
 
         else:
@@ -171,13 +169,11 @@ class LIGHTPAINTER_OT_Mesh(bpy.types.Operator, BaseLightPaintTool, VisibilitySet
             mesh_vertices = vertices
         else:
             # get average, negated normal (throws ValueError if average is zero vector)
-            avg_normal = get_average_normal(normals)
+            avg_normal = average_normal(normals)
 
-            farthest_point = max((v.project(avg_normal).length_squared, v) for v in vertices)[1]
+            mesh_vertices = flatten_vertices(vertices, avg_normal)
 
-            mesh_vertices = tuple(v + (farthest_point - v).project(avg_normal) for v in vertices)
-
-        return mesh_vertices
+        return mesh_vertices.tolist()
 
     def add_mesh_light(self, context, vertices, normals):
         """Adds an emissive convex hull mesh.
@@ -218,11 +214,8 @@ class LIGHTPAINTER_OT_Mesh(bpy.types.Operator, BaseLightPaintTool, VisibilitySet
         if len(self.mouse_path) == 0:
             return
 
-        stroke_vertices = [coord for stroke in self.mouse_path for coord, normal in stroke]
-        stroke_normals = [normal for stroke in self.mouse_path for coord, normal in stroke]
-        offset_vertices, offset_normals, _ = prep_stroke(
-            context, stroke_vertices, stroke_normals,
-            self.axis, self.offset
+        offset_vertices, offset_normals, _ = self.prepared_stroke.prepare(
+            context, self.mouse_path, self.axis, self.offset
         )
 
         try:
@@ -238,7 +231,7 @@ class LIGHTPAINTER_OT_Mesh(bpy.types.Operator, BaseLightPaintTool, VisibilitySet
             obj.select_set(False)
             self.prev_selected.append(obj.name)
 
-        mesh = bpy.data.meshes.new('LightPaint_Convex')
+        mesh = bpy.data.meshes.new(MESH_DATA_NAME)
         mesh_obj = bpy.data.objects.new(mesh.name, mesh)
         col = context.collection
         col.objects.link(mesh_obj)
@@ -357,18 +350,18 @@ class LIGHTPAINTER_OT_Tube_Light(bpy.types.Operator, BaseLightPaintTool, Visibil
     def extra_paint_controls(self, context, event):
         mouse_x = event.mouse_x
 
-        if is_event_command(event, 'OFFSET_MODE'):
+        if 'OFFSET_MODE' in self.event_commands:
             self.set_drag_attr('offset', mouse_x)
 
-        elif is_event_command(event, 'SIZE_MODE'):
+        elif 'SIZE_MODE' in self.event_commands:
             self.set_drag_attr('skin_radius', mouse_x, drag_increment=0.05, drag_precise_increment=0.01)
 
-        elif is_event_command(event, 'POWER_MODE'):
+        elif 'POWER_MODE' in self.event_commands:
             self.set_drag_attr('emit_value', mouse_x)
 
-        elif self.check_axis_event(event):
+        elif self.check_axis_event():
             pass  # if True, event is handled
-        elif self.check_visibility_event(event):
+        elif self.check_visibility_event():
             pass  # if True, event is handled
 
         else:
@@ -414,19 +407,14 @@ class LIGHTPAINTER_OT_Tube_Light(bpy.types.Operator, BaseLightPaintTool, Visibil
 
         vertices = []
         edge_idx = []
-        for stroke in self.mouse_path:
-            stroke_vertices = [coord for coord, normal in stroke]
-            stroke_normals = [normal for coord, normal in stroke]
-            offset_vertices, _, _ = prep_stroke(
-                context, stroke_vertices, stroke_normals,
-                self.axis, self.offset
-            )
-
-            vertices += offset_vertices
+        all_offset_vertices, _, _ = self.prepared_stroke.prepare(context, self.mouse_path, self.axis, self.offset)
+        for offset_vertices in self.mouse_path.split(all_offset_vertices):
+            stroke_length = len(offset_vertices)
+            vertices += offset_vertices.tolist()
             offset = 0 if len(edge_idx) == 0 else edge_idx[-1][-1] + 1
             edge_idx += [(start_idx + offset, end_idx + offset)
-                         for start_idx, end_idx in zip(range(len(stroke) - 1),
-                                                       range(1, len(stroke)))]
+                         for start_idx, end_idx in zip(range(stroke_length - 1),
+                                                       range(1, stroke_length))]
 
         mesh_obj = context.active_object
         mesh = mesh_obj.data
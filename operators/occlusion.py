@@ -0,0 +1,744 @@
+#     Light Painter, Blender add-on that creates lights based on where the user paints.
+#     Copyright (C) 2024 Spencer Magnusson
+#     semagnum@gmail.com
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from abc import ABC, abstractmethod
+from math import pi
+from weakref import WeakKeyDictionary
+
+from mathutils import Vector
+import numpy as np
+
+from .mesh_cache import InstancedGeometry
+
+EPSILON = 0.01
+"""Offset along the ray direction before casting, to prevent self-collisions."""
+MAX_DISTANCE = 1.70141e+38
+
+DIRECTION_KEY_DECIMALS = 6
+"""Precision of sample directions when looking them up in the visibility cache."""
+CAST_BATCH_SIZE = 256
+"""Maximum number of rays cast at once when ranking can stop early."""
+
+BVH_LEAF_SIZE = 8
+"""Maximum number of triangles per leaf node of the NumPy BVH."""
+
+GEOMETRY_TYPES = {'MESH', 'CURVE', 'SURFACE', 'META', 'FONT'}
+"""Object types that produce evaluated geometry ray casts can hit."""
+
+LOCAL_BOUNDS_SLACK = 1.5
+"""Growth factor of the stroke bounds a local occlusion tree covers, so painting doesn't grow it every event."""
+LOCAL_ANGLE_SLACK = pi / 12
+"""Extra angle a local occlusion tree covers when its direction cone grows."""
+
+NUMPY_TREES = WeakKeyDictionary()
+"""NumPy BVH of each cached mesh's local triangles, dropped along with the mesh's cached geometry."""
+
+
+def get_instance_key(instance) -> tuple:
+    """Identifies an evaluated object instance across iterations of the depsgraph's instances."""
+    parent_name = instance.parent.original.name if instance.is_instance else ''
+    return instance.object.original.name, parent_name, tuple(instance.persistent_id)
+
+
+def get_bounding_sphere(points: np.ndarray) -> tuple[np.ndarray, float]:
+    """Returns the center of a set of points' bounding box and the distance to the farthest point."""
+    center = (points.min(axis=0) + points.max(axis=0)) / 2
+    return center, float(np.linalg.norm(points - center, axis=1).max())
+
+
+def get_cone_intersections(centers: np.ndarray, radii: np.ndarray, apex: np.ndarray, axis: np.ndarray,
+                           angle: float) -> np.ndarray:
+    """Tests spheres against an infinite cone.
+
+    :param centers: (N, 3) array of sphere centers
+    :param radii: (N,) array of sphere radii
+    :param apex: apex of the cone
+    :param axis: normalized axis of the cone
+    :param angle: half angle of the cone in radians
+    :return: boolean array, True for each sphere that touches the cone
+    """
+    offsets = centers - apex
+    distances = np.linalg.norm(offsets, axis=1)
+    is_inside = distances <= radii
+    safe_distances = np.where(is_inside, 1.0, distances)
+
+    # angle to the sphere's center, minus the angle the sphere spans as seen from the apex
+    center_angles = np.arccos(np.clip((offsets @ axis) / safe_distances, -1.0, 1.0))
+    sphere_angles = np.arcsin(np.clip(radii / safe_distances, 0.0, 1.0))
+    return is_inside | (center_angles - sphere_angles <= angle)
+
+
+class LocalScene:
+    """Scene geometry that can block rays cast from a stroke toward a cone of directions.
+
+    Every object is reduced to a bounding sphere up front. An object's triangles are only exported
+    once its sphere, grown by the stroke's bounding sphere, touches the cone of directions,
+    so geometry behind or beside the stroke is never exported.
+    The covered stroke bounds and cone only grow, so rays cast earlier stay valid.
+    """
+
+    def __init__(self, depsgraph):
+        self.depsgraph = depsgraph
+
+        # bounds of every instance, keyed so instances can be found again when exporting
+        self.instance_keys = {}
+        centers, radii = [], []
+        for instance in depsgraph.object_instances:
+            if instance.object.type not in GEOMETRY_TYPES:
+                continue
+
+            matrix = np.array(instance.matrix_world, dtype=np.float64)
+            corners = np.array(instance.object.bound_box, dtype=np.float64)
+            center, radius = get_bounding_sphere(corners @ matrix[:3, :3].T + matrix[:3, 3])
+            self.instance_keys[get_instance_key(instance)] = len(radii)
+            centers.append(center)
+            radii.append(radius)
+
+        self.centers = np.array(centers, dtype=np.float64).reshape(-1, 3)
+        self.radii = np.array(radii, dtype=np.float64)
+        self.included = np.zeros(len(self.radii), dtype=bool)
+        self.instances = InstancedGeometry()
+
+        self.center = None
+        self.radius = 0.0
+        self.axis = None
+        self.angle = 0.0
+
+    def covers(self, center: np.ndarray, radius: float, axis: np.ndarray, angle: float) -> bool:
+        """Returns True if rays from the given bounds toward the given cone can only hit included geometry."""
+        if self.center is None:
+            return False
+        if np.linalg.norm(center - self.center) + radius > self.radius:
+            return False
+        return self.angle >= pi or np.arccos(np.clip(axis @ self.axis, -1.0, 1.0)) + angle <= self.angle
+
+    def reserve(self, vertices, axis, angle: float) -> bool:
+        """Includes the geometry that can block rays from the vertices toward a cone of directions.
+
+        :param vertices: list of points in world space
+        :param axis: normalized axis of the direction cone
+        :param angle: half angle of the direction cone in radians, pi for every direction
+        :return: True if new geometry was included
+        """
+        vertices = np.array(vertices, dtype=np.float64).reshape(-1, 3)
+        if len(vertices) == 0:
+            return False
+
+        center, radius = get_bounding_sphere(vertices)
+        axis = np.array(axis, dtype=np.float64)
+        if self.covers(center, radius, axis, angle):
+            return False
+
+        if self.center is not None:
+            # smallest sphere and cone enclosing both the old and new ones
+            distance = np.linalg.norm(center - self.center)
+            if distance + radius > self.radius:
+                if distance + self.radius > radius:
+                    new_radius = (distance + radius + self.radius) / 2
+                    center = self.center + (center - self.center) * ((new_radius - self.radius) / distance)
+                    radius = new_radius
+            else:
+                center, radius = self.center, self.radius
+
+            between = np.arccos(np.clip(axis @ self.axis, -1.0, 1.0))
+            if between > pi - 1e-6 and between + angle > self.angle:
+                # cones pointing in opposite directions, only a full sphere encloses both
+                angle = pi
+            elif between + angle > self.angle and between + self.angle > angle:
+                new_angle = (between + angle + self.angle) / 2
+                rotation = new_angle - self.angle
+                axis = (np.sin(between - rotation) * self.axis + np.sin(rotation) * axis) / np.sin(between)
+                angle = new_angle
+            elif between + angle <= self.angle:
+                axis, angle = self.axis, self.angle
+
+        self.center, self.radius = center, max(radius * LOCAL_BOUNDS_SLACK, 1e-6)
+        self.axis = axis / np.linalg.norm(axis)
+        self.angle = min(angle + LOCAL_ANGLE_SLACK, pi)
+
+        is_new = get_cone_intersections(self.centers, self.radii + self.radius, self.center,
+                                        self.axis, self.angle)
+        return self.include(is_new & ~self.included)
+
+    def reserve_all(self) -> bool:
+        """Includes all geometry, for queries that aren't limited to a stroke.
+
+        :return: True if new geometry was included
+        """
+        self.angle = pi
+        self.radius = np.inf
+        self.center = np.zeros(3)
+        self.axis = np.array((0.0, 0.0, 1.0))
+        return self.include(~self.included)
+
+    def include(self, is_new: np.ndarray) -> bool:
+        if not is_new.any():
+            return False
+
+        for instance in self.depsgraph.object_instances:
+            if instance.object.type not in GEOMETRY_TYPES:
+                continue
+
+            index = self.instance_keys.get(get_instance_key(instance))
+            if index is not None and is_new[index]:
+                self.instances.add(instance)
+        self.included |= is_new
+        return True
+
+
+class TriangleBVH:
+    """Flattened bounding volume hierarchy over triangles, stored as contiguous float32 arrays.
+
+    Nodes are stored depth-first. Leaf nodes have a positive triangle count
+    and reference a contiguous range of the (reordered) triangle arrays.
+    Inner nodes reference their two children.
+    """
+
+    def __init__(self, triangles: np.ndarray, leaf_size: int = BVH_LEAF_SIZE):
+        """Builds the hierarchy.
+
+        :param triangles: (N, 3, 3) array of triangle corners in world space
+        :param leaf_size: maximum number of triangles per leaf node
+        """
+        triangles = np.ascontiguousarray(triangles, dtype=np.float32).reshape(-1, 3, 3)
+        centroids = triangles.mean(axis=1)
+        tri_min = triangles.min(axis=1)
+        tri_max = triangles.max(axis=1)
+
+        order = np.arange(len(triangles))
+        bounds_min, bounds_max, children, starts, counts = [], [], [], [], []
+
+        # each entry: (start, end, parent node index, is right child)
+        stack = [(0, len(triangles), -1, False)]
+        while stack:
+            start, end, parent, is_right = stack.pop()
+            node = len(starts)
+            if parent != -1:
+                children[parent][int(is_right)] = node
+
+            indices = order[start:end]
+            if len(indices):
+                bounds_min.append(tri_min[indices].min(axis=0))
+                bounds_max.append(tri_max[indices].max(axis=0))
+            else:
+                bounds_min.append(np.full(3, np.inf, dtype=np.float32))
+                bounds_max.append(np.full(3, -np.inf, dtype=np.float32))
+            children.append([-1, -1])
+            starts.append(start)
+
+            if end - start <= leaf_size:
+                counts.append(end - start)
+                continue
+
+            # median split along the longest axis of the centroids
+            node_centroids = centroids[indices]
+            axis = int(np.argmax(node_centroids.max(axis=0) - node_centroids.min(axis=0)))
+            mid = (end - start) // 2
+            split = np.argpartition(node_centroids[:, axis], mid)
+            order[start:end] = indices[split]
+            counts.append(0)
+
+            stack.append((start + mid, end, node, True))
+            stack.append((start, start + mid, node, False))
+
+        triangles = triangles[order]
+        self.v0 = np.ascontiguousarray(triangles[:, 0])
+        self.edge1 = np.ascontiguousarray(triangles[:, 1] - triangles[:, 0])
+        self.edge2 = np.ascontiguousarray(triangles[:, 2] - triangles[:, 0])
+
+        self.bounds_min = np.array(bounds_min, dtype=np.float32).reshape(-1, 3)
+        self.bounds_max = np.array(bounds_max, dtype=np.float32).reshape(-1, 3)
+        self.children = np.array(children, dtype=np.int32).reshape(-1, 2)
+        self.starts = np.array(starts, dtype=np.int32)
+        self.counts = np.array(counts, dtype=np.int32)
+
+    def intersects(self, origins: np.ndarray, direction, max_distance=MAX_DISTANCE,
+                   offset: float = EPSILON) -> np.ndarray:
+        """Tests a batch of rays sharing a direction for any hit, offsetting each origin by EPSILON.
+
+        Distances are measured in lengths of the direction, so rays transformed into a mesh's local space
+        keep their world space distances.
+
+        :param origins: (N, 3) array of ray origins in the triangles' space
+        :param direction: normalized ray direction in the triangles' space
+        :param max_distance: maximum distance for rays to check
+        :param offset: distance to move the origins along the direction before testing
+        :return: boolean array, True for each ray that hits a triangle
+        """
+        direction = np.asarray(direction, dtype=np.float32)
+        origins = np.asarray(origins, dtype=np.float32) + direction * offset
+        hits = np.zeros(len(origins), dtype=bool)
+        if len(origins) == 0 or len(self.v0) == 0:
+            return hits
+
+        # avoid division by zero for axis-aligned rays, slabs are then effectively infinite
+        safe_direction = np.where(np.abs(direction) < 1e-12, 1e-12, direction)
+        inv_direction = 1.0 / safe_direction
+
+        stack = [(0, np.arange(len(origins)))]
+        while stack:
+            node, rays = stack.pop()
+            rays = rays[~hits[rays]]
+            if len(rays) == 0:
+                continue
+
+            # slab test against the node's bounds
+            ray_origins = origins[rays]
+            t1 = (self.bounds_min[node] - ray_origins) * inv_direction
+            t2 = (self.bounds_max[node] - ray_origins) * inv_direction
+            t_near = np.minimum(t1, t2).max(axis=1)
+            t_far = np.maximum(t1, t2).min(axis=1)
+            rays = rays[(t_far >= np.maximum(t_near, 0.0)) & (t_near <= max_distance)]
+            if len(rays) == 0:
+                continue
+
+            count = self.counts[node]
+            if count == 0:
+                left, right = self.children[node]
+                stack.append((right, rays))
+                stack.append((left, rays))
+                continue
+
+            start = self.starts[node]
+            hits[rays] = self.intersect_triangles(origins[rays], direction, start, start + count, max_distance)
+
+        return hits
+
+    def intersect_triangles(self, origins: np.ndarray, direction: np.ndarray, start: int, end: int,
+                            max_distance=MAX_DISTANCE) -> np.ndarray:
+        """Vectorized Moller-Trumbore test of rays against a range of triangles.
+
+        :param origins: (N, 3) array of ray origins
+        :param direction: ray direction shared by all rays
+        :param start: first triangle index
+        :param end: last triangle index (exclusive)
+        :param max_distance: maximum distance for rays to check
+        :return: boolean array, True for each ray that hits any of the triangles
+        """
+        v0 = self.v0[start:end]
+        edge1 = self.edge1[start:end]
+        edge2 = self.edge2[start:end]
+
+        # per-triangle terms, as the direction is shared by all rays
+        pvec = np.cross(direction, edge2)
+        det = np.einsum('ij,ij->i', edge1, pvec)
+        valid = np.abs(det) > 1e-12
+        inv_det = np.where(valid, 1.0 / np.where(valid, det, 1.0), 0.0)
+
+        # per ray and triangle terms, shaped (rays, triangles, 3)
+        tvec = origins[:, None, :] - v0[None, :, :]
+        u = np.einsum('rtk,tk->rt', tvec, pvec) * inv_det
+        qvec = np.cross(tvec, edge1[None, :, :])
+        v = (qvec @ direction) * inv_det
+        t = np.einsum('rtk,tk->rt', qvec, edge2) * inv_det
+
+        hit = valid & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t > 0.0) & (t <= max_distance)
+        return hit.any(axis=1)
+
+
+class SceneOcclusion:
+    """Answers occlusion queries with one ``scene.ray_cast`` per ray."""
+
+    backend = 'SCENE'
+
+    def __init__(self, context):
+        self.scene = context.scene
+        self.depsgraph = context.evaluated_depsgraph_get()
+
+    def is_blocked(self, origin: Vector, direction: Vector, max_distance=MAX_DISTANCE) -> bool:
+        """Check if a given point is occluded in a given direction.
+
+        :param origin: given point in world space as a Vector
+        :param direction: given direction in world space as a Vector
+        :param max_distance: maximum distance for raycast to check
+        :return: True if anything is in that direction from that point, False otherwise
+        """
+        offset_origin = origin + direction * EPSILON
+        is_hit, _, _, _, _, _ = self.scene.ray_cast(self.depsgraph, offset_origin, direction,
+                                                    distance=max_distance)
+        return is_hit
+
+    def get_blocked(self, vertices, direction: Vector) -> np.ndarray:
+        """Checks which points are occluded in a given direction.
+
+        :param vertices: list of points in world space as Vectors
+        :param direction: given direction in world space as a Vector
+        :return: boolean array, True for each point that is occluded
+        """
+        return np.fromiter((self.is_blocked(v, direction) for v in vertices), dtype=bool, count=len(vertices))
+
+    def count_visible(self, vertices, direction: Vector) -> int:
+        """Counts the points that are not occluded in a given direction.
+
+        :param vertices: list of points in world space as Vectors
+        :param direction: given direction in world space as a Vector
+        :return: number of points that can "see" in that direction
+        """
+        return len(vertices) - int(np.count_nonzero(self.get_blocked(vertices, direction)))
+
+    def reserve(self, vertices, axis, angle: float):
+        """Prepares for rays cast from the vertices toward a cone of directions.
+
+        :param vertices: list of points in world space
+        :param axis: normalized axis of the direction cone
+        :param angle: half angle of the direction cone in radians
+        """
+
+
+class LocalOcclusion(SceneOcclusion, ABC):
+    """Answers occlusion queries against an acceleration structure of the geometry near the stroke.
+
+    The structure is rebuilt whenever reserve() includes more geometry.
+    Without a reserved stroke, the first query includes the whole scene.
+    """
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.local_scene = LocalScene(self.depsgraph)
+        self.is_built = False
+
+    def reserve(self, vertices, axis, angle: float):
+        if self.local_scene.reserve(vertices, axis, angle) or not self.is_built:
+            self.build()
+
+    def ensure_built(self):
+        if not self.is_built:
+            self.local_scene.reserve_all()
+            self.build()
+
+    def build(self):
+        self.build_tree(self.local_scene.instances)
+        self.is_built = True
+
+    @abstractmethod
+    def build_tree(self, instances: InstancedGeometry):
+        """Builds the acceleration structure from the included instances."""
+
+
+class BVHOcclusion(LocalOcclusion):
+    """Answers occlusion queries against BVH trees of the evaluated meshes.
+
+    Each mesh's tree is cached and shared by all of its instances, so queries skip the depsgraph lookups
+    that ``scene.ray_cast`` does for every ray, and trees are only built again once their mesh changes.
+    """
+
+    backend = 'BVH'
+
+    def build_tree(self, instances: InstancedGeometry):
+        self.instances = instances
+
+    def is_blocked(self, origin: Vector, direction: Vector, max_distance=MAX_DISTANCE) -> bool:
+        self.ensure_built()
+        offset_origin = origin + direction * EPSILON
+        return self.instances.ray_cast(offset_origin, direction, max_distance, any_hit=True) is not None
+
+
+def get_numpy_tree(geometry) -> TriangleBVH:
+    """Returns the NumPy BVH of a cached mesh's local triangles, building it on first use."""
+    tree = NUMPY_TREES.get(geometry)
+    if tree is None:
+        tree = NUMPY_TREES[geometry] = TriangleBVH(geometry.coords[geometry.triangles])
+    return tree
+
+
+class NumpyOcclusion(LocalOcclusion):
+    """Answers occlusion queries in batches, testing all rays for a direction in one call.
+
+    Like the BVH backend, each mesh's tree is built once in its local space and shared by all of its instances,
+    rays are transformed into each instance whose bounds they pass through.
+    """
+
+    backend = 'NUMPY'
+
+    def build_tree(self, instances: InstancedGeometry):
+        self.instances = instances
+
+    def is_blocked(self, origin: Vector, direction: Vector, max_distance=MAX_DISTANCE) -> bool:
+        return bool(self.get_blocked((origin,), direction, max_distance)[0])
+
+    def get_blocked(self, vertices, direction: Vector, max_distance=MAX_DISTANCE) -> np.ndarray:
+        self.ensure_built()
+        instances = self.instances
+        direction = np.asarray(direction, dtype=np.float64)
+        origins = np.array(vertices, dtype=np.float64).reshape(-1, 3) + direction * EPSILON
+        hits = np.zeros(len(origins), dtype=bool)
+        if len(origins) == 0 or len(instances) == 0:
+            return hits
+
+        directions = np.broadcast_to(direction, origins.shape)
+        for start, bounds_distances in instances.iter_bounds_distances(origins, directions):
+            is_candidate = bounds_distances <= max_distance
+            for index in np.flatnonzero(is_candidate.any(axis=0)):
+                rays = start + np.flatnonzero(is_candidate[:, index])
+                rays = rays[~hits[rays]]
+                if len(rays) == 0:
+                    continue
+
+                # the direction isn't normalized in local space, so hit distances stay in world units
+                inverse_matrix = np.array(instances.inverse_matrices[index])
+                local_origins = origins[rays] @ inverse_matrix[:3, :3].T + inverse_matrix[:3, 3]
+                local_direction = inverse_matrix[:3, :3] @ direction
+                if not local_direction.any():
+                    continue
+                tree = get_numpy_tree(instances.geometries[index])
+                hits[rays] = tree.intersects(local_origins, local_direction, max_distance, offset=0.0)
+
+        return hits
+
+
+class VisibilityCache:
+    """Remembers which stroke vertices are occluded in which sampled directions.
+
+    Results are stored as boolean matrices keyed by stroke vertex (rows) and sampled direction (columns),
+    so ranking directions again (e.g. after changing the elevation clamp or the average normal)
+    only casts rays for cells that were never tested.
+
+    Visibility counts per direction are kept up to date as vertices are painted or erased,
+    so each update only touches the vertices that changed since the last one.
+    """
+
+    def __init__(self, engine):
+        """
+        :param engine: occlusion engine to cast missing rays with
+        """
+        self.engine = engine
+
+        self.rows = {}
+        self.keys = []
+        self.columns = {}
+        self.directions = np.zeros((0, 3), dtype=np.float32)
+        self.blocked = np.zeros((0, 0), dtype=bool)
+        self.known = np.zeros((0, 0), dtype=bool)
+
+        # running state of the currently painted stroke
+        self.synced_keys = []
+        """Vertex keys of the stroke, as of the last update, or None if it was weighted."""
+        self.weights = np.zeros(0, dtype=np.int64)
+        """Number of stroke points each row's vertex stands for."""
+        self.visible_counts = np.zeros(0, dtype=np.int64)
+        """Number of stroke vertices known to see each direction."""
+        self.unknown_counts = np.zeros(0, dtype=np.int64)
+        """Number of stroke vertices that were never tested against each direction."""
+        self.recent_rows = np.zeros(0, dtype=np.int64)
+        """Rows added by the last update, which are the likeliest to be untested."""
+
+    def get_rows(self, keys: list[tuple]) -> np.ndarray:
+        """Returns the cache row of each vertex, adding rows for vertices never seen before.
+
+        :param keys: list of vertex coordinates as tuples
+        :return: integer array of row indices
+        """
+        rows = self.rows
+        for key in keys:
+            if key not in rows:
+                rows[key] = len(self.keys)
+                self.keys.append(key)
+
+        if len(self.keys) > len(self.blocked):
+            # grow geometrically, so painting one point at a time doesn't copy the matrices every event
+            capacity = max(len(self.keys), len(self.blocked) * 2)
+            self.blocked = self._grow(self.blocked, capacity)
+            self.known = self._grow(self.known, capacity)
+            self.weights = self._grow(self.weights, capacity)
+
+        return np.fromiter((rows[key] for key in keys), dtype=np.int64, count=len(keys))
+
+    def get_columns(self, directions: np.ndarray) -> np.ndarray:
+        """Returns the cache column of each direction, adding columns for directions never seen before.
+
+        :param directions: (D, 3) array of normalized directions
+        :return: integer array of column indices
+        """
+        directions = np.asarray(directions, dtype=np.float32).reshape(-1, 3)
+        columns = self.columns
+        keys = [tuple(d) for d in np.round(directions, DIRECTION_KEY_DECIMALS).tolist()]
+
+        new_directions = []
+        for key, direction in zip(keys, directions):
+            if key not in columns:
+                columns[key] = len(self.directions) + len(new_directions)
+                new_directions.append(direction)
+
+        if new_directions:
+            first_column = len(self.directions)
+            self.directions = np.concatenate((self.directions, new_directions))
+
+            if len(self.directions) > self.blocked.shape[1]:
+                capacity = max(len(self.directions), self.blocked.shape[1] * 2)
+                self.blocked = self._grow(self.blocked, capacity, axis=1)
+                self.known = self._grow(self.known, capacity, axis=1)
+                self.visible_counts = self._grow(self.visible_counts, capacity)
+                self.unknown_counts = self._grow(self.unknown_counts, capacity)
+
+            # every vertex of the current stroke is untested against the new directions
+            self.unknown_counts[first_column:len(self.directions)] = self.weights.sum()
+
+        return np.fromiter((columns[key] for key in keys), dtype=np.int64, count=len(keys))
+
+    def keep_columns(self, columns: np.ndarray):
+        """Forgets every sampled direction except the given ones, renumbering the columns kept.
+
+        :param columns: indices of the sampled directions to keep
+        """
+        columns = np.unique(columns)
+        keys_by_column = sorted(self.columns, key=self.columns.get)
+        self.columns = {keys_by_column[column]: index for index, column in enumerate(columns)}
+        self.directions = self.directions[columns]
+        self.blocked = self.blocked[:, columns]
+        self.known = self.known[:, columns]
+        self.visible_counts = self.visible_counts[columns]
+        self.unknown_counts = self.unknown_counts[columns]
+
+    @staticmethod
+    def _grow(array: np.ndarray, capacity: int, axis: int = 0) -> np.ndarray:
+        shape = list(array.shape)
+        shape[axis] = capacity
+        grown = np.zeros(shape, dtype=array.dtype)
+        grown[tuple(slice(0, size) for size in array.shape)] = array
+        return grown
+
+    def sync(self, vertices, weights: np.ndarray = None):
+        """Updates the running visibility counts to match the given stroke vertices.
+
+        Appending to the stroke (the common case while painting) only looks at the new vertices.
+        Any other change, like erasing, is found by comparing the stroke against the last update.
+
+        :param vertices: list of points in world space as Vectors
+        :param weights: number of stroke points each vertex stands for, defaults to one each
+        """
+        synced_keys = self.synced_keys
+
+        # the whole synced part must match, erasing can keep both ends of the stroke
+        is_appended = weights is None and synced_keys is not None and len(vertices) >= len(synced_keys) and (
+            all(tuple(v) == key for v, key in zip(vertices, synced_keys))
+        )
+
+        if is_appended:
+            added = [tuple(v) for v in vertices[len(synced_keys):]]
+            synced_keys.extend(added)
+            rows = self.get_rows(added)
+            self.update_counts(rows, 1)
+            self.recent_rows = np.unique(rows)
+            return
+
+        keys = [tuple(v) for v in vertices]
+        rows = self.get_rows(keys)
+        stroke_weights = np.bincount(rows, weights=weights, minlength=len(self.weights)).astype(np.int64)
+        difference = stroke_weights - self.weights
+        changed_rows = np.flatnonzero(difference)
+        self.update_counts(changed_rows, difference[changed_rows])
+        self.recent_rows = changed_rows[difference[changed_rows] > 0]
+        # weighted vertices can't be appended to, as appending points changes the weights of existing ones
+        self.synced_keys = keys if weights is None else None
+
+    def update_counts(self, rows: np.ndarray, weight):
+        """Adds rows to (or removes rows from) the running visibility counts.
+
+        :param rows: integer array of row indices, may contain duplicates
+        :param weight: number of stroke points to add for each row, negative to remove them
+        """
+        weight = np.broadcast_to(weight, rows.shape)
+        np.add.at(self.weights, rows, weight)
+        known = self.known[rows]
+        self.visible_counts += weight @ (known & ~self.blocked[rows])
+        self.unknown_counts += weight @ ~known
+
+    def cast(self, rows: np.ndarray, column: int):
+        """Casts rays for the untested cells of the given rows along one direction.
+
+        :param rows: integer array of row indices
+        :param column: index of the sampled direction
+        """
+        rows = rows[~self.known[rows, column]]
+        if len(rows) == 0:
+            return
+
+        direction = Vector(self.directions[column])
+        origins = [Vector(self.keys[row]) for row in rows]
+        blocked = self.engine.get_blocked(origins, direction)
+        self.blocked[rows, column] = blocked
+        self.known[rows, column] = True
+
+        weights = self.weights[rows]
+        self.visible_counts[column] += weights[~blocked].sum()
+        self.unknown_counts[column] -= weights.sum()
+
+    def get_untested_rows(self, column: int) -> np.ndarray:
+        """Returns the rows of the current stroke that were never tested against a direction.
+
+        :param column: index of the sampled direction
+        :return: integer array of row indices, starting with the rows added by the last update
+        """
+        recent_rows = self.recent_rows[self.weights[self.recent_rows] > 0]
+        rows = recent_rows[~self.known[recent_rows, column]]
+        if len(rows) == 0:
+            # older vertices may be untested too, if this direction wasn't needed before
+            rows = np.flatnonzero((self.weights > 0) & ~self.known[:, column])
+        return rows
+
+    def cast_next(self, column: int, max_rays: int = CAST_BATCH_SIZE):
+        """Casts rays for the next untested vertices of the stroke along one direction.
+
+        :param column: index of the sampled direction
+        :param max_rays: maximum number of rays to cast
+        """
+        self.cast(self.get_untested_rows(column)[:max_rays], column)
+
+    def get_max_visible(self, columns: np.ndarray) -> np.ndarray:
+        """Returns the most vertices that could see each direction, if every untested vertex can.
+
+        :param columns: indices of the sampled directions
+        :return: integer array with an upper bound of the visibility count for each given direction
+        """
+        return self.visible_counts[columns] + self.unknown_counts[columns]
+
+    def count_visible(self, vertices, columns: np.ndarray, weights: np.ndarray = None) -> np.ndarray:
+        """Counts the vertices that are not occluded along each of the given directions.
+
+        :param vertices: list of points in world space as Vectors
+        :param columns: indices of the sampled directions to count
+        :param weights: number of stroke points each vertex stands for, defaults to one each
+        :return: integer array with a visibility count for each given direction
+        """
+        self.sync(vertices, weights)
+
+        for column in columns[self.unknown_counts[columns] > 0]:
+            self.cast(self.get_untested_rows(column), column)
+            if self.unknown_counts[column] > 0:
+                self.cast(np.flatnonzero(self.weights > 0), column)
+
+        return self.visible_counts[columns]
+
+
+OCCLUSION_BACKENDS = {
+    'BVH': BVHOcclusion,
+    'NUMPY': NumpyOcclusion,
+    'SCENE': SceneOcclusion,
+}
+
+
+def get_occlusion_engine(context, backend: str, engine=None):
+    """Returns an occlusion engine for the given backend, reusing the given engine if it matches.
+
+    :param context: Blender context
+    :param backend: key of OCCLUSION_BACKENDS
+    :param engine: previously built engine, if any
+    :return: occlusion engine
+    """
+    if engine is not None and engine.backend == backend:
+        return engine
+    return OCCLUSION_BACKENDS[backend](context)
@@ -0,0 +1,178 @@
+#     Light Painter, Blender add-on that creates lights based on where the user paints.
+#     Copyright (C) 2024 Spencer Magnusson
+#     semagnum@gmail.com
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import bpy
+from mathutils import Vector
+import numpy as np
+
+from .mesh_cache import InstancedGeometry
+from .occlusion import GEOMETRY_TYPES
+
+MESH_DATA_NAME = 'LightPaint_Convex'
+TUBE_DATA_NAME = 'LightPaint_Tube'
+FLAG_DATA_NAME = 'LightPaint_Flag'
+OUTPUT_DATA_NAMES = (MESH_DATA_NAME, TUBE_DATA_NAME, FLAG_DATA_NAME)
+"""Names of the meshes Light Painter tools create, which are never painted on."""
+
+ACTIVE_TARGETS = []
+"""Paint targets of running tools, checked for changes after every depsgraph update."""
+
+
+def get_instance_names(instance) -> set[str]:
+    """Names of the objects an evaluated instance depends on: itself and, for instances, its instancer."""
+    names = {instance.object.original.name}
+    if instance.is_instance:
+        names.add(instance.parent.original.name)
+    return names
+
+
+def is_output(obj) -> bool:
+    """Returns True if the object is geometry created by a Light Painter tool."""
+    return obj.data is not None and obj.data.name.startswith(OUTPUT_DATA_NAMES)
+
+
+def get_filter_names(context, target_filter: str):
+    """Names of the objects allowed by a paint target filter.
+
+    :param context: Blender context
+    :param target_filter: 'COLLECTION', 'SELECTED' or 'SCENE'
+
+    :return: set of object names, or None if any object is allowed
+    """
+    if target_filter == 'COLLECTION':
+        return {obj.name for obj in context.collection.all_objects}
+    if target_filter == 'SELECTED':
+        return {obj.name for obj in context.selected_objects}
+    return None
+
+
+def invalidate_changed_targets(_scene, depsgraph):
+    """Handler for depsgraph_update_post, marking paint targets dirty when their geometry changes."""
+    for targets in ACTIVE_TARGETS:
+        targets.check_updates(depsgraph)
+
+
+class PaintTargets:
+    """BVH trees of the geometry a tool paints on, answering paint ray casts without ``scene.ray_cast``.
+
+    The paintable objects are chosen when the tool starts, so objects the tool itself adds are never painted on.
+    Neither are lights created by earlier sessions. While the tool runs,
+    the instances are gathered again only after one of the paintable objects changes.
+    Mesh trees come from the mesh cache, so they are shared between instances and tool sessions.
+    """
+
+    def __init__(self, context, target_filter: str = 'SCENE'):
+        """Finds the paintable objects and gathers their instances.
+
+        :param context: Blender context
+        :param target_filter: 'COLLECTION' for the active collection, 'SELECTED' for selected objects,
+            'SCENE' for everything
+        """
+        depsgraph = context.evaluated_depsgraph_get()
+        self.filter_names = get_filter_names(context, target_filter)
+        self.object_names = None
+        self.object_names = set().union(*(
+            get_instance_names(instance) for instance in depsgraph.object_instances if self.is_target(instance)
+        ))
+
+        self.instances = InstancedGeometry()
+        self.is_dirty = True
+
+        ACTIVE_TARGETS.append(self)
+        if invalidate_changed_targets not in bpy.app.handlers.depsgraph_update_post:
+            bpy.app.handlers.depsgraph_update_post.append(invalidate_changed_targets)
+
+        self.build(depsgraph)
+
+    def is_target(self, instance) -> bool:
+        """Returns True if an evaluated object instance can be painted on."""
+        if instance.object.type not in GEOMETRY_TYPES or is_output(instance.object.original):
+            return False
+
+        # objects added after the tool started are never painted on
+        names = get_instance_names(instance)
+        if self.object_names is not None and names.isdisjoint(self.object_names):
+            return False
+        return self.filter_names is None or not names.isdisjoint(self.filter_names)
+
+    def free(self):
+        """Stops tracking changes, once the tool finishes."""
+        if self in ACTIVE_TARGETS:
+            ACTIVE_TARGETS.remove(self)
+        if not ACTIVE_TARGETS and invalidate_changed_targets in bpy.app.handlers.depsgraph_update_post:
+            bpy.app.handlers.depsgraph_update_post.remove(invalidate_changed_targets)
+        self.instances = InstancedGeometry()
+
+    def check_updates(self, depsgraph):
+        """Marks the instances dirty if any paintable object's geometry or transform changed.
+
+        :param depsgraph: the depsgraph that was just updated
+        """
+        if self.is_dirty:
+            return
+
+        for update in depsgraph.updates:
+            if (isinstance(update.id, bpy.types.Object) and update.id.original.name in self.object_names and
+                    (update.is_updated_geometry or update.is_updated_transform)):
+                self.is_dirty = True
+                return
+
+    def build(self, depsgraph):
+        """Gathers the instances of all paintable geometry.
+
+        :param depsgraph: the evaluated scene dependency graph
+        """
+        self.instances = InstancedGeometry()
+        for instance in depsgraph.object_instances:
+            if self.is_target(instance):
+                self.instances.add(instance)
+        self.is_dirty = False
+
+    def ray_cast(self, context, origin: Vector, direction: Vector, distance: float):
+        """Casts a paint ray against the paintable geometry, gathering the instances again first if they changed.
+
+        :param context: Blender context, for the evaluated depsgraph
+        :param origin: ray origin in world space
+        :param direction: ray direction in world space
+        :param distance: maximum distance of the ray
+
+        :return: tuple of whether anything was hit, the hit location and the surface normal
+        """
+        if self.is_dirty:
+            self.build(context.evaluated_depsgraph_get())
+
+        hit = self.instances.ray_cast(origin, direction, distance)
+        if hit is None:
+            return False, None, None
+        location, normal, _ = hit
+        return True, location, normal
+
+    def ray_cast_many(self, context, origins: np.ndarray, directions: np.ndarray,
+                      distance: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Casts many paint rays in one batch, gathering the instances again first if they changed.
+
+        :param context: Blender context, for the evaluated depsgraph
+        :param origins: (N, 3) array of ray origins in world space
+        :param directions: (N, 3) array of ray directions in world space
+        :param distance: maximum distance of the rays
+
+        :return: tuple of a boolean array, True for each ray that hit, and (N, 3) arrays of hit locations and normals
+        """
+        if self.is_dirty:
+            self.build(context.evaluated_depsgraph_get())
+
+        return self.instances.ray_cast_many(origins, directions, distance)
@@ -32,6 +32,42 @@ def offset_prop(obj_descriptor, default_val: float = 1.0) -> bpy.props.FloatProp
     )
 
 
+def ray_budget_prop() -> bpy.props.IntProperty:
+    """Returns property to limit how many directions occlusion testing tries."""
+    return bpy.props.IntProperty(
+        name='Ray Budget',
+        description='Maximum number of directions each painted point is tested against. '
+                    'Increasing the budget improves precision at the cost of processing time',
+        min=8,
+        default=24,
+    )
+
+
+def max_points_prop() -> bpy.props.IntProperty:
+    """Returns property to limit how many painted points occlusion testing casts rays from."""
+    return bpy.props.IntProperty(
+        name='Max Points',
+        description='Maximum number of painted points tested for occlusion. '
+                    'Beyond it, nearby points are grouped together and tested once',
+        min=1,
+        default=512,
+    )
+
+
+def occlusion_backend_prop() -> bpy.props.EnumProperty:
+    """Returns property to choose how occlusion rays are cast."""
+    return bpy.props.EnumProperty(
+        name='Occlusion Backend',
+        description='How rays are cast when testing occlusion',
+        items=(
+            ('BVH', 'BVH Tree', 'Builds a BVH tree of the scene once per session and casts rays against it'),
+            ('NUMPY', 'Batched', 'Exports scene triangles once per session and tests all rays of a direction at once'),
+            ('SCENE', 'Scene', 'Casts every ray against the full scene'),
+        ),
+        default='BVH',
+    )
+
+
 def convert_val_to_unit_str(val, unit_category, precision=5):
     context = bpy.context
     scene = context.scene
@@ -4,11 +4,14 @@ import bpy
 from mathutils import Vector
 
 from .base_tool import BaseLightPaintTool
-from .lamp_util import get_average_normal, get_occlusion_based_normal, PI_OVER_2
-from .prop_util import axis_prop, convert_val_to_unit_str, get_drag_mode_header
+from .lamp_util import get_average_normal, get_occlusion_based_normal, get_visibility_cache, PI_OVER_2
+from .prop_util import (
+    axis_prop, convert_val_to_unit_str, get_drag_mode_header, max_points_prop, occlusion_backend_prop,
+    ray_budget_prop
+)
 from .visibility import VisibilitySettings
-from ..axis import prep_stroke
-from ..keymap import get_kmi_str, is_event_command
+from ..solve import get_sun_rotation
+from ..keymap import get_kmi_str
 if bpy.app.version >= (4, 1):
     from bpy.app.translations import pgettext_rpt as rpt_
 else:
@@ -36,21 +39,9 @@ class LIGHTPAINTER_OT_Sky(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
         default='OCCLUSION'
     )
 
-    longitude_samples: bpy.props.IntProperty(
-        name='Azimuth Samples',
-        description='Samples of normals around the azimuth. '
-                    'Increasing samples improves precision at the cost of processing time',
-        min=4,
-        default=6,
-    )
+    ray_budget: ray_budget_prop()
 
-    latitude_samples: bpy.props.IntProperty(
-        name='Elevation Samples',
-        description='Samples of normals from the horizon to the maximum elevation. '
-                    'Increasing samples improves precision at the cost of processing time',
-        min=3,
-        default=6,
-    )
+    max_points: max_points_prop()
 
     elevation_clamp: bpy.props.FloatProperty(
         name='Max Sun Elevation',
@@ -63,6 +54,8 @@ class LIGHTPAINTER_OT_Sky(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
         subtype='ANGLE'
     )
 
+    occlusion_backend: occlusion_backend_prop()
+
     texture_type: bpy.props.EnumProperty(
         name='Sky Model',
         description='Model used by sky texture node',
@@ -100,9 +93,10 @@ class LIGHTPAINTER_OT_Sky(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
 
         col = layout.column()
         col.active = self.normal_method == 'OCCLUSION'
-        col.prop(self, 'longitude_samples')
-        col.prop(self, 'latitude_samples')
+        col.prop(self, 'ray_budget')
+        col.prop(self, 'max_points')
         col.prop(self, 'elevation_clamp', slider=True)
+        col.prop(self, 'occlusion_backend')
 
         layout.separator()
 
@@ -120,18 +114,18 @@ class LIGHTPAINTER_OT_Sky(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
     def extra_paint_controls(self, context, event):
         mouse_x = event.mouse_x
 
-        if is_event_command(event, 'TYPE_TOGGLE'):
+        if 'TYPE_TOGGLE' in self.event_commands:
             self.texture_type = 'NISHITA' if self.texture_type == 'PREETHAM' else 'PREETHAM'
 
-        elif is_event_command(event, 'SIZE_MODE'):
+        elif 'SIZE_MODE' in self.event_commands:
             self.set_drag_attr('size', mouse_x, drag_increment=0.01, drag_precise_increment=0.001)
 
-        elif is_event_command(event, 'POWER_MODE'):
+        elif 'POWER_MODE' in self.event_commands:
             self.set_drag_attr('power', mouse_x)
 
-        elif self.check_axis_event(event):
+        elif self.check_axis_event():
             pass  # if True, Event is handled
-        elif self.check_visibility_event(event):
+        elif self.check_visibility_event():
             pass  # if True, event is handled
         else:
             return False
@@ -207,15 +201,10 @@ class LIGHTPAINTER_OT_Sky(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
         world_data.scatter = self.visible_volume
 
     def update_light(self, context):
-        stroke_vertices = [coord for stroke in self.mouse_path for coord, normal in stroke]
-        stroke_normals = [normal for stroke in self.mouse_path for coord, normal in stroke]
-        vertices, normals, _ = prep_stroke(
-            context, stroke_vertices, stroke_normals,
-            self.axis, 0.0
-        )
+        vertices, normals, _ = self.prepared_stroke.prepare(context, self.mouse_path, self.axis, 0.0)
 
         # skip if no strokes are currently drawn
-        if len(stroke_vertices) == 0:
+        if len(vertices) == 0:
             return {'CANCELLED'}
 
         try:
@@ -226,13 +215,16 @@ class LIGHTPAINTER_OT_Sky(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
 
         if self.normal_method == 'OCCLUSION':
             try:
+                self.visibility_cache = get_visibility_cache(context, self.occlusion_backend,
+                                                             self.visibility_cache)
                 sun_normal = get_occlusion_based_normal(
                     context, vertices, avg_normal,
-                    self.elevation_clamp, self.latitude_samples, self.longitude_samples
+                    self.elevation_clamp, self.ray_budget,
+                    cache=self.visibility_cache, max_points=self.max_points
                 )
             except ValueError:
                 self.report({'ERROR'}, 'No valid directions found '
-                                       '(add more samples or increase the elevation clamp!), using average normal')
+                                       '(increase the ray budget or the elevation clamp!), using average normal')
                 sun_normal = Vector(avg_normal)
         else:
             sun_normal = Vector(avg_normal)
@@ -242,6 +234,8 @@ class LIGHTPAINTER_OT_Sky(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
         return {'FINISHED'}
 
     def startup_callback(self, context):
+        self.visibility_cache = None
+
         new_world = context.blend_data.worlds.new(WORLD_DATA_NAME)
         self.prev_world = context.scene.world
         context.scene.world = new_world
@@ -279,21 +273,9 @@ class LIGHTPAINTER_OT_Sun(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
         default='OCCLUSION'
     )
 
-    longitude_samples: bpy.props.IntProperty(
-        name='Azimuth Samples',
-        description='Samples of normals around the azimuth. '
-                    'Increasing samples improves precision at the cost of processing time',
-        min=4,
-        default=6,
-    )
+    ray_budget: ray_budget_prop()
 
-    latitude_samples: bpy.props.IntProperty(
-        name='Elevation Samples',
-        description='Samples of normals from the horizon to the maximum elevation. '
-                    'Increasing samples improves precision at the cost of processing time',
-        min=3,
-        default=6,
-    )
+    max_points: max_points_prop()
 
     elevation_clamp: bpy.props.FloatProperty(
         name='Max Sun Elevation',
@@ -306,6 +288,8 @@ class LIGHTPAINTER_OT_Sun(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
         subtype='ANGLE'
     )
 
+    occlusion_backend: occlusion_backend_prop()
+
     # SUN
     light_color: bpy.props.FloatVectorProperty(
         name='Color',
@@ -342,9 +326,10 @@ class LIGHTPAINTER_OT_Sun(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
 
         col = layout.column()
         col.active = self.normal_method == 'OCCLUSION'
-        col.prop(self, 'longitude_samples')
-        col.prop(self, 'latitude_samples')
+        col.prop(self, 'ray_budget')
+        col.prop(self, 'max_points')
         col.prop(self, 'elevation_clamp', slider=True)
+        col.prop(self, 'occlusion_backend')
 
         layout.separator()
 
@@ -363,15 +348,15 @@ class LIGHTPAINTER_OT_Sun(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
     def extra_paint_controls(self, context, event):
         mouse_x = event.mouse_x
 
-        if is_event_command(event, 'SIZE_MODE'):
+        if 'SIZE_MODE' in self.event_commands:
             self.set_drag_attr('angle', mouse_x, drag_increment=0.01, drag_precise_increment=0.001)
 
-        elif is_event_command(event, 'POWER_MODE'):
+        elif 'POWER_MODE' in self.event_commands:
             self.set_drag_attr('power', mouse_x, drag_increment=1, drag_precise_increment=0.1)
 
-        elif self.check_axis_event(event):
+        elif self.check_axis_event():
             pass  # if True, event is handled
-        elif self.check_visibility_event(event):
+        elif self.check_visibility_event():
             pass  # if True, event is handled
 
         else:
@@ -406,15 +391,10 @@ class LIGHTPAINTER_OT_Sun(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
         )
 
     def update_light(self, context):
-        stroke_vertices = [coord for stroke in self.mouse_path for coord, normal in stroke]
-        stroke_normals = [normal for stroke in self.mouse_path for coord, normal in stroke]
-        vertices, normals, _ = prep_stroke(
-            context, stroke_vertices, stroke_normals,
-            self.axis, 0.0
-        )
+        vertices, normals, _ = self.prepared_stroke.prepare(context, self.mouse_path, self.axis, 0.0)
 
         # skip if no strokes are currently drawn
-        if len(stroke_vertices) == 0:
+        if len(vertices) == 0:
             return {'CANCELLED'}
 
         try:
@@ -425,21 +405,21 @@ class LIGHTPAINTER_OT_Sun(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
 
         if self.normal_method == 'OCCLUSION':
             try:
+                self.visibility_cache = get_visibility_cache(context, self.occlusion_backend,
+                                                             self.visibility_cache)
                 sun_normal = get_occlusion_based_normal(
                     context, vertices, avg_normal,
-                    self.elevation_clamp, self.latitude_samples, self.longitude_samples
+                    self.elevation_clamp, self.ray_budget,
+                    cache=self.visibility_cache, max_points=self.max_points
                 )
             except ValueError:
                 self.report({'ERROR'}, 'No valid directions found '
-                                       '(add more samples or increase the elevation clamp!), using average normal')
+                                       '(increase the ray budget or the elevation clamp!), using average normal')
                 sun_normal = Vector(avg_normal)
         else:
             sun_normal = Vector(avg_normal)
 
-        sun_normal.negate()
-
-        # rotation difference
-        rotation = Vector((0.0, 0.0, -1.0)).rotation_difference(sun_normal).to_euler()
+        rotation = get_sun_rotation(sun_normal)
         center = context.scene.cursor.location
 
         if not context.active_object or context.active_object.type != 'LIGHT' or context.active_object.data.type != 'SUN':
@@ -458,6 +438,8 @@ class LIGHTPAINTER_OT_Sun(bpy.types.Operator, BaseLightPaintTool, VisibilitySett
         return {'FINISHED'}
 
     def startup_callback(self, context):
+        self.visibility_cache = None
+
         center = context.scene.cursor.location
         bpy.ops.object.light_add(type='SUN', align='WORLD', location=center, scale=(1, 1, 1))
 
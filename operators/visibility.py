@@ -34,13 +34,25 @@ class VisibilitySettings:
         col.prop(self, 'visible_volume')
 
     def set_visibility(self, obj):
-        obj.visible_camera = self.visible_camera
-        obj.visible_diffuse = self.visible_diffuse
-        obj.visible_glossy = self.visible_specular
-        obj.visible_volume_scatter = self.visible_volume
-
-        if obj.type == 'LIGHT':
-            light_data = obj.data
-            light_data.diffuse_factor = 1.0 if self.visible_diffuse else 0.0
-            light_data.specular_factor = 1.0 if self.visible_specular else 0.0
-            light_data.volume_factor = 1.0 if self.visible_volume else 0.0
+        set_visibility(obj, self.visible_camera, self.visible_diffuse, self.visible_specular, self.visible_volume)
+
+
+def set_visibility(obj, camera: bool, diffuse: bool, specular: bool, volume: bool):
+    """Sets which rays see an object, and for lights, which kinds of light they emit.
+
+    :param obj: Blender object
+    :param camera: visible to the camera
+    :param diffuse: visible to (and for lights, emitting) diffuse light
+    :param specular: visible to (and for lights, emitting) specular light
+    :param volume: visible to (and for lights, emitting) volume scattering
+    """
+    obj.visible_camera = camera
+    obj.visible_diffuse = diffuse
+    obj.visible_glossy = specular
+    obj.visible_volume_scatter = volume
+
+    if obj.type == 'LIGHT':
+        light_data = obj.data
+        light_data.diffuse_factor = 1.0 if diffuse else 0.0
+        light_data.specular_factor = 1.0 if specular else 0.0
+        light_data.volume_factor = 1.0 if volume else 0.0
@@ -139,8 +139,8 @@ class VIEW3D_T_sky_paint(bpy.types.WorkSpaceTool):
 
             col = layout.column()
             col.active = props.normal_method == 'OCCLUSION'
-            col.prop(props, 'longitude_samples')
-            col.prop(props, 'latitude_samples')
+            col.prop(props, 'ray_budget')
+            col.prop(props, 'max_points')
             col.prop(props, 'elevation_clamp', slider=True)
 
 
@@ -168,8 +168,8 @@ class VIEW3D_T_sun_paint(bpy.types.WorkSpaceTool):
 
             col = layout.column()
             col.active = props.normal_method == 'OCCLUSION'
-            col.prop(props, 'longitude_samples')
-            col.prop(props, 'latitude_samples')
+            col.prop(props, 'ray_budget')
+            col.prop(props, 'max_points')
             col.prop(props, 'elevation_clamp', slider=True)
 
 
@@ -1,7 +1,7 @@
 import bpy
 from rna_keymap_ui import _indented_layout
 
-from .keymap import PREFIX
+from .keymap import KEYMAP_DISPATCH, PREFIX
 
 
 KEYMAP_NAME = '3D View Generic'
@@ -60,12 +60,78 @@ class VIEW3D_AddonPreferences(bpy.types.AddonPreferences):
         precision=1,
     )
 
+    paint_target: bpy.props.EnumProperty(
+        name='Paint On',
+        description='Objects that strokes can be painted on',
+        items=(
+            ('SCENE', 'Scene', 'All visible objects, except the lights Light Painter creates'),
+            ('COLLECTION', 'Active Collection', 'Objects in the active collection, except Light Painter lights'),
+            ('SELECTED', 'Selected Objects', 'Objects selected when the tool starts, except Light Painter lights'),
+        ),
+        default='SCENE',
+    )
+
+    stroke_spacing: bpy.props.FloatProperty(
+        name='Stroke Spacing',
+        description=('Fill gaps between cursor positions with points this far apart, '
+                     'so fast strokes are as dense as slow ones. Zero disables filling'),
+        default=0.0,
+        min=0.0,
+        soft_max=100.0,
+        subtype='PIXEL',
+    )
+
+    min_world_spacing: bpy.props.FloatProperty(
+        name='Minimum Spacing',
+        description='Skip painted points closer than this to the previous point. Zero keeps every point',
+        default=0.0,
+        min=0.0,
+        soft_max=1.0,
+        subtype='DISTANCE',
+    )
+
+    min_screen_spacing: bpy.props.FloatProperty(
+        name='Minimum Screen Spacing',
+        description='Skip painted points fewer pixels than this from the previous point. Zero keeps every point',
+        default=0.0,
+        min=0.0,
+        soft_max=50.0,
+        subtype='PIXEL',
+    )
+
+    simplify_tolerance: bpy.props.FloatProperty(
+        name='Simplify Strokes',
+        description=('Once a stroke is painted, remove points that stray less than this from a simpler line. '
+                     'Zero keeps every point'),
+        default=0.0,
+        min=0.0,
+        soft_max=0.1,
+        subtype='DISTANCE',
+    )
+
+    deferred_projection: bpy.props.BoolProperty(
+        name='Project on Stroke End',
+        description=('Only record the cursor while painting, and find where the stroke lands once it ends. '
+                     'Keeps painting smooth in scenes that are slow to ray cast'),
+        default=False,
+    )
+
     def draw(self, context):
         layout = self.layout
 
         layout.use_property_split = True
         layout.use_property_decorate = False
 
+        layout.prop(self, 'paint_target')
+        layout.prop(self, 'stroke_spacing')
+
+        col = layout.column(align=True)
+        col.prop(self, 'min_world_spacing')
+        col.prop(self, 'min_screen_spacing', text='Screen')
+        col.prop(self, 'simplify_tolerance')
+
+        layout.prop(self, 'deferred_projection')
+
         layout.label(text='Tools Keymap')
 
         col = layout.column(align=True, heading='Display')
@@ -83,6 +149,9 @@ class VIEW3D_AddonPreferences(bpy.types.AddonPreferences):
         keymap = context.window_manager.keyconfigs.user.keymaps[KEYMAP_NAME]
         light_painter_kmi = get_lightpainter_kmi(context)
 
+        # the items below can be edited, so running tools compile their keymap again
+        KEYMAP_DISPATCH.invalidate()
+
         for item in light_painter_kmi:
             self.draw_item(context, col, item, keymap)
 
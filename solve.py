@@ -0,0 +1,550 @@
+#     Light Painter, Blender add-on that creates lights based on where the user paints.
+#     Copyright (C) 2024 Spencer Magnusson
+#     semagnum@gmail.com
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Lamp placement math on NumPy arrays.
+
+This module depends on neither Blender nor the rest of the add-on,
+so it can be imported (and profiled) on its own:
+with the directory containing the ``lightpainter`` add-on on ``sys.path``, ``import lightpainter.solve``.
+Without Blender, the package skips importing its operators and UI.
+Points and normals are (N, 3) float arrays, rotations are XYZ Euler angles
+following Blender's conventions, so results can be assigned to objects as they are.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+AXES = {'X': (1.0, 0.0, 0.0), 'Y': (0.0, 1.0, 0.0), 'Z': (0.0, 0.0, 1.0)}
+"""List of arbitrary axes and their given vector."""
+DOWN = np.array((0.0, 0.0, -1.0))
+"""Direction lamps face when they aren't rotated."""
+UP = np.array((0.0, 0.0, 1.0))
+
+FLT_EPSILON = float(np.finfo(np.float32).eps)
+"""Blender's tolerance for degenerate rotations."""
+
+NORMAL_ERROR = 'Average of normals results in a zero vector - unable to calculate average direction!'
+CAMERA_ERROR = 'Set a camera for your scene to use rim lighting!'
+ANGLE_ERROR = 'Zero length vectors have no valid angle'
+
+
+class AreaPlacement(NamedTuple):
+    location: np.ndarray
+    rotation: np.ndarray
+    size: tuple[float, float]
+    """Length and width of the fitted rectangle."""
+
+
+class SpotPlacement(NamedTuple):
+    location: np.ndarray
+    rotation: np.ndarray
+    spot_size: float
+    """Cone angle, in radians."""
+
+
+def as_points(values) -> np.ndarray:
+    """Converts a sequence of 3D coordinates (arrays, tuples or Vectors) to an (N, 3) float array.
+
+    Float arrays are returned as views, so stroke buffers are not copied.
+    """
+    if isinstance(values, np.ndarray) and values.dtype in (np.float32, np.float64):
+        return values.reshape(-1, 3)
+    return np.asarray(values, dtype=np.float64).reshape(-1, 3)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Normalizes vectors along the last axis, leaving zero vectors as they are."""
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, lengths, out=np.zeros_like(vectors), where=lengths > 0.0)
+
+
+def calc_power(power: float, distance: float) -> float:
+    """Calculates relative light power based on inverse square law.
+    relative power = initial power * squared distance
+
+    :param power: light value at 1m.
+    :param distance: distance from the light to the target object.
+    :return: light power relative to distance
+    """
+    return power * (distance * distance)
+
+
+def average_normal(normals) -> np.ndarray:
+    """Calculates average normal. Handles zero vector edge case as an error.
+
+    :param normals: (N, 3) array of normal vectors
+    :return: normalized (3,) array representing the average
+    """
+    avg_normal = normalize(as_points(normals).sum(axis=0))
+    if not avg_normal.any():
+        raise ValueError(NORMAL_ERROR)
+
+    return avg_normal
+
+
+def angle_between(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Angle between normalized vectors, precise for both small and large angles.
+
+    :param a: (..., 3) array of normalized vectors
+    :param b: (..., 3) array of normalized vectors
+    :return: angles in radians
+    """
+    dot = np.sum(a * b, axis=-1)
+    same_side = 2.0 * np.arcsin(np.minimum(np.linalg.norm(b - a, axis=-1) / 2.0, 1.0))
+    opposite_side = np.pi - 2.0 * np.arcsin(np.minimum(np.linalg.norm(b + a, axis=-1) / 2.0, 1.0))
+    return np.where(dot >= 0.0, same_side, opposite_side)
+
+
+def rotation_difference(source, target) -> np.ndarray:
+    """Shortest rotation from one direction to another, like mathutils' `Vector.rotation_difference`.
+
+    :param source: (..., 3) directions to rotate from
+    :param target: (..., 3) directions to rotate to
+    :return: (..., 3, 3) rotation matrices
+    """
+    source, target = np.broadcast_arrays(normalize(np.asarray(source, dtype=np.float64)),
+                                         normalize(np.asarray(target, dtype=np.float64)))
+
+    axis = np.cross(source, target)
+    axis_length = np.linalg.norm(axis, axis=-1)
+    angle = angle_between(source, target)
+
+    # same or opposite directions: any axis orthogonal to the source works
+    is_parallel = axis_length <= FLT_EPSILON
+    axis = np.where(is_parallel[..., None], get_orthogonal(source), normalize(axis))
+    is_opposite = is_parallel & (np.sum(source * target, axis=-1) <= 0.0)
+    # Blender's single precision pi, so half turns resolve to the same Euler angles
+    angle = np.where(is_opposite, float(np.float32(np.pi)), np.where(is_parallel, 0.0, angle))
+
+    return axis_angle_to_matrix(axis, angle)
+
+
+def get_orthogonal(vectors: np.ndarray) -> np.ndarray:
+    """Normalized vectors orthogonal to the given ones, picked like Blender's `ortho_v3_v3`.
+
+    :param vectors: (..., 3) array of vectors
+    :return: (..., 3) array of normalized vectors
+    """
+    x, y, z = np.moveaxis(vectors, -1, 0)
+    abs_x, abs_y, abs_z = np.abs((x, y, z))
+    dominant_axis = np.where(abs_x > abs_y, np.where(abs_x > abs_z, 0, 2), np.where(abs_y > abs_z, 1, 2))
+    candidates = np.stack((
+        np.stack((-y - z, x, x), axis=-1),
+        np.stack((y, -x - z, y), axis=-1),
+        np.stack((z, z, -x - y), axis=-1),
+    ), axis=-2)
+    orthogonal = np.take_along_axis(candidates, dominant_axis[..., None, None], axis=-2)[..., 0, :]
+    return normalize(orthogonal)
+
+
+def axis_angle_to_matrix(axis: np.ndarray, angle) -> np.ndarray:
+    """Rotation matrices around normalized axes.
+
+    :param axis: (..., 3) array of normalized axes
+    :param angle: angles in radians
+    :return: (..., 3, 3) rotation matrices
+    """
+    x, y, z = np.moveaxis(np.asarray(axis, dtype=np.float64), -1, 0)
+    cos, sin = np.cos(angle), np.sin(angle)
+    t = 1.0 - cos
+    return np.stack((
+        np.stack((t * x * x + cos, t * x * y - sin * z, t * x * z + sin * y), axis=-1),
+        np.stack((t * x * y + sin * z, t * y * y + cos, t * y * z - sin * x), axis=-1),
+        np.stack((t * x * z - sin * y, t * y * z + sin * x, t * z * z + cos), axis=-1),
+    ), axis=-2)
+
+
+def rotation_z(angle: float) -> np.ndarray:
+    """Rotation matrix around the Z axis, like `Matrix.Rotation(angle, 3, 'Z')`."""
+    cos, sin = np.cos(angle), np.sin(angle)
+    return np.array(((cos, -sin, 0.0), (sin, cos, 0.0), (0.0, 0.0, 1.0)))
+
+
+def matrix_to_euler(matrix: np.ndarray) -> np.ndarray:
+    """XYZ Euler angles of rotation matrices, picking the same solution as `Matrix.to_euler()`.
+
+    :param matrix: (..., 3, 3) rotation matrices
+    :return: (..., 3) array of Euler angles in radians
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    matrix = matrix / np.linalg.norm(matrix, axis=-2, keepdims=True)
+    m = {(row, column): matrix[..., row, column] for row in range(3) for column in range(3)}
+
+    cy = np.hypot(m[0, 0], m[1, 0])
+    euler = np.stack((
+        np.arctan2(m[2, 1], m[2, 2]),
+        np.arctan2(-m[2, 0], cy),
+        np.arctan2(m[1, 0], m[0, 0]),
+    ), axis=-1)
+    flipped = np.stack((
+        np.arctan2(-m[2, 1], -m[2, 2]),
+        np.arctan2(-m[2, 0], -cy),
+        np.arctan2(-m[1, 0], -m[0, 0]),
+    ), axis=-1)
+    gimbal_locked = np.stack((np.arctan2(-m[1, 2], m[1, 1]), np.arctan2(-m[2, 0], cy), np.zeros_like(cy)), axis=-1)
+
+    # both describe the same rotation, the one with the smallest angles is returned
+    is_flipped = np.abs(euler).sum(axis=-1) > np.abs(flipped).sum(axis=-1)
+    euler = np.where(is_flipped[..., None], flipped, euler)
+    return np.where((cy > 16.0 * FLT_EPSILON)[..., None], euler, gimbal_locked)
+
+
+def direction_to_euler(direction) -> np.ndarray:
+    """Euler rotation turning a lamp (which faces down) towards a direction.
+
+    :param direction: (..., 3) directions the lamp should face
+    :return: (..., 3) array of Euler angles in radians
+    """
+    return matrix_to_euler(rotation_difference(DOWN, direction))
+
+
+def convex_hull_2d(points: np.ndarray) -> np.ndarray:
+    """Indices of the convex hull of 2D points, counter-clockwise from the lowest point,
+    in the same order as `mathutils.geometry.convex_hull_2d`.
+
+    :param points: (N, 2) array of points
+    :return: integer array of hull point indices
+    """
+    order = np.lexsort((points[:, 0], points[:, 1]))
+
+    def get_chain(indices):
+        chain = []
+        for index in indices:
+            while len(chain) >= 2:
+                origin, a, b = points[chain[-2]], points[chain[-1]], points[index]
+                if (a[0] - origin[0]) * (b[1] - origin[1]) - (a[1] - origin[1]) * (b[0] - origin[0]) < 0.0:
+                    break
+                chain.pop()
+            chain.append(index)
+        return chain
+
+    if len(order) < 3:
+        return order
+
+    hull = get_chain(order)[:-1] + get_chain(order[::-1])[:-1]
+    # the chains go clockwise, flip them around the starting point
+    return np.array(hull[:1] + hull[:0:-1], dtype=np.int64)
+
+
+def box_fit_2d(points: np.ndarray) -> float:
+    """Angle of the smallest rectangle around 2D points, like `mathutils.geometry.box_fit_2d`.
+
+    When several rectangles are the smallest (e.g. around a triangle), any of them may be picked.
+
+    :param points: (N, 2) array of points
+    :return: angle in radians to rotate the points by, so the rectangle is axis aligned
+    """
+    hull = points[convex_hull_2d(points)]
+    edges = np.roll(hull, -1, axis=0) - hull
+    edge_lengths = np.linalg.norm(edges, axis=1)
+    edges = edges[edge_lengths > 0.0] / edge_lengths[edge_lengths > 0.0, None]
+    if len(edges) == 0:
+        return 0.0
+
+    # rotate every hull point onto every edge at once
+    x = edges[:, None, 0] * hull[None, :, 0] + edges[:, None, 1] * hull[None, :, 1]
+    y = edges[:, None, 0] * hull[None, :, 1] - edges[:, None, 1] * hull[None, :, 0]
+    areas = np.ptp(x, axis=1) * np.ptp(y, axis=1)
+    best_edge = edges[np.argmin(areas)]
+    return float(np.arctan2(best_edge[0], best_edge[1]))
+
+
+def get_box(vertices, normal) -> tuple[np.ndarray, np.ndarray, float, float]:
+    """Given a set of vertices flattened along a plane and their normal, return an aligned rectangle.
+
+    :param vertices: (N, 3) array of vertex coordinates in world space
+    :param normal: normal of vertices for rectangle to be projected to
+    :return: tuple of (coordinate of rect center, matrix for rotation, rect length, and rect width
+    """
+    # rotate hull so normal is pointed up, so we can ignore Z
+    align_to_z = rotation_difference(normal, UP)
+    flattened = as_points(vertices) @ align_to_z.T
+
+    # rotate hull by angle, get length and width
+    box_mat = rotation_z(box_fit_2d(flattened[:, :2]))
+    aligned = flattened[:, :2] @ box_mat[:2, :2].T
+    box_min, box_max = aligned.min(axis=0), aligned.max(axis=0)
+    length, width = box_max - box_min
+
+    # rotations are orthogonal, so their inverse is their transpose
+    matrix = align_to_z.T @ box_mat.T
+    center = matrix @ np.array((box_min[0] + length / 2, box_min[1] + width / 2, flattened[0, 2]))
+
+    return center, matrix, float(length), float(width)
+
+
+def flatten(vertices, normal) -> np.ndarray:
+    """Projects vertices onto the plane perpendicular to a normal, through the farthest vertex along it.
+
+    :param vertices: (N, 3) array of points in world space
+    :param normal: normalized (3,) direction
+    :return: (N, 3) array of projected points
+    """
+    vertices = as_points(vertices)
+    heights = vertices @ normal
+    farthest_height = heights[np.argmax(heights * heights)]
+    return vertices + np.outer(farthest_height - heights, normal)
+
+
+def reflect(directions: np.ndarray, normals: np.ndarray) -> np.ndarray:
+    """Reflects directions based on their normals."""
+    dn = 2.0 * np.sum(directions * normals, axis=-1, keepdims=True)
+    return normalize(directions - normals * dn)
+
+
+def resolve_normals(vertices, normals, axis: str, camera_origin=None) -> np.ndarray:
+    """Gets the normals of a stroke for the artist's chosen axis.
+
+    :param vertices: (N, 3) array of painted points
+    :param normals: (N, 3) array of their surface normals
+    :param axis: world axis key of AXES, 'REFLECT' or 'NORMAL'
+    :param camera_origin: camera location, required to reflect normals
+
+    :exception ValueError: if normals are reflected without a camera
+
+    :return: (N, 3) array of normals, read-only for world axes
+    """
+    vertices = as_points(vertices)
+    normals = as_points(normals)
+
+    if axis in AXES:
+        return np.broadcast_to(AXES[axis], vertices.shape)
+    if axis == 'REFLECT':
+        if camera_origin is None:
+            raise ValueError(CAMERA_ERROR)
+        directions = normalize(vertices - np.asarray(camera_origin, dtype=np.float64))
+        return reflect(directions, normals)
+    return normals
+
+
+def offset_stroke(vertices: np.ndarray, normals: np.ndarray,
+                  offset: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Moves vertices along their already resolved normals.
+
+    :param vertices: (N, 3) array of painted points
+    :param normals: (N, 3) array of normals from resolve_normals()
+    :param offset: distance to move the vertices along their normals
+
+    :return: tuple of offset vertices, normals facing the vertices and vertices without offset
+    """
+    offset_vertices = vertices
+    if offset != 0.0:
+        offset_vertices = vertices + normals * offset
+
+    if offset < 0.0:
+        normals = -normals
+
+    return offset_vertices, normals, vertices
+
+
+def prep_stroke(vertices, normals, axis: str, offset: float,
+                camera_origin=None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Updates vertices and normals to match the artist's chosen axis.
+
+    :param vertices: (N, 3) array of painted points
+    :param normals: (N, 3) array of their surface normals
+    :param axis: world axis key of AXES, 'REFLECT' or 'NORMAL'
+    :param offset: distance to move the vertices along their normals
+    :param camera_origin: camera location, required to reflect normals
+
+    :exception ValueError: if normals are reflected without a camera
+
+    :return: tuple of offset vertices, normals and vertices without offset
+    """
+    vertices = as_points(vertices)
+    return offset_stroke(vertices, resolve_normals(vertices, normals, axis, camera_origin), offset)
+
+
+def get_point_placement(vertices, normals) -> np.ndarray:
+    """Places a point lamp at the center of the stroke, flattened along the average normal.
+
+    :param vertices: (N, 3) array of points, offset from their surface
+    :param normals: (N, 3) array of their normals
+
+    :exception ValueError: if calculating the normal average fails
+
+    :return: (3,) lamp location
+    """
+    avg_normal = -average_normal(normals)
+    return flatten(vertices, avg_normal).mean(axis=0)
+
+
+def get_spot_placement(vertices, normals, orig_vertices) -> SpotPlacement:
+    """Places a spot lamp pointed at the stroke, wide enough to light all of it.
+
+    :param vertices: (N, 3) array of points, offset from their surface
+    :param normals: (N, 3) array of their normals
+    :param orig_vertices: (N, 3) array of points without offset from their surface
+
+    :exception ValueError: if calculating the normal average or the cone angle fails
+
+    :return: location, rotation and cone angle of the lamp
+    """
+    avg_normal = -average_normal(normals)
+    center = flatten(vertices, avg_normal).mean(axis=0)
+
+    orig_vertices = as_points(orig_vertices)
+    centers_dir = normalize(orig_vertices.mean(axis=0) - center)
+    directions = normalize(orig_vertices - center)
+    if not centers_dir.any() or not directions.any(axis=1).all():
+        raise ValueError(ANGLE_ERROR)
+    spot_size = 2 * float(angle_between(directions, centers_dir).max())
+
+    return SpotPlacement(center, direction_to_euler(avg_normal), spot_size)
+
+
+def get_area_placement(vertices, normals) -> AreaPlacement:
+    """Places an area lamp covering the stroke, flattened along the average normal.
+
+    :param vertices: (N, 3) array of points, offset from their surface
+    :param normals: (N, 3) array of their normals
+
+    :exception ValueError: if calculating the normal average fails
+
+    :return: location, rotation and size of the lamp
+    """
+    avg_normal = -average_normal(normals)
+    center, matrix, x_size, y_size = get_box(flatten(vertices, avg_normal), avg_normal)
+
+    # the box faces along the normal, flip it so the lamp faces the stroke
+    flip_x = np.diag((1.0, -1.0, -1.0))
+    return AreaPlacement(center, matrix_to_euler(matrix @ flip_x), (x_size, y_size))
+
+
+def get_sun_rotation(sun_normal) -> np.ndarray:
+    """Rotates a sun lamp so it shines from the given direction.
+
+    :param sun_normal: direction pointing towards the sun
+    :return: (3,) array of Euler angles in radians
+    """
+    return direction_to_euler(-np.asarray(sun_normal, dtype=np.float64))
+
+
+class LampPlacements(NamedTuple):
+    """Lamp placements for many stroke sets, one row per set."""
+    location: np.ndarray
+    """(S, 3) lamp locations."""
+    rotation: np.ndarray
+    """(S, 3) lamp rotations as Euler angles."""
+    size: np.ndarray
+    """(S, 2) length and width of area lamps, clamped to their minimum size, zero for other lamp types."""
+    spot_size: np.ndarray
+    """(S,) cone angles of spot lamps, zero for other lamp types."""
+    power: np.ndarray
+    """(S,) lamp powers."""
+
+
+def get_lamp_placements(vertices, normals, set_offsets, lamp_type: str,
+                        offset=1.0, power=10.0, is_power_relative: bool = False,
+                        axis: str = 'NORMAL', camera_origin=None,
+                        shape='RECTANGLE', min_size=(0.01, 0.01)) -> LampPlacements:
+    """Places a lamp for each of many independent stroke sets at once, like the lamp tool does for one.
+
+    Stroke sets are given as ragged arrays: all sets' points are concatenated,
+    and set `i` spans `vertices[set_offsets[i]:set_offsets[i + 1]]`.
+    Everything is vectorized across sets, except fitting the rectangle of area lamps.
+
+    :param vertices: (N, 3) array of painted points of all sets
+    :param normals: (N, 3) array of their surface normals
+    :param set_offsets: (S + 1,) integer array of where each set starts, ending with N
+    :param lamp_type: 'POINT', 'SPOT' or 'AREA'
+    :param offset: distance between the lamps and their surfaces, for all sets or (S,) one per set
+    :param power: lamp power, for all sets or (S,) one per set
+    :param is_power_relative: if True, power is scaled by the squared offset
+    :param axis: world axis key of AXES, 'REFLECT' or 'NORMAL'
+    :param camera_origin: camera location, required to reflect normals
+    :param shape: area lamp shape, for all sets or one per set; square and disk lamps get equal sides
+    :param min_size: smallest length and width of area lamps, for all sets or (S, 2) one per set
+
+    :exception ValueError: if a set is empty or its lamp can't be placed
+
+    :return: placements of every set's lamp
+    """
+    set_offsets = np.asarray(set_offsets, dtype=np.int64)
+    starts, counts = set_offsets[:-1], np.diff(set_offsets)
+    set_count = len(counts)
+    if np.any(counts <= 0):
+        raise ValueError('Stroke set {} is empty'.format(int(np.argmax(counts <= 0))))
+    set_indices = np.repeat(np.arange(set_count), counts)
+
+    # many small sets are sensitive to rounding, so they are always solved in double precision
+    vertices = np.asarray(vertices, dtype=np.float64)
+    normals = np.asarray(normals, dtype=np.float64)
+
+    # per set offsets become per vertex offsets, so every set is prepared at once
+    offsets = np.broadcast_to(np.asarray(offset, dtype=np.float64), (set_count,))
+    vertex_offsets = offsets[set_indices, None]
+    orig_vertices, normals, _ = prep_stroke(vertices, normals, axis, 0.0, camera_origin)
+    vertices = orig_vertices + normals * vertex_offsets
+    normals = np.where(vertex_offsets < 0.0, -normals, normals)
+
+    # get average, negated normals
+    avg_normals = normalize(np.add.reduceat(normals, starts))
+    zero_normals = ~avg_normals.any(axis=1)
+    if np.any(zero_normals):
+        raise ValueError('Stroke set {}: {}'.format(int(np.argmax(zero_normals)), NORMAL_ERROR))
+    avg_normals = -avg_normals
+
+    # flatten each set along its normal, through its farthest point
+    vertex_normals = avg_normals[set_indices]
+    heights = np.sum(vertices * vertex_normals, axis=1)
+    squared_heights = heights * heights
+    is_farthest = squared_heights == np.maximum.reduceat(squared_heights, starts)[set_indices]
+    farthest_indices = np.flatnonzero(is_farthest)
+    _, first_farthest = np.unique(set_indices[farthest_indices], return_index=True)
+    farthest_heights = heights[farthest_indices[first_farthest]]
+    flattened = vertices + (farthest_heights[set_indices] - heights)[:, None] * vertex_normals
+
+    centers = np.add.reduceat(flattened, starts) / counts[:, None]
+    rotations = np.zeros((set_count, 3))
+    sizes = np.zeros((set_count, 2))
+    spot_sizes = np.zeros(set_count)
+
+    if lamp_type == 'SPOT':
+        rotations = direction_to_euler(avg_normals)
+
+        centers_dir = normalize(np.add.reduceat(orig_vertices, starts) / counts[:, None] - centers)
+        directions = normalize(orig_vertices - centers[set_indices])
+        if not centers_dir.any(axis=1).all() or not directions.any(axis=1).all():
+            raise ValueError(ANGLE_ERROR)
+        angles = angle_between(directions, centers_dir[set_indices])
+        spot_sizes = 2 * np.maximum.reduceat(angles, starts)
+    elif lamp_type == 'AREA':
+        # the box faces along the normal, flip it so the lamp faces the stroke
+        flip_x = np.diag((1.0, -1.0, -1.0))
+        matrices = np.empty((set_count, 3, 3))
+        for set_index, (start, end) in enumerate(zip(set_offsets[:-1], set_offsets[1:])):
+            center, matrix, x_size, y_size = get_box(flattened[start:end], avg_normals[set_index])
+            centers[set_index] = center
+            matrices[set_index] = matrix @ flip_x
+            sizes[set_index] = x_size, y_size
+        rotations = matrix_to_euler(matrices)
+
+        # clamp like the lamp tool, shapes with a single size take the largest side
+        min_sizes = np.broadcast_to(np.asarray(min_size, dtype=np.float64), (set_count, 2))
+        has_two_sides = np.isin(np.broadcast_to(np.asarray(shape), (set_count,)), ('RECTANGLE', 'ELLIPSE'))
+        sides = np.maximum(sizes, min_sizes)
+        sizes = np.where(has_two_sides[:, None], sides, sides.max(axis=1, keepdims=True))
+    elif lamp_type != 'POINT':
+        raise ValueError('Unsupported lamp type: {}'.format(lamp_type))
+
+    powers = np.broadcast_to(np.asarray(power, dtype=np.float64), (set_count,))
+    if is_power_relative:
+        powers = calc_power(powers, offsets)
+
+    return LampPlacements(centers, rotations, sizes, spot_sizes, np.array(powers))
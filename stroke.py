@@ -0,0 +1,676 @@
+#     Light Painter, Blender add-on that creates lights based on where the user paints.
+#     Copyright (C) 2024 Spencer Magnusson
+#     semagnum@gmail.com
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Compact storage of painted strokes.
+
+Like solve.py, this module only depends on NumPy.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+INITIAL_CAPACITY = 256
+"""Number of points allocated up front, doubled whenever the buffer fills up."""
+INITIAL_STROKE_CAPACITY = 16
+"""Number of strokes allocated up front, doubled whenever the buffer fills up."""
+SCREEN_CELL_SIZE = 32.0
+"""Width of the screen index's grid cells, in pixels."""
+LOD_MAX_LEVELS = 8
+"""Number of decimated stroke levels, each keeping every other point of the previous one."""
+LOD_MIN_SEGMENT_PIXELS = 2.0
+"""Shortest average on-screen length of the segments of a drawn level."""
+LOD_MAX_SEGMENTS = 20000
+"""Most segments drawn at once, as long as a coarse enough level exists."""
+
+
+class StrokeBuffer:
+    """Painted points and their surface normals, stored as growable float32 arrays.
+
+    Strokes are runs of consecutive points, starting at the indices in ``stroke_starts``.
+    The buffer always has at least one stroke, the one new points are appended to.
+    Every change bumps ``version``, so callers can cache anything derived from the strokes.
+    """
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self._positions = np.empty((max(capacity, 1), 3), dtype=np.float32)
+        self._normals = np.empty((max(capacity, 1), 3), dtype=np.float32)
+        self._starts = np.zeros(INITIAL_STROKE_CAPACITY, dtype=np.int64)
+        self._count = 0
+        self._stroke_count = 1
+        self.version = 0
+
+    @classmethod
+    def from_strokes(cls, strokes) -> 'StrokeBuffer':
+        """Creates a buffer from a list of strokes, each a list of (location, normal) pairs.
+
+        :param strokes: strokes, as stored in the operator's str_mouse_path property
+        """
+        buffer = cls(sum(len(stroke) for stroke in strokes))
+        for idx, stroke in enumerate(strokes):
+            if idx != 0:
+                buffer.new_stroke()
+            if len(stroke) != 0:
+                positions, normals = zip(*stroke)
+                buffer.extend(positions, normals)
+        return buffer
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def positions(self) -> np.ndarray:
+        """(N, 3) view of all painted points."""
+        return self._positions[:self._count]
+
+    @property
+    def normals(self) -> np.ndarray:
+        """(N, 3) view of the surface normals of all painted points."""
+        return self._normals[:self._count]
+
+    @property
+    def stroke_count(self) -> int:
+        return self._stroke_count
+
+    @property
+    def stroke_starts(self) -> np.ndarray:
+        """View of the index of each stroke's first point."""
+        return self._starts[:self._stroke_count]
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """Stroke boundaries: stroke i spans points offsets[i] to offsets[i + 1]."""
+        return np.append(self.stroke_starts, self._count)
+
+    @property
+    def last_stroke_length(self) -> int:
+        return self._count - int(self._starts[self._stroke_count - 1])
+
+    def _reserve(self, count: int):
+        """Grows the point arrays to fit at least count points."""
+        capacity = len(self._positions)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+
+        for attr in ('_positions', '_normals'):
+            grown = np.empty((capacity, 3), dtype=np.float32)
+            grown[:self._count] = getattr(self, attr)[:self._count]
+            setattr(self, attr, grown)
+
+    def append(self, position, normal):
+        """Adds a point to the last stroke.
+
+        :param position: 3D location of the point
+        :param normal: surface normal at the point
+        """
+        self._reserve(self._count + 1)
+        self._positions[self._count] = position
+        self._normals[self._count] = normal
+        self._count += 1
+        self.version += 1
+
+    def extend(self, positions, normals):
+        """Adds many points to the last stroke.
+
+        :param positions: (N, 3) locations of the points
+        :param normals: (N, 3) surface normals at the points
+        """
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        count = self._count + len(positions)
+        self._reserve(count)
+        self._positions[self._count:count] = positions
+        self._normals[self._count:count] = np.asarray(normals, dtype=np.float32).reshape(-1, 3)
+        self._count = count
+        self.version += 1
+
+    def new_stroke(self):
+        """Starts a new, empty stroke."""
+        if self._stroke_count == len(self._starts):
+            self._starts = np.concatenate((self._starts, np.empty_like(self._starts)))
+        self._starts[self._stroke_count] = self._count
+        self._stroke_count += 1
+        self.version += 1
+
+    def remove(self, keep):
+        """Removes points without breaking strokes, e.g. after simplifying them.
+
+        :param keep: boolean mask, True for points to keep
+        """
+        keep = np.asarray(keep, dtype=bool)
+        kept_before = np.concatenate(((0,), np.cumsum(keep)))
+        self._starts[:self._stroke_count] = kept_before[self.stroke_starts]
+
+        kept_count = int(kept_before[-1])
+        self._positions[:kept_count] = self.positions[keep]
+        self._normals[:kept_count] = self.normals[keep]
+        self._count = kept_count
+        self.version += 1
+
+    def strokes(self):
+        """Yields (positions, normals) views of each stroke, including empty ones."""
+        offsets = self.offsets
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield self._positions[start:end], self._normals[start:end]
+
+    def get_segments(self) -> np.ndarray:
+        """Returns the line segments between consecutive points of the same stroke.
+
+        :return: (M, 2) array of point indices
+        """
+        starts = np.arange(max(self._count - 1, 0))
+        # no segment leads into the first point of a stroke
+        is_segment = np.ones(len(starts), dtype=bool)
+        next_starts = self.stroke_starts[1:] - 1
+        is_segment[next_starts[(next_starts >= 0) & (next_starts < len(starts))]] = False
+        starts = starts[is_segment]
+        return np.column_stack((starts, starts + 1))
+
+    def split(self, values: np.ndarray) -> list[np.ndarray]:
+        """Splits per-point values into their strokes.
+
+        :param values: array with one row per point
+        """
+        return np.split(values, self.stroke_starts[1:])
+
+    def filter(self, keep) -> 'StrokeBuffer':
+        """Removes points, breaking strokes wherever points were removed.
+
+        Breaks between the original strokes are preserved,
+        and a new empty stroke is started unless the last point is kept.
+
+        :param keep: boolean mask, True for points to keep
+
+        :return: new buffer with the kept points
+        """
+        keep = np.asarray(keep, dtype=bool)
+        offsets = self.offsets
+        stroke_ids = np.repeat(np.arange(self._stroke_count), np.diff(offsets))
+
+        # a kept point starts a new stroke after an erased point or at the start of an original stroke
+        run_starts = keep.copy()
+        run_starts[1:] &= ~keep[:-1] | (stroke_ids[1:] != stroke_ids[:-1])
+        kept_starts = np.cumsum(keep) - 1
+        starts = kept_starts[run_starts]
+
+        kept_count = int(np.count_nonzero(keep))
+        ends_in_last_stroke = self._count > 0 and keep[-1] and offsets[-2] < self._count
+        if not ends_in_last_stroke:
+            starts = np.append(starts, kept_count)
+
+        filtered = StrokeBuffer(kept_count)
+        filtered._positions[:kept_count] = self.positions[keep]
+        filtered._normals[:kept_count] = self.normals[keep]
+        filtered._count = kept_count
+        filtered._starts = np.concatenate((starts, np.zeros(max(len(starts), INITIAL_STROKE_CAPACITY),
+                                                            dtype=np.int64)))
+        filtered._stroke_count = len(starts)
+        filtered.version = self.version + 1
+        return filtered
+
+
+class StrokeLOD:
+    """Decimated versions of the strokes' polylines, so long strokes are drawn with a bounded number of segments.
+
+    Level k keeps every 2**k-th point of each stroke, plus its last point.
+    Levels are built again whenever the strokes change, and one is chosen per view
+    from how many pixels its segments span on screen.
+    """
+
+    def __init__(self, max_levels: int = LOD_MAX_LEVELS):
+        self.max_levels = max_levels
+        self.strokes = None
+        self.version = None
+        self.levels = []
+        self.segment_lengths = []
+        self.center = np.zeros(3)
+
+    def update(self, strokes: StrokeBuffer) -> bool:
+        """Builds the levels of the strokes, unless they haven't changed.
+
+        :return: True if the levels were built again
+        """
+        if strokes is self.strokes and strokes.version == self.version:
+            return False
+        self.strokes = strokes
+        self.version = strokes.version
+
+        positions = strokes.positions
+        offsets = strokes.offsets
+        lengths = np.diff(offsets)
+        stroke_ids = np.repeat(np.arange(strokes.stroke_count), lengths)
+        indices = np.arange(len(strokes))
+        local_indices = indices - offsets[stroke_ids]
+        is_last = indices == offsets[stroke_ids + 1] - 1
+
+        self.levels = []
+        self.segment_lengths = []
+        longest = int(lengths.max(initial=0))
+        for level in range(self.max_levels):
+            step = 2 ** level
+            kept = np.flatnonzero((local_indices % step == 0) | is_last)
+            same_stroke = stroke_ids[kept[1:]] == stroke_ids[kept[:-1]]
+            segments = np.column_stack((kept[:-1][same_stroke], kept[1:][same_stroke]))
+
+            self.levels.append(segments)
+            segment_lengths = np.linalg.norm(positions[segments[:, 1]] - positions[segments[:, 0]], axis=1)
+            self.segment_lengths.append(float(segment_lengths.mean()) if len(segment_lengths) else 0.0)
+
+            # coarser levels would be the same, each stroke is down to its ends
+            if step >= longest:
+                break
+
+        if len(strokes) != 0:
+            self.center = (positions.min(axis=0) + positions.max(axis=0)) / 2
+        return True
+
+    def select_level(self, perspective_matrix, width: int, min_pixels: float = LOD_MIN_SEGMENT_PIXELS,
+                     max_segments: int = LOD_MAX_SEGMENTS) -> int:
+        """Chooses the finest level whose segments aren't sub-pixel and aren't too many to draw.
+
+        :param perspective_matrix: 4x4 view projection matrix of the region
+        :param width: region width in pixels
+        :param min_pixels: shortest average on-screen length of the chosen level's segments
+        :param max_segments: most segments in the chosen level, unless no level is that coarse
+
+        :return: index of the level to draw
+        """
+        matrix = np.asarray(perspective_matrix, dtype=np.float64)
+        w = matrix[3, :3] @ self.center + matrix[3, 3]
+        # size of a pixel around the strokes, for strokes behind the view every segment is long enough
+        pixels_per_unit = 0.5 * width * np.linalg.norm(matrix[0, :3]) / w if w > 0.0 else np.inf
+
+        for level, (segments, segment_length) in enumerate(zip(self.levels, self.segment_lengths)):
+            if len(segments) <= max_segments and segment_length * pixels_per_unit >= min_pixels:
+                return level
+        return max(len(self.levels) - 1, 0)
+
+
+def simplify_polyline(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Simplifies a polyline with the Ramer-Douglas-Peucker algorithm.
+
+    :param points: (N, 3) array of points along the line
+    :param tolerance: maximum distance of removed points from the simplified line
+
+    :return: boolean mask, True for points to keep, always including both ends
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    if len(points) < 3:
+        keep[:] = True
+        return keep
+
+    points = np.asarray(points, dtype=np.float64)
+    keep[[0, -1]] = True
+    spans = [(0, len(points) - 1)]
+    while spans:
+        start, end = spans.pop()
+        if end - start < 2:
+            continue
+
+        # distance of each point in between to the line through both ends
+        segment = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        length_sq = segment @ segment
+        if length_sq == 0.0:
+            distances = np.linalg.norm(offsets, axis=1)
+        else:
+            distances = np.linalg.norm(offsets - np.outer(offsets @ segment / length_sq, segment), axis=1)
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            middle = start + 1 + farthest
+            keep[middle] = True
+            spans.append((start, middle))
+            spans.append((middle, end))
+    return keep
+
+
+class DuplicateFilter:
+    """Ingest stage that rejects points at the same location as the previous point, e.g. when the mouse stopped."""
+
+    def __init__(self):
+        self.last_position = None
+
+    def reset(self):
+        self.last_position = None
+
+    def process(self, positions: np.ndarray, _normals: np.ndarray, _coords: np.ndarray) -> np.ndarray:
+        if len(positions) == 0:
+            return np.zeros(0, dtype=bool)
+
+        # duplicates of a rejected point are duplicates of the last kept one too
+        previous = np.empty_like(positions)
+        previous[1:] = positions[:-1]
+        previous[0] = positions[0] + 1.0 if self.last_position is None else self.last_position
+        self.last_position = positions[-1].copy()
+        return (positions != previous).any(axis=1)
+
+
+class SpacingFilter:
+    """Ingest stage that rejects points closer than a minimum distance to the previous kept point.
+
+    Distances are measured both in world space and in region pixels, a zero spacing disables either.
+    """
+
+    def __init__(self, world_spacing: float = 0.0, screen_spacing: float = 0.0):
+        self.world_spacing = world_spacing
+        self.screen_spacing = screen_spacing
+        self.last_position = None
+        self.last_coord = None
+
+    def reset(self):
+        self.last_position = None
+        self.last_coord = None
+
+    def process(self, positions: np.ndarray, _normals: np.ndarray, coords: np.ndarray) -> np.ndarray:
+        keep = np.zeros(len(positions), dtype=bool)
+        world_spacing_sq = self.world_spacing ** 2
+        screen_spacing_sq = self.screen_spacing ** 2
+        for idx, (position, coord) in enumerate(zip(positions, coords)):
+            if self.last_position is not None:
+                world_offset = position - self.last_position
+                screen_offset = coord - self.last_coord
+                if world_offset @ world_offset < world_spacing_sq or screen_offset @ screen_offset < screen_spacing_sq:
+                    continue
+            keep[idx] = True
+            self.last_position = position
+            self.last_coord = coord
+        return keep
+
+
+class IngestPipeline:
+    """Stages every painted point passes through before it's added to the strokes.
+
+    Points arrive in batches, one per paint event or deferred stroke. Each stage sees only the points
+    earlier stages kept, remembers what it kept across batches, and is reset when a stroke ends.
+    """
+
+    def __init__(self, stages=(), simplify_tolerance: float = 0.0):
+        """
+        :param stages: objects with reset() and process(positions, normals, coords) returning a keep mask
+        :param simplify_tolerance: tolerance for simplifying finished strokes, zero to keep every point
+        """
+        self.stages = list(stages)
+        self.simplify_tolerance = simplify_tolerance
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+
+    def process(self, positions: np.ndarray, normals: np.ndarray, coords: np.ndarray) -> np.ndarray:
+        """Runs a batch of points through the stages.
+
+        :param positions: (N, 3) locations of the points
+        :param normals: (N, 3) surface normals at the points
+        :param coords: (N, 2) region coordinates the points were painted at
+
+        :return: boolean mask, True for points to add
+        """
+        keep = np.ones(len(positions), dtype=bool)
+        for stage in self.stages:
+            indices = np.flatnonzero(keep)
+            keep[indices] = stage.process(positions[indices], normals[indices], coords[indices])
+        return keep
+
+    def finish(self, strokes: StrokeBuffer, start: int) -> bool:
+        """Simplifies the points painted since a stroke started, and resets the stages for the next stroke.
+
+        :param strokes: painted strokes
+        :param start: index of the first point painted in the finished stroke
+
+        :return: True if any points were removed
+        """
+        self.reset()
+        if self.simplify_tolerance <= 0.0 or len(strokes) - start < 3:
+            return False
+
+        keep = np.ones(len(strokes), dtype=bool)
+        keep[start:] = simplify_polyline(strokes.positions[start:], self.simplify_tolerance)
+        if keep.all():
+            return False
+        strokes.remove(keep)
+        return True
+
+
+def project_to_region(positions: np.ndarray, perspective_matrix, width: int,
+                      height: int) -> tuple[np.ndarray, np.ndarray]:
+    """Projects 3D points to 2D region coordinates, like view3d_utils.location_3d_to_region_2d.
+
+    :param positions: (N, 3) array of points
+    :param perspective_matrix: 4x4 view projection matrix of the region
+    :param width: region width in pixels
+    :param height: region height in pixels
+
+    :return: (N, 2) array of region coordinates and a mask of points in front of the view
+    """
+    matrix = np.asarray(perspective_matrix, dtype=np.float64)
+    projected = positions @ matrix[:3, :3].T + matrix[:3, 3]
+    w = positions @ matrix[3, :3] + matrix[3, 3]
+
+    in_front = w > 0.0
+    w = np.where(in_front, w, 1.0)
+    half_size = np.array((width / 2, height / 2))
+    coords = half_size * (1.0 + projected[:, :2] / w[:, None])
+    return coords, in_front
+
+
+def interpolate_coords(start, end, spacing: float) -> np.ndarray:
+    """Evenly spaces region coordinates from one cursor position to the next.
+
+    :param start: previous cursor position, which is not included
+    :param end: current cursor position, always the last coordinate
+    :param spacing: maximum distance between coordinates, in pixels
+
+    :return: (N, 2) array of region coordinates
+    """
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    count = max(int(np.ceil(np.linalg.norm(end - start) / spacing)), 1)
+    steps = np.arange(1, count + 1) / count
+    return start + (end - start) * steps[:, None]
+
+
+class RegionView(NamedTuple):
+    """Snapshot of a 3D region's view, enough to turn region coordinates into rays later."""
+    perspective_matrix: tuple
+    view_matrix: tuple
+    is_perspective: bool
+    is_camera: bool
+    width: int
+    height: int
+
+
+def get_region_rays(coords: np.ndarray, view: RegionView) -> tuple[np.ndarray, np.ndarray]:
+    """Turns region coordinates into rays, like view3d_utils.region_2d_to_origin_3d and region_2d_to_vector_3d.
+
+    :param coords: (N, 2) array of region coordinates
+    :param view: view the coordinates were taken in
+
+    :return: (N, 3) arrays of ray origins and normalized ray directions
+    """
+    persinv = np.linalg.inv(np.array(view.perspective_matrix, dtype=np.float64))
+    viewinv = np.linalg.inv(np.array(view.view_matrix, dtype=np.float64))
+    ndc = np.asarray(coords, dtype=np.float64).reshape(-1, 2) * (2.0 / np.array((view.width, view.height))) - 1.0
+
+    if view.is_perspective:
+        out = np.column_stack((ndc, np.full(len(ndc), -0.5)))
+        w = out @ persinv[3, :3] + persinv[3, 3]
+        directions = (out @ persinv[:3, :3].T + persinv[:3, 3]) / w[:, None] - viewinv[:3, 3]
+        origins = np.repeat(viewinv[None, :3, 3], len(ndc), axis=0)
+    else:
+        directions = np.repeat(-viewinv[None, :3, 2], len(ndc), axis=0)
+        origins = ndc[:, :1] * persinv[:3, 0] + ndc[:, 1:] * persinv[:3, 1] + persinv[:3, 3]
+        if not view.is_camera:
+            # the far clip is the origin's offset, like Blender does
+            origins -= persinv[:3, 2]
+
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    return origins, directions
+
+
+class PendingStroke:
+    """Region coordinates painted while ray casts are deferred, with the view each one was painted in.
+
+    Views are only stored when they change, so a stroke painted without navigating keeps a single view.
+    """
+
+    def __init__(self):
+        self.coords = []
+        self.view_indices = []
+        self.views = []
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def add(self, coord, view: RegionView):
+        """Records a painted region coordinate.
+
+        :param coord: region coordinates of the cursor
+        :param view: view the cursor was in
+        """
+        if not self.views or self.views[-1] != view:
+            self.views.append(view)
+        self.coords.append(coord)
+        self.view_indices.append(len(self.views) - 1)
+
+    def extend(self, coords, view: RegionView):
+        """Records many region coordinates painted in the same view.
+
+        :param coords: region coordinates of the cursor
+        :param view: view the cursor was in
+        """
+        if not self.views or self.views[-1] != view:
+            self.views.append(view)
+        self.coords.extend(tuple(coord) for coord in coords)
+        self.view_indices.extend([len(self.views) - 1] * len(coords))
+
+    def clear(self):
+        self.coords.clear()
+        self.view_indices.clear()
+        self.views.clear()
+
+    def get_rays(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the ray of every recorded coordinate, computed in batches per view.
+
+        :return: (N, 3) arrays of ray origins and normalized ray directions
+        """
+        coords = np.array(self.coords, dtype=np.float64).reshape(-1, 2)
+        view_indices = np.array(self.view_indices, dtype=np.int64)
+        origins = np.empty((len(coords), 3))
+        directions = np.empty((len(coords), 3))
+        for index, view in enumerate(self.views):
+            in_view = view_indices == index
+            origins[in_view], directions[in_view] = get_region_rays(coords[in_view], view)
+        return origins, directions
+
+
+class ScreenIndex:
+    """Uniform grid of the stroke points projected to a region, for finding points under the eraser.
+
+    Points are sorted by grid cell, so each cell is a contiguous range found by binary search.
+    The grid is only rebuilt when the strokes, the view or the region size change.
+    """
+
+    def __init__(self, cell_size: float = SCREEN_CELL_SIZE):
+        self.cell_size = cell_size
+        self.key = None
+        self.coords = np.empty((0, 2))
+        self.in_front = np.empty(0, dtype=bool)
+        self.min_cell = np.zeros(2, dtype=np.int64)
+        self.cell_rows = 1
+        self.sorted_cells = np.empty(0, dtype=np.int64)
+        self.order = np.empty(0, dtype=np.int64)
+
+    def update(self, strokes: StrokeBuffer, perspective_matrix, width: int, height: int):
+        """Projects and indexes the strokes, unless nothing changed since the last update.
+
+        :param strokes: painted strokes
+        :param perspective_matrix: 4x4 view projection matrix of the region
+        :param width: region width in pixels
+        :param height: region height in pixels
+        """
+        matrix = np.asarray(perspective_matrix, dtype=np.float64)
+        key = (strokes.version, matrix.tobytes(), width, height)
+        if key == self.key:
+            return
+        self.key = key
+
+        self.coords, self.in_front = project_to_region(strokes.positions, matrix, width, height)
+
+        # points behind the view are never indexed, so they can't be erased
+        visible = np.flatnonzero(self.in_front)
+        cells = np.floor(self.coords[visible] / self.cell_size).astype(np.int64)
+        if len(cells) != 0:
+            self.min_cell = cells.min(axis=0)
+            self.cell_rows = int(cells[:, 1].max() - self.min_cell[1]) + 1
+        cell_ids = self.get_cell_ids(cells)
+
+        sort_order = np.argsort(cell_ids, kind='stable')
+        self.sorted_cells = cell_ids[sort_order]
+        self.order = visible[sort_order]
+
+    def get_cell_ids(self, cells: np.ndarray) -> np.ndarray:
+        cells = cells - self.min_cell
+        return cells[..., 0] * self.cell_rows + cells[..., 1]
+
+    def query(self, center, radius: float) -> np.ndarray:
+        """Finds the points within a circle.
+
+        :param center: region coordinates of the circle's center
+        :param radius: circle radius in pixels
+
+        :return: sorted indices of the points inside the circle
+        """
+        if len(self.order) == 0:
+            return self.order
+
+        center = np.asarray(center, dtype=np.float64)
+        min_cell = np.floor((center - radius) / self.cell_size).astype(np.int64)
+        max_cell = np.floor((center + radius) / self.cell_size).astype(np.int64)
+
+        # only rows within the indexed range can hold points
+        low_y = max(min_cell[1], self.min_cell[1])
+        high_y = min(max_cell[1], self.min_cell[1] + self.cell_rows - 1)
+        if low_y > high_y or max_cell[0] < self.min_cell[0]:
+            return np.empty(0, dtype=np.int64)
+
+        # each column of cells is one contiguous range of sorted cell ids
+        columns = np.arange(max(min_cell[0], self.min_cell[0]), max_cell[0] + 1)
+        first_cells = self.get_cell_ids(np.stack((columns, np.full_like(columns, low_y)), axis=-1))
+        starts = np.searchsorted(self.sorted_cells, first_cells, side='left')
+        ends = np.searchsorted(self.sorted_cells, first_cells + (high_y - low_y), side='right')
+
+        candidates = np.concatenate([self.order[start:end] for start, end in zip(starts, ends)])
+        offsets = self.coords[candidates] - center
+        inside = np.einsum('ij,ij->i', offsets, offsets) <= radius * radius
+        return np.sort(candidates[inside])
+
+    def filter(self, keep: np.ndarray, strokes: StrokeBuffer):
+        """Removes points from the index without projecting or sorting again.
+
+        :param keep: boolean mask, True for points kept by StrokeBuffer.filter()
+        :param strokes: the filtered strokes
+        """
+        new_indices = np.cumsum(keep) - 1
+        kept_order = keep[self.order]
+        self.sorted_cells = self.sorted_cells[kept_order]
+        self.order = new_indices[self.order[kept_order]]
+        self.coords = self.coords[keep]
+        self.in_front = self.in_front[keep]
+        if self.key is not None:
+            self.key = (strokes.version,) + self.key[1:]
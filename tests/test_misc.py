@@ -1,5 +1,4 @@
 import ast
-from math import pi
 from numpy import isclose as np_isclose
 import os
 from pathlib import Path
@@ -8,7 +7,7 @@ import pytest
 import bpy
 import addon_utils
 
-from config import SINGLE_POINT
+from config import SINGLE_POINT, SINGLE_STROKE
 
 
 def get_init_version(filepath):
@@ -143,6 +142,164 @@ def test_area_lamp_rotation():
     assert (2 - width) <= 0.0001
 
 
+@pytest.mark.parametrize('lamp_type, shape', [
+    ('POINT', 'RECTANGLE'), ('SPOT', 'RECTANGLE'), ('AREA', 'RECTANGLE'), ('AREA', 'DISK'),
+])
+def test_batched_lamps(context, ops, lamp_type, shape):
+    """Lamps placed for many stroke sets at once match the lamp tool, including degenerate area lamps."""
+    from lightpainter.operators.lamp_util import add_placed_lamps
+    from lightpainter.solve import get_lamp_placements
+
+    settings = dict(shape=shape, spread=1.2, radius=0.4, spot_blend=0.6)
+    color = (1.0, 0.5, 0.25)
+    visibility = dict(visible_camera=False, visible_diffuse=True, visible_specular=False, visible_volume=True)
+    min_size = (0.3, 0.2)
+
+    vertices = [(0, 0, 0), (1, 1, 1), (3, 0, 0), (4, 0, 0), (4, 1, 0)]
+    normals = [(0, 0, 1), (0, 0, 1), (0, 0, 1), (0, 1, 1), (0, 0, 1)]
+    placements = get_lamp_placements(vertices, normals, (0, 2, 5), lamp_type, offset=10.0, power=5.0,
+                                     is_power_relative=True, shape=shape, min_size=min_size)
+    lamps = add_placed_lamps(context.scene.collection, placements, lamp_type, name='Batched', color=color,
+                             visibility=tuple(visibility.values()), **settings)
+    assert len(lamps) == 2
+
+    ops.lightpainter.lamp(str_mouse_path=SINGLE_STROKE, offset=10.0, lamp_type=lamp_type, power=5.0,
+                          is_power_relative=True, axis='NORMAL', min_size=min_size, light_color=color,
+                          **settings, **visibility)
+    expected, actual = context.active_object, lamps[0]
+
+    assert np_isclose(expected.location, actual.location, atol=0.0001).all()
+    assert np_isclose(expected.rotation_euler.to_matrix(), actual.rotation_euler.to_matrix(), atol=0.0001).all()
+    for attribute in ('visible_camera', 'visible_diffuse', 'visible_glossy', 'visible_volume_scatter'):
+        assert getattr(expected, attribute) == getattr(actual, attribute)
+
+    attributes = ['energy', 'color', 'diffuse_factor', 'specular_factor', 'volume_factor']
+    if lamp_type == 'AREA':
+        attributes += ['shape', 'spread', 'size'] + (['size_y'] if shape == 'RECTANGLE' else [])
+        assert min(actual.data.size, actual.data.size_y) > 0.0
+    else:
+        attributes += ['shadow_soft_size'] + (['spot_size', 'spot_blend'] if lamp_type == 'SPOT' else [])
+    for attribute in attributes:
+        expected_value, actual_value = getattr(expected.data, attribute), getattr(actual.data, attribute)
+        if isinstance(expected_value, str):
+            assert expected_value == actual_value, attribute
+        else:
+            assert np_isclose(expected_value, actual_value, atol=0.0001).all(), attribute
+
+
+def test_prepared_stroke_reuses_normals(context, ops):
+    """Dragging the offset reuses resolved normals, changing the axis or strokes resolves them again."""
+    from lightpainter.axis import PreparedStroke
+    from lightpainter.stroke import StrokeBuffer
+
+    strokes = StrokeBuffer.from_strokes([[((0, 0, 0), (0, 0, 1)), ((1, 0, 0), (0, 1, 0))], []])
+    prepared = PreparedStroke()
+
+    vertices, normals, _ = prepared.prepare(context, strokes, 'REFLECT', 1.0)
+    axis_normals = prepared.axis_normals
+    offset_vertices, offset_normals, orig_vertices = prepared.prepare(context, strokes, 'REFLECT', -2.0)
+    assert prepared.axis_normals is axis_normals
+    assert orig_vertices.base is not None, 'stroke buffer should not be copied'
+    assert np_isclose(offset_vertices, orig_vertices - 2.0 * axis_normals).all()
+    assert np_isclose(offset_normals, -normals).all()
+
+    prepared.prepare(context, strokes, 'Z', 1.0)
+    assert prepared.axis_normals is not axis_normals
+
+    strokes.append((0, 1, 0), (0, 0, 1))
+    vertices, _, _ = prepared.prepare(context, strokes, 'Z', 1.0)
+    assert [len(stroke) for stroke in strokes.split(vertices)] == [2, 1]
+
+
+def test_paint_targets_match_scene_ray_cast(context, ops):
+    """Paint ray casts hit the same surfaces as scene.ray_cast, and see geometry moved while painting."""
+    from lightpainter.operators.paint_target import PaintTargets, ACTIVE_TARGETS
+    from mathutils import Vector
+
+    targets = PaintTargets(context)
+    try:
+        origin, direction = Vector((0.3, -0.2, 10.0)), Vector((0.0, 0.0, -1.0))
+        is_hit, location, normal = targets.ray_cast(context, origin, direction, 100.0)
+        expected = context.scene.ray_cast(context.evaluated_depsgraph_get(), origin, direction, distance=100.0)
+        assert is_hit and expected[0]
+        assert np_isclose(location, expected[1], atol=0.0001).all()
+        assert np_isclose(normal, expected[2], atol=0.0001).all()
+        assert not targets.is_dirty
+
+        # unrelated objects don't invalidate the tree
+        context.scene.objects['Light'].location.x += 1.0
+        context.view_layer.update()
+        assert not targets.is_dirty
+
+        context.scene.objects['Cube'].location.z += 1.0
+        context.view_layer.update()
+        assert targets.is_dirty
+        _, location, _ = targets.ray_cast(context, origin, direction, 100.0)
+        assert np_isclose(location.z, 2.0, atol=0.0001)
+    finally:
+        targets.free()
+    assert targets not in ACTIVE_TARGETS
+
+
+@pytest.mark.parametrize('chunk_size', [1 << 16, 3])
+def test_paint_targets_batched_ray_cast(context, ops, monkeypatch, chunk_size):
+    """Casting a deferred stroke's rays in one batch hits the same points as casting them one by one."""
+    import numpy as np
+    from lightpainter.operators import mesh_cache
+    from lightpainter.operators.paint_target import PaintTargets
+    from mathutils import Vector
+
+    # rays are tested against instance bounds in chunks, however few fit in one
+    monkeypatch.setattr(mesh_cache, 'BOUNDS_CHUNK_SIZE', chunk_size)
+
+    ops.mesh.primitive_cube_add(location=(3.0, 0.0, 0.0), scale=(0.5, 0.5, 0.5))
+    targets = PaintTargets(context)
+    try:
+        rng = np.random.default_rng(0)
+        origins = np.column_stack((rng.uniform(-2.0, 4.0, 40), rng.uniform(-2.0, 2.0, 40), np.full(40, 10.0)))
+        directions = rng.normal((0.0, 0.0, -1.0), 0.05, size=(40, 3))
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+
+        is_hit, locations, normals = targets.ray_cast_many(context, origins, directions, 100.0)
+        assert 0 < np.count_nonzero(is_hit) < len(origins)
+        for origin, direction, hit, location, normal in zip(origins, directions, is_hit, locations, normals):
+            expected_hit, expected_location, expected_normal = targets.ray_cast(context, Vector(origin),
+                                                                                Vector(direction), 100.0)
+            assert hit == expected_hit
+            if hit:
+                assert np_isclose(location, expected_location, atol=0.0001).all()
+                assert np_isclose(normal, expected_normal, atol=0.0001).all()
+    finally:
+        targets.free()
+
+
+@pytest.mark.parametrize('target_filter', ['SCENE', 'COLLECTION', 'SELECTED'])
+def test_paint_target_filter(context, ops, target_filter):
+    """Strokes never land on Light Painter meshes, and only land on objects allowed by the filter."""
+    from lightpainter.operators.paint_target import MESH_DATA_NAME, PaintTargets
+    from mathutils import Vector
+
+    ops.mesh.primitive_plane_add(size=4.0, location=(0.0, 0.0, 3.0))
+    context.active_object.data.name = MESH_DATA_NAME
+    collection = bpy.data.collections.new('Other')
+    context.scene.collection.children.link(collection)
+    ops.mesh.primitive_plane_add(size=4.0, location=(0.0, 0.0, 2.0))
+    plane = context.active_object
+    plane.users_collection[0].objects.unlink(plane)
+    collection.objects.link(plane)
+
+    ops.object.select_all(action='DESELECT')
+    context.scene.objects['Cube'].select_set(True)
+    context.view_layer.active_layer_collection = context.view_layer.layer_collection.children['Collection']
+
+    targets = PaintTargets(context, target_filter)
+    try:
+        _, location, _ = targets.ray_cast(context, Vector((0.0, 0.0, 10.0)), Vector((0.0, 0.0, -1.0)), 100.0)
+    finally:
+        targets.free()
+    assert np_isclose(location.z, 2.0 if target_filter == 'SCENE' else 1.0, atol=0.0001)
+
+
 def test_gobos(context, ops):
     light_obj = context.scene.objects['Light']
 
@@ -164,32 +321,6 @@ def test_gobos(context, ops):
         ops.lightpainter.lamp_texture_remove()
 
 
-def test_conversion():
-    from mathutils import Vector
-    from lightpainter.operators.lamp_util import geo_to_dir
-
-    # vector -> latitude, longitude
-    TEST_CONVERSIONS = [
-        # y-axis
-        (Vector((0, 1, 0)), (0, 0)),
-        (Vector((0, -1, 0)), (0, pi)),
-
-        # x-axis
-        (Vector((1, 0, 0)), (0, pi / 2)),
-        (Vector((-1, 0, 0)), (0, -pi / 2)),
-
-        # z-up
-        (Vector((0, 0, 1)), (pi / 2, 0)),
-    ]
-
-    def compare_vectors(vec1, vec2):
-        return all(np_isclose(v2, v1, atol=0.001, rtol=0.001) for v1, v2 in zip(vec1, vec2))
-
-    for v, geo in TEST_CONVERSIONS:
-        result = geo_to_dir(geo[0], geo[1])
-        assert compare_vectors(result, v), 'geo_to_dir {} => {} != {}'.format(geo, result, v)
-
-
 def test_assert_version_parity_manifest():
     root_folder = Path(__file__).parent.parent
     init = root_folder / '__init__.py'
@@ -262,3 +393,165 @@ def test_keymap_unique_without_clashes():
 
     if failed_keymaps:
         pytest.fail('Expected all keymaps to be unique, found matches:\n' + '\n'.join(failed_keymaps))
+
+
+def test_keymap_dispatch_matches_items():
+    """The compiled dispatch table resolves events to the same commands as comparing every keymap item."""
+    from types import SimpleNamespace
+    from lightpainter.keymap import get_modifier_bits, UNIVERSAL_KEYMAP, KeymapDispatch
+    from lightpainter.preferences import KEYMAP_NAME
+
+    def is_match(item, event):
+        """Matches an event against one keymap item, like Blender does."""
+        return (item.type == event.type and item.value in {'ANY', event.value} and
+                get_modifier_bits(item) == get_modifier_bits(event))
+
+    items = [
+        SimpleNamespace(idname='wm.call_menu', properties=SimpleNamespace(name=kmi['name']), type=kmi['type'],
+                        value=kmi['value'], shift=kmi.get('shift', 0), ctrl=kmi.get('ctrl', 0),
+                        alt=kmi.get('alt', 0), oskey=kmi.get('oskey', 0), to_string=lambda t=kmi['type']: t)
+        for kmi in UNIVERSAL_KEYMAP
+    ]
+    # a user rebinding that clashes with another command
+    items.append(SimpleNamespace(idname='wm.call_menu', properties=SimpleNamespace(name='LIGHT_PAINTER_AXIS_X'),
+                                 type='LEFTMOUSE', value='PRESS', shift=0, ctrl=0, alt=0, oskey=0,
+                                 to_string=lambda: 'LEFTMOUSE'))
+    keymap = SimpleNamespace(keymap_items=items)
+    context = SimpleNamespace(window_manager=SimpleNamespace(
+        keyconfigs=SimpleNamespace(user=SimpleNamespace(keymaps={KEYMAP_NAME: keymap}))
+    ))
+
+    dispatch = KeymapDispatch()
+    dispatch.compile(context)
+
+    event_types = {item.type for item in items} | {'MOUSEMOVE', 'A'}
+    for event_type in event_types:
+        for value in ('PRESS', 'RELEASE', 'CLICK', 'NOTHING'):
+            for bits in range(16):
+                event = SimpleNamespace(type=event_type, value=value, shift=bool(bits & 1), ctrl=bool(bits & 2),
+                                        alt=bool(bits & 4), oskey=bool(bits & 8))
+                expected = tuple(item.properties.name.replace('LIGHT_PAINTER_', '')
+                                 for item in items if is_match(item, event))
+                assert dispatch.get_commands(event) == expected
+
+    # displayed keys come from the first item of each command
+    assert dispatch.get_item_string('AXIS_X') == 'X'
+    assert dispatch.get_item_string('PAINT') == 'LEFTMOUSE'
+    assert dispatch.get_item_string('UNBOUND') == ''
+
+
+def test_navigation_classifier_index():
+    """Navigation events are matched only against keymaps binding their type, and rebinding is picked up."""
+    from types import SimpleNamespace
+    from lightpainter.operators import base_tool
+    from lightpainter.operators.base_tool import NavigationClassifier
+
+    matched = []
+
+    class KeymapItems(list):
+        def match_event(self, event):
+            matched.append(event.type)
+            return any(item.type == event.type for item in self)
+
+    def make_keymap(name, item_types):
+        return SimpleNamespace(name=name, keymap_items=KeymapItems(SimpleNamespace(type=t) for t in item_types))
+
+    class KeyMaps(list):
+        def get(self, name):
+            return next((km for km in self if km.name == name), None)
+
+    def make_config(name, keymaps):
+        return SimpleNamespace(name=name, keymaps=KeyMaps(keymaps))
+
+    class KeyConfigs(list):
+        active = None
+
+    view = make_keymap('3D View', ('MIDDLEMOUSE', 'WHEELUPMOUSE'))
+    other = make_keymap('Object Mode', ('MOUSEMOVE', 'G'))
+    keyconfigs = KeyConfigs([make_config('Blender', [view, other])])
+    keyconfigs.active = keyconfigs[0]
+
+    classifier = NavigationClassifier()
+    assert classifier.is_nav_event(keyconfigs, SimpleNamespace(type='MIDDLEMOUSE'))
+    assert not classifier.is_nav_event(keyconfigs, SimpleNamespace(type='MOUSEMOVE'))
+    assert not classifier.is_nav_event(keyconfigs, SimpleNamespace(type='G'))
+    assert matched == ['MIDDLEMOUSE']
+
+    # a new keyconfig rebuilds the index
+    keyconfigs.append(make_config('Custom', [make_keymap('3D View', ('G',))]))
+    assert classifier.is_nav_event(keyconfigs, SimpleNamespace(type='G'))
+
+    # keymaps binding any event are tested for every event
+    keyconfigs.append(make_config('Wildcard', [make_keymap('3D View', ('ANY',))]))
+    matched.clear()
+    classifier.is_nav_event(keyconfigs, SimpleNamespace(type='MOUSEMOVE'))
+    assert matched == ['MOUSEMOVE']
+
+    # rebinding a key is picked up once the '3D View' keymaps are read again
+    view.keymap_items[0].type = 'F'
+    assert not classifier.is_nav_event(keyconfigs, SimpleNamespace(type='F'))
+    classifier.build_time -= base_tool.NAV_INDEX_LIFETIME + 1.0
+    assert not classifier.is_nav_event(keyconfigs, SimpleNamespace(type='MIDDLEMOUSE'))
+    assert classifier.is_nav_event(keyconfigs, SimpleNamespace(type='F'))
+
+
+def test_header_text_cached_until_state_changes():
+    """Header text is only built again after a command, and only sent to Blender when it changed."""
+    from types import SimpleNamespace
+    from lightpainter.operators.base_tool import BaseLightPaintTool
+
+    calls = {'build': 0, 'header': 0, 'status': 0}
+
+    class Tool(BaseLightPaintTool):
+        power = 10.0
+
+        def get_header_text(self):
+            calls['build'] += 1
+            return 'Power: {}'.format(self.power)
+
+    def count(name):
+        def set_text(_text):
+            calls[name] += 1
+        return set_text
+
+    context = SimpleNamespace(
+        area=SimpleNamespace(header_text_set=count('header')),
+        workspace=SimpleNamespace(status_text_set_internal=count('status')),
+        preferences=SimpleNamespace(view=SimpleNamespace(language='en_US')),
+    )
+    tool = Tool()
+    tool.preferences = SimpleNamespace(keymap_header=True, keymap_status_bar=True)
+
+    for _ in range(5):
+        tool.update_keymap_text(context)
+    assert calls == {'build': 1, 'header': 1, 'status': 1}
+
+    # a command that didn't change anything rebuilds the text, but doesn't resend it
+    tool.is_header_dirty = True
+    tool.update_keymap_text(context)
+    assert calls == {'build': 2, 'header': 1, 'status': 1}
+
+    tool.power = 20.0
+    tool.is_header_dirty = True
+    tool.update_keymap_text(context)
+    assert calls == {'build': 3, 'header': 2, 'status': 2}
+
+    context.preferences.view.language = 'fr_FR'
+    tool.update_keymap_text(context)
+    assert calls['build'] == 4
+
+
+@pytest.mark.parametrize('spacing', [0.5, 1.0, 5.0])
+def test_default_ingest_keeps_interpolated_points(spacing):
+    """With the default preferences, every point filled in between events reaches the stroke."""
+    import numpy as np
+    from lightpainter.operators.base_tool import get_ingest_pipeline
+    from lightpainter.stroke import interpolate_coords
+
+    preferences = bpy.context.preferences.addons['lightpainter'].preferences
+    pipeline = get_ingest_pipeline(preferences)
+
+    coords = interpolate_coords((0.0, 0.0), (40.0, 0.0), spacing)
+    positions = np.column_stack((coords / 100.0, np.zeros(len(coords))))
+    normals = np.tile((0.0, 0.0, 1.0), (len(coords), 1))
+    assert pipeline.process(positions, normals, coords).all()
@@ -0,0 +1,361 @@
+import pytest
+
+from config import SINGLE_STROKE
+from test_misc import context, ops
+
+# Points around the default cube, with directions both towards and away from it
+OCCLUSION_POINTS = (
+    (3.0, 0.0, 0.0),
+    (0.0, -3.0, 0.5),
+    (0.0, 0.0, 3.0),
+    (2.0, 2.0, -2.0),
+)
+OCCLUSION_DIRECTIONS = (
+    (-1.0, 0.0, 0.0),
+    (1.0, 0.0, 0.0),
+    (0.0, 1.0, 0.0),
+    (0.0, 0.0, -1.0),
+    (-0.57735, -0.57735, 0.57735),
+)
+
+
+@pytest.mark.parametrize('backend', ['BVH', 'NUMPY'])
+def test_occlusion_backend_parity(context, ops, backend):
+    """Every occlusion backend must agree with casting against the scene."""
+    from mathutils import Vector
+    from lightpainter.operators.occlusion import get_occlusion_engine
+
+    reference = get_occlusion_engine(context, 'SCENE')
+    engine = get_occlusion_engine(context, backend)
+
+    for point in OCCLUSION_POINTS:
+        for direction in OCCLUSION_DIRECTIONS:
+            origin, ray = Vector(point), Vector(direction).normalized()
+            assert engine.is_blocked(origin, ray) == reference.is_blocked(origin, ray), (
+                '{} disagrees at {} towards {}'.format(backend, point, direction)
+            )
+
+
+@pytest.mark.parametrize('backend', ['BVH', 'NUMPY'])
+def test_local_occlusion_skips_distant_geometry(context, ops, backend):
+    """Local trees only export geometry that can block rays toward the reserved directions, and grow lazily."""
+    from math import pi
+    from mathutils import Vector
+    from lightpainter.operators.occlusion import get_occlusion_engine
+
+    ops.mesh.primitive_cube_add(location=(0.0, 0.0, 10.0))
+    ops.mesh.primitive_cube_add(location=(0.0, 0.0, -10.0))
+    ops.mesh.primitive_cube_add(location=(30.0, 0.0, 10.0))
+    reference = get_occlusion_engine(context, 'SCENE')
+    engine = get_occlusion_engine(context, backend)
+    local_scene = engine.local_scene
+
+    stroke = [Vector((0.5, 0.5, 1.0)), Vector((-0.5, -0.5, 1.0))]
+    engine.reserve(stroke, (0.0, 0.0, 1.0), pi / 4)
+    # the painted cube and the cube above it, not the ones below or far away
+    assert local_scene.included.sum() == 2
+    for vertex in stroke:
+        for direction in ((0.0, 0.0, 1.0), (0.3, 0.0, 1.0), (0.0, -0.4, 1.0)):
+            ray = Vector(direction).normalized()
+            assert engine.is_blocked(vertex, ray) == reference.is_blocked(vertex, ray)
+
+    # reserving the same region again doesn't export anything
+    assert not local_scene.reserve(stroke, (0.0, 0.0, 1.0), pi / 4)
+
+    # turning toward the far cube grows the tree, but still leaves out the cube below
+    engine.reserve(stroke, (1.0, 0.0, 0.0), pi / 4)
+    assert local_scene.included.sum() == 3
+    ray = (Vector((30.0, 0.0, 10.0)) - stroke[0]).normalized()
+    assert engine.is_blocked(stroke[0], ray) and reference.is_blocked(stroke[0], ray)
+
+
+def test_instances_share_cached_mesh_trees(context, ops):
+    """Instances of one mesh share its tree, which outlives the engine until the mesh is edited."""
+    from mathutils import Matrix, Vector
+    from lightpainter.operators.mesh_cache import MESH_GEOMETRY
+    from lightpainter.operators.occlusion import get_occlusion_engine, NUMPY_TREES
+
+    cube = context.scene.objects['Cube']
+    ops.object.select_all(action='DESELECT')
+    cube.select_set(True)
+    context.view_layer.objects.active = cube
+    ops.object.duplicate_move_linked(TRANSFORM_OT_translate={'value': (0.0, 4.0, 1.0)})
+    instance = context.active_object
+    instance.rotation_euler = (0.3, 0.0, 0.7)
+    instance.scale = (0.5, 2.0, 1.5)
+    context.view_layer.update()
+
+    MESH_GEOMETRY.clear()
+    engine = get_occlusion_engine(context, 'BVH')
+    numpy_engine = get_occlusion_engine(context, 'NUMPY')
+    reference = get_occlusion_engine(context, 'SCENE')
+    origin = Vector((6.0, 2.0, 0.5))
+    for target in ((0.0, 0.0, 0.0), (0.0, 4.0, 1.0), (0.3, 4.5, 1.9), (0.0, 2.0, 0.5)):
+        ray = (Vector(target) - origin).normalized()
+        assert engine.is_blocked(origin, ray) == reference.is_blocked(origin, ray)
+        assert numpy_engine.is_blocked(origin, ray) == reference.is_blocked(origin, ray)
+
+        is_hit, location, normal, _, _, _ = context.scene.ray_cast(context.evaluated_depsgraph_get(), origin, ray)
+        hit = engine.instances.ray_cast(origin, ray, 100.0)
+        assert is_hit == (hit is not None)
+        if is_hit:
+            assert (hit[0] - location).length < 1e-4 and (hit[1] - normal).length < 1e-4
+
+    geometry = MESH_GEOMETRY[('MESH', cube.data.session_uid)]
+    assert len(MESH_GEOMETRY) == 1
+    assert engine.instances.geometries == [geometry, geometry]
+    assert geometry in NUMPY_TREES
+
+    # a new engine reuses the cached tree, until the mesh changes
+    tree = geometry.tree
+    assert get_occlusion_engine(context, 'BVH').is_blocked(origin, (Vector() - origin).normalized()) is True
+    assert MESH_GEOMETRY[('MESH', cube.data.session_uid)].tree is tree
+
+    cube.data.transform(Matrix.Translation((0.0, 0.0, 5.0)))
+    cube.data.update()
+    context.view_layer.update()
+    assert ('MESH', cube.data.session_uid) not in MESH_GEOMETRY
+    cube.data.transform(Matrix.Translation((0.0, 0.0, -5.0)))
+    cube.data.update()
+    context.view_layer.update()
+
+    # geometry of modified objects may deform with the frame
+    cube.modifiers.new('Bevel', 'BEVEL')
+    context.view_layer.update()
+    get_occlusion_engine(context, 'BVH').is_blocked(origin, (Vector() - origin).normalized())
+    assert ('OBJECT', cube.session_uid) in MESH_GEOMETRY
+    context.scene.frame_set(context.scene.frame_current + 1)
+    assert ('OBJECT', cube.session_uid) not in MESH_GEOMETRY
+
+
+def test_local_scene_cone_growth(context, ops):
+    """Widening the reserved cone along the same axis keeps its axis, only opposite cones cover every direction."""
+    from math import pi
+    from lightpainter.operators.occlusion import LOCAL_ANGLE_SLACK, LocalScene
+
+    local_scene = LocalScene(context.evaluated_depsgraph_get())
+    stroke = [(0.5, 0.5, 1.0), (-0.5, -0.5, 1.0)]
+    local_scene.reserve(stroke, (0.0, 0.0, 1.0), pi / 8)
+    local_scene.reserve(stroke, (0.0, 0.0, 1.0), pi / 3)
+    assert abs(local_scene.angle - (pi / 3 + LOCAL_ANGLE_SLACK)) < 1e-6
+    assert local_scene.axis.tolist() == [0.0, 0.0, 1.0]
+
+    local_scene.reserve(stroke, (0.0, 0.0, -1.0), pi / 8)
+    assert local_scene.angle == pi
+
+
+def test_sun_occlusion_backends(context, ops):
+    """Sun tool finds the same direction regardless of occlusion backend."""
+    rotations = []
+    for backend in ('SCENE', 'BVH', 'NUMPY'):
+        ops.lightpainter.sun(str_mouse_path=SINGLE_STROKE, normal_method='OCCLUSION', occlusion_backend=backend)
+        rotations.append(context.active_object.rotation_euler.copy())
+
+    scene_rotation = rotations[0]
+    for rotation in rotations[1:]:
+        assert all(abs(a - b) < 0.0001 for a, b in zip(scene_rotation, rotation))
+
+
+def test_numpy_bvh_matches_bvhtree():
+    """Batched ray-triangle tests must give the same hits as mathutils' BVH tree."""
+    import numpy as np
+    from mathutils import Vector
+    from mathutils.bvhtree import BVHTree
+    from lightpainter.operators.occlusion import EPSILON, TriangleBVH
+
+    rng = np.random.default_rng(0)
+    # small triangles scattered around the origin
+    triangles = rng.uniform(-5.0, 5.0, (200, 1, 3)) + rng.uniform(-1.0, 1.0, (200, 3, 3))
+    origins = rng.uniform(-6.0, 6.0, (300, 3))
+
+    tree = BVHTree.FromPolygons(triangles.reshape(-1, 3).tolist(),
+                                np.arange(len(triangles) * 3).reshape(-1, 3).tolist(), all_triangles=True)
+    bvh = TriangleBVH(triangles, leaf_size=4)
+
+    for direction in ((0.0, 0.0, 1.0), (1.0, 0.0, 0.0), (0.6, -0.48, 0.64)):
+        hits = bvh.intersects(origins, direction)
+        ray = Vector(direction)
+        expected = [tree.ray_cast(Vector(origin) + ray * EPSILON, ray)[0] is not None for origin in origins]
+        assert hits.tolist() == expected
+
+
+def test_visibility_cache_reranks_without_casting(context, ops):
+    """Ranking the same stroke again must not cast any ray, and changing the clamp reuses cached results."""
+    from math import radians
+    from mathutils import Vector
+    from lightpainter.operators.lamp_util import get_occlusion_based_normal, get_visibility_cache
+
+    vertices = [Vector((1.0, 0.0, 0.5)), Vector((0.0, 1.0, 1.0)), Vector((0.5, 0.5, 1.0))]
+    avg_normal = Vector((1.0, 1.0, 1.0)).normalized()
+
+    def count_casts(cache):
+        cast_origins = []
+        get_blocked = cache.engine.get_blocked
+        cache.engine.get_blocked = lambda origins, direction: cast_origins.extend(origins) or get_blocked(
+            origins, direction)
+        return cast_origins
+
+    cache = get_visibility_cache(context, 'BVH')
+    cast_origins = count_casts(cache)
+
+    expected = get_occlusion_based_normal(context, vertices, avg_normal, radians(90), 24, cache=cache)
+    assert cast_origins
+    cast_origins.clear()
+
+    assert get_occlusion_based_normal(context, vertices, avg_normal, radians(90), 24, cache=cache) == expected
+    assert not cast_origins
+
+    get_occlusion_based_normal(context, vertices, avg_normal, radians(30), 24, cache=cache)
+    fresh_cache = get_visibility_cache(context, 'BVH')
+    fresh_cast_origins = count_casts(fresh_cache)
+    get_occlusion_based_normal(context, vertices, avg_normal, radians(30), 24, cache=fresh_cache)
+    assert len(cast_origins) < len(fresh_cast_origins)
+
+
+def test_visibility_cache_incremental_counts(context, ops):
+    """Painting only casts rays for new vertices, erasing casts none, and counts match a fresh cache."""
+    from mathutils import Vector
+    from lightpainter.operators.lamp_util import get_hemisphere_directions, get_visibility_cache
+
+    stroke = [Vector((x * 0.25, 1.5 - x * 0.1, 1.0 - x * 0.2)) for x in range(12)]
+    directions = get_hemisphere_directions(16)
+    cache = get_visibility_cache(context, 'BVH')
+    columns = cache.get_columns(directions)
+
+    cast_origins = []
+    get_blocked = cache.engine.get_blocked
+    cache.engine.get_blocked = lambda origins, direction: cast_origins.extend(origins) or get_blocked(
+        origins, direction)
+
+    for end in range(1, len(stroke) + 1):
+        cast_origins.clear()
+        cache.count_visible(stroke[:end], columns)
+        assert len(cast_origins) == len(columns)
+
+    cast_origins.clear()
+    erased = stroke[:3] + stroke[7:]
+    counts = cache.count_visible(erased, columns)
+    assert not cast_origins
+
+    fresh_cache = get_visibility_cache(context, 'BVH')
+    expected = fresh_cache.count_visible(erased, fresh_cache.get_columns(directions))
+    assert counts.tolist() == expected.tolist()
+
+    # an edit that keeps both ends of the stroke isn't mistaken for painting more points
+    edited = erased[:1] + [Vector((0.4, 1.2, 0.5))] + erased[2:]
+    counts = cache.count_visible(edited, columns)
+    assert cache.weights[cache.rows[tuple(erased[1])]] == 0
+
+    fresh_cache = get_visibility_cache(context, 'BVH')
+    expected = fresh_cache.count_visible(edited, fresh_cache.get_columns(directions))
+    assert counts.tolist() == expected.tolist()
+
+
+def test_adaptive_sampling_refines_direction(context, ops):
+    """With nothing in the way, refinement must land close to the ideal normal."""
+    from math import radians
+    from mathutils import Vector
+    from lightpainter.operators.lamp_util import get_occlusion_based_normal, get_visibility_cache
+
+    vertices = [Vector((10.0 + x, 10.0, 0.0)) for x in range(5)]
+    avg_normal = Vector((0.3, -0.5, 0.6)).normalized()
+
+    cache = get_visibility_cache(context, 'BVH')
+    sun_normal = get_occlusion_based_normal(context, vertices, avg_normal, radians(90), 48, cache=cache)
+    assert sun_normal.angle(avg_normal) < radians(5)
+
+
+@pytest.mark.parametrize('keep', [1, 3])
+def test_rank_directions_matches_exhaustive(context, ops, keep):
+    """Pruned ranking must find the same best directions as ranking every direction, with fewer rays."""
+    import numpy as np
+    from mathutils import Vector
+    from lightpainter.operators.lamp_util import (
+        calc_rank, get_hemisphere_directions, get_visibility_cache, rank_directions
+    )
+
+    # mostly unoccluded stroke next to the default cube
+    vertices = [Vector((1.5 + x * 0.2, -1.0 + x * 0.3, 0.5 - x * 0.1)) for x in range(10)]
+    directions = get_hemisphere_directions(32)
+    dot_products = directions @ np.array((0.6, -0.3, 0.5)) / np.linalg.norm((0.6, -0.3, 0.5))
+
+    exhaustive_cache = get_visibility_cache(context, 'BVH')
+    counts = exhaustive_cache.count_visible(vertices, exhaustive_cache.get_columns(directions))
+    expected = calc_rank(dot_products, counts)
+
+    cache = get_visibility_cache(context, 'BVH')
+    ranks = rank_directions(cache, vertices, cache.get_columns(directions), dot_products, keep=keep)
+
+    assert np.argmax(ranks) == np.argmax(expected)
+    assert np.sort(ranks)[-keep:].tolist() == np.sort(expected)[-keep:].tolist()
+    assert np.all(ranks >= expected)
+    assert np.count_nonzero(cache.known) < np.count_nonzero(exhaustive_cache.known)
+
+
+def test_representative_points(context, ops):
+    """Large strokes are reduced to weighted representatives that count like the points they stand for."""
+    import numpy as np
+    from lightpainter.operators.lamp_util import (
+        get_hemisphere_directions, get_representative_points, get_visibility_cache
+    )
+
+    rng = np.random.default_rng(0)
+    stroke = (rng.uniform(-3.0, 3.0, (5000, 3)) * (1.0, 1.0, 0.1) + (0.0, 0.0, 1.5)).tolist()
+
+    points, weights = get_representative_points(stroke, 64)
+    assert len(points) <= 64
+    assert weights.sum() == len(stroke)
+    assert all(point in stroke for point in points)
+
+    # painting more points nearby keeps the same grid
+    more_points, _ = get_representative_points(stroke + stroke[:10], 64)
+    assert more_points == points
+
+    directions = get_hemisphere_directions(16)
+    cache = get_visibility_cache(context, 'BVH')
+    counts = cache.count_visible(points, cache.get_columns(directions), weights)
+
+    repeated = [point for point, weight in zip(points, weights) for _ in range(weight)]
+    fresh_cache = get_visibility_cache(context, 'BVH')
+    expected = fresh_cache.count_visible(repeated, fresh_cache.get_columns(directions))
+    assert counts.tolist() == expected.tolist()
+
+    # switching back to unweighted points drops the weights
+    counts = cache.count_visible(points[:5], cache.get_columns(directions))
+    expected = fresh_cache.count_visible(points[:5], fresh_cache.get_columns(directions))
+    assert counts.tolist() == expected.tolist()
+
+
+def test_sampling_stays_on_bounded_lattice(context, ops):
+    """Sampled directions stay inside the clamp and on fixed lattices, so drifting normals reuse a bounded cache."""
+    from math import radians, sin
+    import numpy as np
+    from mathutils import Vector
+    from lightpainter.operators.lamp_util import (
+        CACHED_DIRECTIONS_PER_RAY, get_lattice_directions, get_occlusion_based_normal, get_visibility_cache,
+        snap_to_lattice
+    )
+
+    for level in range(5):
+        directions = get_lattice_directions(level)
+        assert np.allclose(snap_to_lattice(directions, level), directions)
+
+    stroke = [Vector((1.5 + x * 0.1, -1.0 + x * 0.2, 0.5)) for x in range(40)]
+    cache = get_visibility_cache(context, 'BVH')
+    cast_origins = []
+    get_blocked = cache.engine.get_blocked
+    cache.engine.get_blocked = lambda origins, direction: cast_origins.extend(origins) or get_blocked(
+        origins, direction)
+
+    casts = []
+    for end in range(10, len(stroke) + 1):
+        cast_origins.clear()
+        avg_normal = Vector((0.6, -0.3 + end * 0.005, 0.5)).normalized()
+        get_occlusion_based_normal(context, stroke[:end], avg_normal, radians(45), 24, cache=cache)
+        casts.append(len(cast_origins))
+
+        assert len(cache.directions) <= CACHED_DIRECTIONS_PER_RAY * 24
+        assert np.all(cache.directions[:, 2] <= sin(radians(45)) + 1e-5)
+
+    # after the first update, mostly the new point is cast against cached directions
+    assert max(casts[1:]) < casts[0]
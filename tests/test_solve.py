@@ -0,0 +1,164 @@
+import math
+
+import numpy as np
+import pytest
+
+import bpy  # noqa: F401 (makes mathutils importable)
+from mathutils import Euler, Matrix, Vector
+from mathutils.geometry import box_fit_2d
+
+from test_solve_standalone import solve  # noqa: F401 (fixture)
+
+# Unit tests comparing the NumPy solver against the mathutils implementations it replaced,
+# the solver's own tests that don't need Blender are in test_solve_standalone.py
+
+DIRECTIONS = (
+    (0.0, 0.0, 1.0), (0.0, 0.0, -1.0), (1.0, 0.0, 0.0), (-1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, -1.0, 0.0),
+    (1.0, 1.0, 1.0), (-0.3, 0.2, -0.9), (0.5, -0.7, 0.1), (0.0, 0.3, -0.2),
+)
+
+
+def random_stroke(seed: int, count: int = 50):
+    """Points scattered over a tilted plane, with normals roughly facing the same way."""
+    rng = np.random.default_rng(seed)
+    normal = rng.normal(size=3)
+    normal /= np.linalg.norm(normal)
+    tangent = np.cross(normal, (0.3, 0.5, 0.8))
+    tangent /= np.linalg.norm(tangent)
+    bitangent = np.cross(normal, tangent)
+
+    vertices = (rng.normal(size=(count, 1)) * 3 * tangent + rng.normal(size=(count, 1)) * bitangent +
+                rng.normal(size=(count, 1)) * 0.1 * normal + rng.uniform(-5, 5, 3))
+    normals = normal + rng.normal(size=(count, 3)) * 0.2
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    return [Vector(v) for v in vertices], [Vector(n) for n in normals]
+
+
+def legacy_average_normal(normals):
+    avg_normal = sum(normals, start=Vector())
+    avg_normal.normalize()
+    return avg_normal
+
+
+def legacy_flatten(vertices, normal):
+    farthest_point = max((v.project(normal).length_squared, v) for v in vertices)[1]
+    return tuple(v + (farthest_point - v).project(normal) for v in vertices)
+
+
+def legacy_get_box(vertices, normal):
+    align_to_z = normal.rotation_difference(Vector((0.0, 0.0, 1.0))).to_matrix()
+    flattened_2d = [align_to_z @ v for v in vertices]
+
+    angle = box_fit_2d([(v[0], v[1]) for v in flattened_2d])
+    box_mat = Matrix.Rotation(angle, 3, 'Z')
+    aligned_2d = [(box_mat @ Vector((co[0], co[1], 0))) for co in flattened_2d]
+    xs = tuple(co[0] for co in aligned_2d)
+    ys = tuple(co[1] for co in aligned_2d)
+
+    x_min, x_max = min(xs), max(xs)
+    y_min, y_max = min(ys), max(ys)
+
+    length = x_max - x_min
+    width = y_max - y_min
+
+    center = align_to_z.inverted_safe() @ box_mat.inverted_safe() @ Vector((x_min + (length / 2),
+                                                                            y_min + (width / 2),
+                                                                            flattened_2d[0][2]))
+    return center, align_to_z.inverted_safe() @ box_mat.inverted_safe(), length, width
+
+
+def assert_close(expected, actual, tolerance=1e-4):
+    assert np.allclose(np.asarray(expected, dtype=np.float64), np.asarray(actual, dtype=np.float64),
+                       atol=tolerance, rtol=0.0), '{} != {}'.format(expected, actual)
+
+
+@pytest.mark.parametrize('source', DIRECTIONS)
+@pytest.mark.parametrize('target', DIRECTIONS)
+def test_rotation_parity(solve, source, target):
+    """Rotations and their Euler angles match mathutils, including opposite directions."""
+    expected = Vector(source).rotation_difference(Vector(target))
+    actual = solve.rotation_difference(source, target)
+
+    assert_close(expected.to_matrix(), actual)
+    assert_close(expected.to_euler(), solve.matrix_to_euler(actual))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_average_normal_and_flatten_parity(solve, seed):
+    """Average normals and flattened strokes match the mathutils implementations."""
+    vertices, normals = random_stroke(seed)
+
+    avg_normal = legacy_average_normal(normals)
+    assert_close(avg_normal, solve.average_normal(normals))
+    assert_close(legacy_flatten(vertices, avg_normal), solve.flatten(vertices, np.array(avg_normal)))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_box_parity(solve, seed):
+    """Fitted rectangles match the mathutils implementation."""
+    vertices, normals = random_stroke(seed)
+    avg_normal = -legacy_average_normal(normals)
+    flattened = legacy_flatten(vertices, avg_normal)
+
+    expected_center, expected_matrix, expected_length, expected_width = legacy_get_box(flattened, avg_normal)
+    center, matrix, length, width = solve.get_box(flattened, np.array(avg_normal))
+
+    assert_close(expected_center, center)
+    assert_close(expected_matrix, matrix)
+    assert_close((expected_length, expected_width), (length, width))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_lamp_placement_parity(solve, seed):
+    """Point, spot and area lamps are placed like the mathutils implementations."""
+    vertices, normals = random_stroke(seed)
+    orig_vertices = [v - n for v, n in zip(vertices, normals)]
+    avg_normal = -legacy_average_normal(normals)
+    flattened = legacy_flatten(vertices, avg_normal)
+
+    center = sum(flattened, start=Vector()) / len(flattened)
+    assert_close(center, solve.get_point_placement(vertices, normals))
+
+    orig_center = sum(orig_vertices, start=Vector()) / len(orig_vertices)
+    centers_dir = (orig_center - center).normalized()
+    spot = solve.get_spot_placement(vertices, normals, orig_vertices)
+    assert_close(center, spot.location)
+    assert_close(Vector((0.0, 0.0, -1.0)).rotation_difference(avg_normal).to_euler(), spot.rotation)
+    assert math.isclose(2 * max((v - center).normalized().angle(centers_dir) for v in orig_vertices),
+                        spot.spot_size, abs_tol=1e-4)
+
+    box_center, box_matrix, length, width = legacy_get_box(flattened, avg_normal)
+    rotation = box_matrix.to_euler()
+    rotation.rotate_axis('X', math.radians(180.0))
+    area = solve.get_area_placement(vertices, normals)
+    assert_close(box_center, area.location)
+    assert_close(rotation.to_matrix(), Euler(area.rotation).to_matrix())
+    assert_close((length, width), area.size)
+
+
+@pytest.mark.parametrize('axis', ['X', 'Y', 'Z', 'NORMAL', 'REFLECT'])
+@pytest.mark.parametrize('offset', [0.0, 1.5, -0.5])
+def test_prep_stroke_parity(solve, axis, offset):
+    """Offsetting strokes along each axis matches the mathutils implementation."""
+    vertices, normals = random_stroke(0, 10)
+    camera_origin = Vector((7.0, -6.0, 5.0))
+
+    if axis in solve.AXES:
+        expected_normals = [Vector(solve.AXES[axis]) for _ in vertices]
+    elif axis == 'REFLECT':
+        expected_normals = []
+        for vertex, normal in zip(vertices, normals):
+            direction = (vertex - camera_origin).normalized()
+            expected_normals.append((direction - normal * 2 * direction.dot(normal)).normalized())
+    else:
+        expected_normals = normals
+    expected_vertices = [v + n * offset for v, n in zip(vertices, expected_normals)]
+    if offset < 0.0:
+        expected_normals = [-n for n in expected_normals]
+
+    actual_vertices, actual_normals, orig_vertices = solve.prep_stroke(
+        vertices, normals, axis, offset, camera_origin
+    )
+    assert_close(expected_vertices, actual_vertices)
+    assert_close(expected_normals, actual_normals)
+    assert_close(vertices, orig_vertices)
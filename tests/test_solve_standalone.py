@@ -0,0 +1,109 @@
+import importlib
+import math
+from pathlib import Path
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+# Tests of the NumPy solver that don't need Blender, importing it the way scripts outside of Blender do
+
+ADDON_PATH = Path(__file__).parent.parent
+
+
+def get_package_path(directory: Path) -> Path:
+    """Links the add-on into a directory under its package name, so it can be imported from there."""
+    package = directory / 'lightpainter'
+    if not package.exists():
+        package.symlink_to(ADDON_PATH, target_is_directory=True)
+    return directory
+
+
+@pytest.fixture(scope='module')
+def solve(tmp_path_factory):
+    """The solver module, from the installed add-on if there is one, else from the source tree."""
+    if 'lightpainter' not in sys.modules:
+        sys.path.insert(0, str(get_package_path(tmp_path_factory.mktemp('packages'))))
+    return importlib.import_module('lightpainter.solve')
+
+
+def random_stroke(seed: int, count: int = 50):
+    """Points scattered over a tilted plane, with normals roughly facing the same way."""
+    rng = np.random.default_rng(seed)
+    normal = rng.normal(size=3)
+    normal /= np.linalg.norm(normal)
+    tangent = np.cross(normal, (0.3, 0.5, 0.8))
+    tangent /= np.linalg.norm(tangent)
+    bitangent = np.cross(normal, tangent)
+
+    vertices = (rng.normal(size=(count, 1)) * 3 * tangent + rng.normal(size=(count, 1)) * bitangent +
+                rng.normal(size=(count, 1)) * 0.1 * normal + rng.uniform(-5, 5, 3))
+    normals = normal + rng.normal(size=(count, 3)) * 0.2
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    return vertices, normals
+
+
+def assert_close(expected, actual, tolerance=1e-4):
+    assert np.allclose(np.asarray(expected, dtype=np.float64), np.asarray(actual, dtype=np.float64),
+                       atol=tolerance, rtol=0.0), '{} != {}'.format(expected, actual)
+
+
+def test_solve_imports_without_blender(tmp_path):
+    """The add-on package can be imported without Blender, to use the solver."""
+    script = ('import sys; sys.modules["bpy"] = None; '
+              'from lightpainter import solve; '
+              'solve.get_point_placement([(0, 0, 0), (1, 1, 1)], [(0, 0, 1), (0, 0, 1)]); '
+              'assert "mathutils" not in sys.modules and "lightpainter.operators" not in sys.modules')
+    subprocess.run([sys.executable, '-c', script], cwd=get_package_path(tmp_path), check=True)
+
+
+def test_average_normal_zero_fails(solve):
+    with pytest.raises(ValueError):
+        solve.average_normal([(0, 0, 1), (0, 0, -1)])
+
+
+def test_prep_stroke_reflect_requires_camera(solve):
+    vertices, normals = random_stroke(0, 3)
+    with pytest.raises(ValueError):
+        solve.prep_stroke(vertices, normals, 'REFLECT', 1.0)
+
+
+@pytest.mark.parametrize('lamp_type', ['POINT', 'SPOT', 'AREA'])
+@pytest.mark.parametrize('axis', ['NORMAL', 'Z', 'REFLECT'])
+def test_batched_placements_match_single_sets(solve, lamp_type, axis):
+    """Placing lamps for many stroke sets at once matches placing them one set at a time."""
+    strokes = [random_stroke(seed, count) for seed, count in zip(range(6), (1, 2, 5, 30, 12, 7))]
+    vertices = np.concatenate([stroke_vertices for stroke_vertices, _ in strokes])
+    normals = np.concatenate([stroke_normals for _, stroke_normals in strokes])
+    set_offsets = np.cumsum([0] + [len(stroke_vertices) for stroke_vertices, _ in strokes])
+    offsets = np.array((1.0, 2.0, 0.5, -1.0, 3.0, 1.5))
+    camera_origin = (7.0, -6.0, 5.0)
+
+    placements = solve.get_lamp_placements(vertices, normals, set_offsets, lamp_type, offset=offsets,
+                                           power=20.0, is_power_relative=True, axis=axis,
+                                           camera_origin=camera_origin)
+
+    for index, ((stroke_vertices, stroke_normals), offset) in enumerate(zip(strokes, offsets)):
+        set_vertices, set_normals, orig_vertices = solve.prep_stroke(
+            stroke_vertices, stroke_normals, axis, offset, camera_origin
+        )
+        assert math.isclose(placements.power[index], solve.calc_power(20.0, offset))
+        if lamp_type == 'POINT':
+            assert_close(solve.get_point_placement(set_vertices, set_normals), placements.location[index])
+        elif lamp_type == 'SPOT':
+            location, rotation, spot_size = solve.get_spot_placement(set_vertices, set_normals, orig_vertices)
+            assert_close(location, placements.location[index])
+            assert_close(rotation, placements.rotation[index])
+            assert math.isclose(spot_size, placements.spot_size[index], abs_tol=1e-6)
+        else:
+            location, rotation, size = solve.get_area_placement(set_vertices, set_normals)
+            assert_close(location, placements.location[index])
+            assert_close(rotation, placements.rotation[index])
+            # the single point set is clamped to the default minimum size
+            assert_close(np.maximum(size, 0.01), placements.size[index])
+
+
+def test_batched_placements_fail_on_empty_set(solve):
+    with pytest.raises(ValueError):
+        solve.get_lamp_placements(np.zeros((2, 3)), np.ones((2, 3)), (0, 2, 2), 'POINT')
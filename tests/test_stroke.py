@@ -0,0 +1,326 @@
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import bpy  # noqa: F401 (makes mathutils importable)
+from bpy_extras import view3d_utils
+from mathutils import Matrix
+
+# the stroke buffer doesn't need Blender, so it is loaded straight from the source tree
+STROKE_PATH = Path(__file__).parent.parent / 'stroke.py'
+stroke_spec = importlib.util.spec_from_file_location('stroke', STROKE_PATH)
+stroke = importlib.util.module_from_spec(stroke_spec)
+stroke_spec.loader.exec_module(stroke)
+
+
+def legacy_erase(mouse_path, keep):
+    """Splitting rules of the list-based eraser the buffer replaced."""
+    new_mouse_path = [[]]
+    keep = iter(keep)
+    for idx, path in enumerate(mouse_path):
+        for point in path:
+            if next(keep):
+                new_mouse_path[-1].append(point)
+            elif len(new_mouse_path[-1]) != 0:
+                new_mouse_path.append(list())
+
+        # preserve original breaks between paths
+        if len(new_mouse_path[-1]) != 0 and idx != (len(mouse_path) - 1):
+            new_mouse_path.append(list())
+    return new_mouse_path
+
+
+def random_mouse_path(seed):
+    rng = np.random.default_rng(seed)
+    return [
+        [(tuple(rng.normal(size=3)), tuple(rng.normal(size=3))) for _ in range(rng.integers(0, 6))]
+        for _ in range(rng.integers(1, 6))
+    ]
+
+
+def as_lists(buffer):
+    return [[(tuple(p), tuple(n)) for p, n in zip(positions.tolist(), normals.tolist())]
+            for positions, normals in buffer.strokes()]
+
+
+def test_append_grows_buffer():
+    buffer = stroke.StrokeBuffer(capacity=2)
+    for idx in range(100):
+        if idx % 30 == 0 and idx != 0:
+            buffer.new_stroke()
+        buffer.append((idx, 0, 0), (0, 0, 1))
+
+    assert len(buffer) == 100
+    assert buffer.positions.dtype == np.float32
+    assert buffer.positions[:, 0].tolist() == list(range(100))
+    assert buffer.offsets.tolist() == [0, 30, 60, 90, 100]
+    assert buffer.last_stroke_length == 10
+
+
+def test_views_are_not_copied():
+    buffer = stroke.StrokeBuffer()
+    buffer.extend([(0, 0, 0), (1, 0, 0)], [(0, 0, 1), (0, 0, 1)])
+    assert all(np.shares_memory(positions, buffer.positions) for positions, _ in buffer.strokes())
+
+
+def test_version_changes():
+    buffer = stroke.StrokeBuffer()
+    versions = [buffer.version]
+    buffer.append((0, 0, 0), (0, 0, 1))
+    versions.append(buffer.version)
+    buffer.new_stroke()
+    versions.append(buffer.version)
+    versions.append(buffer.filter([True]).version)
+    assert len(set(versions)) == len(versions)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_from_strokes_round_trip(seed):
+    mouse_path = random_mouse_path(seed)
+    buffer = stroke.StrokeBuffer.from_strokes(mouse_path)
+    assert buffer.stroke_count == len(mouse_path)
+    expected = [[(tuple(np.float32(p).tolist()), tuple(np.float32(n).tolist())) for p, n in path]
+                for path in mouse_path]
+    assert as_lists(buffer) == expected
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_filter_matches_legacy_eraser(seed):
+    """Erasing keeps the same stroke breaks as the list-based eraser."""
+    mouse_path = random_mouse_path(seed)
+    buffer = stroke.StrokeBuffer.from_strokes(mouse_path)
+    keep = np.random.default_rng(seed + 100).random(len(buffer)) > 0.4
+
+    expected = legacy_erase(as_lists(buffer), keep)
+    assert as_lists(buffer.filter(keep)) == expected
+
+
+@pytest.mark.parametrize('keep', [(), (False, False, False), (True, True, True)])
+def test_filter_edge_cases(keep):
+    mouse_path = [[((0, 0, 0), (0, 0, 1)), ((1, 0, 0), (0, 0, 1))], [], [((2, 0, 0), (0, 0, 1))]] if keep else [[]]
+    buffer = stroke.StrokeBuffer.from_strokes(mouse_path)
+    assert as_lists(buffer.filter(np.array(keep, dtype=bool))) == legacy_erase(as_lists(buffer), keep)
+
+
+def test_projection_matches_view3d_utils():
+    """Batched projection matches Blender's per-point projection, flagging points behind the view."""
+    region = type('Region', (), {'width': 640, 'height': 480})
+    rv3d = type('RegionView3D', (), {})
+    rv3d.perspective_matrix = Matrix.Translation((0.0, 0.0, 5.0)) @ Matrix((
+        (1.2, 0.0, 0.0, 0.0),
+        (0.0, 1.6, 0.0, 0.0),
+        (0.0, 0.0, -1.0, -0.2),
+        (0.0, 0.0, -1.0, 0.0),
+    ))
+    positions = np.random.default_rng(0).normal(size=(200, 3)).astype(np.float32) * 3
+
+    coords, in_front = stroke.project_to_region(positions, rv3d.perspective_matrix, region.width, region.height)
+    for position, coord, is_in_front in zip(positions, coords, in_front):
+        expected = view3d_utils.location_3d_to_region_2d(region, rv3d, position)
+        assert (expected is not None) == is_in_front
+        if expected is not None:
+            assert np.allclose(expected, coord, atol=1e-3)
+    assert 0 < np.count_nonzero(in_front) < len(positions)
+
+
+@pytest.mark.parametrize('end', [(10.0, 0.0), (0.0, 0.0), (-33.0, 47.0), (3.0, -4.0)])
+def test_interpolate_coords_spacing(end):
+    """Gaps are filled with evenly spaced coordinates that end at the cursor."""
+    start = np.array((0.0, 0.0))
+    coords = stroke.interpolate_coords(start, end, 5.0)
+
+    assert np.allclose(coords[-1], end)
+    steps = np.linalg.norm(np.diff(np.vstack((start, coords)), axis=0), axis=1)
+    assert np.allclose(steps, steps[0]) and steps[0] <= 5.0 + 1e-9
+    assert len(coords) == max(int(np.ceil(np.linalg.norm(end) / 5.0)), 1)
+
+
+@pytest.mark.parametrize('view_perspective', ['PERSP', 'ORTHO', 'CAMERA'])
+def test_region_rays_match_view3d_utils(view_perspective):
+    """Batched rays match Blender's per-coordinate rays, across views recorded in one pending stroke."""
+    region = type('Region', (), {'width': 640, 'height': 480})
+    rv3d = type('RegionView3D', (), {})
+    rv3d.is_perspective = view_perspective == 'PERSP'
+    rv3d.view_perspective = view_perspective
+    if rv3d.is_perspective:
+        projection = Matrix(((1.2, 0.0, 0.0, 0.0), (0.0, 1.6, 0.0, 0.0),
+                             (0.0, 0.0, -1.0, -0.2), (0.0, 0.0, -1.0, 0.0)))
+    else:
+        projection = Matrix(((0.2, 0.0, 0.0, 0.0), (0.0, 0.25, 0.0, 0.0),
+                             (0.0, 0.0, -0.01, -1.0), (0.0, 0.0, 0.0, 1.0)))
+
+    coords = np.random.default_rng(0).uniform((0, 0), (640, 480), size=(50, 2))
+    pending = stroke.PendingStroke()
+    expected = []
+    for index, coord in enumerate(coords):
+        rv3d.view_matrix = (Matrix.Translation((0.0, 0.0, -5.0)) @
+                            Matrix.Rotation(0.3 + index // 20, 4, 'X') @ Matrix.Rotation(0.5, 4, 'Z'))
+        rv3d.perspective_matrix = projection @ rv3d.view_matrix
+        pending.add(tuple(coord), stroke.RegionView(tuple(map(tuple, rv3d.perspective_matrix)),
+                                                    tuple(map(tuple, rv3d.view_matrix)), rv3d.is_perspective,
+                                                    view_perspective == 'CAMERA', region.width, region.height))
+        expected.append((view3d_utils.region_2d_to_origin_3d(region, rv3d, coord),
+                         view3d_utils.region_2d_to_vector_3d(region, rv3d, coord)))
+
+    assert len(pending.views) == 3
+    origins, directions = pending.get_rays()
+    for (expected_origin, expected_direction), origin, direction in zip(expected, origins, directions):
+        assert np.allclose(expected_origin, origin, atol=1e-3)
+        assert np.allclose(expected_direction, direction, atol=1e-5)
+
+    pending.clear()
+    assert len(pending) == 0 and not pending.views
+
+
+def test_screen_index_matches_brute_force():
+    """Points found through the grid are exactly the projected points inside the eraser."""
+    rng = np.random.default_rng(1)
+    positions = rng.uniform(-1.5, 1.5, size=(2000, 3))
+    buffer = stroke.StrokeBuffer.from_strokes([list(zip(positions, positions))])
+    matrix = np.diag((1.0, 1.0, 1.0, 1.0))
+    matrix[3, 2] = 1.0  # puts points behind the view when z < -1
+    index = stroke.ScreenIndex(cell_size=20.0)
+    index.update(buffer, matrix, 640, 480)
+    coords, in_front = stroke.project_to_region(buffer.positions, matrix, 640, 480)
+
+    for center, radius in zip(rng.uniform(-50, 700, size=(30, 2)), rng.uniform(1, 150, size=30)):
+        distances = np.linalg.norm(coords - center, axis=1)
+        expected = np.flatnonzero(in_front & (distances <= radius))
+        assert index.query(center, radius).tolist() == expected.tolist()
+    assert not in_front.all()
+
+
+def test_screen_index_filter_matches_rebuild():
+    rng = np.random.default_rng(2)
+    positions = rng.uniform(-0.5, 0.5, size=(500, 3))
+    buffer = stroke.StrokeBuffer.from_strokes([list(zip(positions, positions))])
+    matrix = np.eye(4)
+    index = stroke.ScreenIndex()
+    index.update(buffer, matrix, 300, 300)
+
+    keep = np.ones(len(buffer), dtype=bool)
+    keep[index.query((150, 150), 40)] = False
+    filtered = buffer.filter(keep)
+    index.filter(keep, filtered)
+
+    rebuilt = stroke.ScreenIndex()
+    rebuilt.update(filtered, matrix, 300, 300)
+    assert index.key == rebuilt.key
+    for center in ((150, 150), (100, 120), (200, 180)):
+        assert index.query(center, 60).tolist() == rebuilt.query(center, 60).tolist()
+
+
+def test_remove_keeps_strokes():
+    """Removing points keeps the strokes they were in, unlike erasing."""
+    strokes = random_mouse_path(3)
+    buffer = stroke.StrokeBuffer.from_strokes(strokes)
+    keep = np.random.default_rng(3).random(len(buffer)) < 0.5
+    version = buffer.version
+
+    expected = [[point for point, kept in zip(path, keep[start:start + len(path)]) if kept]
+                for path, start in zip(strokes, buffer.stroke_starts)]
+    buffer.remove(keep)
+
+    assert buffer.version > version
+    assert buffer.stroke_count == len(strokes)
+    for (positions, normals), path in zip(buffer.strokes(), expected):
+        assert np.allclose(positions, np.array([p for p, _ in path], dtype=np.float32).reshape(-1, 3))
+        assert np.allclose(normals, np.array([n for _, n in path], dtype=np.float32).reshape(-1, 3))
+
+
+@pytest.mark.parametrize('tolerance', [0.01, 0.1, 0.5])
+def test_simplify_polyline_within_tolerance(tolerance):
+    """Simplified lines stay within the tolerance of every removed point, and keep both ends."""
+    t = np.linspace(0.0, 4.0, 300)
+    points = np.column_stack((t, np.sin(t * 2.0), 0.1 * t ** 2))
+    keep = stroke.simplify_polyline(points, tolerance)
+
+    assert keep[0] and keep[-1] and keep.sum() < len(points)
+    kept = np.flatnonzero(keep)
+    for start, end in zip(kept[:-1], kept[1:]):
+        segment = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        along = np.outer(offsets @ segment / (segment @ segment), segment)
+        assert (np.linalg.norm(offsets - along, axis=1) <= tolerance + 1e-9).all()
+
+    # straight lines only keep their ends
+    assert stroke.simplify_polyline(np.linspace((0, 0, 0), (1, 2, 3), 20), tolerance).sum() == 2
+
+
+def test_ingest_pipeline_stages():
+    """Duplicates and closely spaced points are dropped across batches, and strokes are simplified when finished."""
+    pipeline = stroke.IngestPipeline([stroke.DuplicateFilter(), stroke.SpacingFilter(0.5, 3.0)], 0.01)
+    normals = np.tile((0.0, 0.0, 1.0), (4, 1))
+
+    positions = np.array(((0.0, 0.0, 0.0), (0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (1.2, 0.0, 0.0)))
+    coords = np.array(((0.0, 0.0), (0.0, 0.0), (10.0, 0.0), (20.0, 0.0)))
+    assert pipeline.process(positions, normals, coords).tolist() == [True, False, True, False]
+
+    # spacing is measured from the last kept point of the previous batch, in both world space and pixels
+    positions = np.array(((1.0, 0.0, 0.0), (2.0, 0.0, 0.0), (3.0, 0.0, 0.0), (4.0, 0.0, 0.0)))
+    coords = np.array(((10.0, 0.0), (20.0, 0.0), (21.0, 0.0), (40.0, 0.0)))
+    assert pipeline.process(positions, normals, coords).tolist() == [False, True, False, True]
+
+    buffer = stroke.StrokeBuffer()
+    buffer.extend(np.column_stack((np.arange(6.0), np.zeros(6), np.zeros(6))), np.tile((0.0, 0.0, 1.0), (6, 1)))
+    assert pipeline.finish(buffer, 2)
+    assert np.allclose(buffer.positions[:, 0], (0.0, 1.0, 2.0, 5.0))
+
+    # finishing resets the stages, so the next stroke can start anywhere
+    assert pipeline.process(positions[:1], normals[:1], coords[:1]).tolist() == [True]
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_segments_stay_within_strokes(seed):
+    """Line segments join consecutive points of each stroke, and never join two strokes."""
+    buffer = stroke.StrokeBuffer.from_strokes(random_mouse_path(seed))
+    expected = [[start + idx, start + idx + 1]
+                for start, end in zip(buffer.offsets[:-1], buffer.offsets[1:])
+                for idx in range(end - start - 1)]
+    assert buffer.get_segments().tolist() == expected
+
+
+def test_lod_levels_decimate_strokes():
+    """Each level keeps every other point of the previous one and the ends of every stroke."""
+    rng = np.random.default_rng(0)
+    buffer = stroke.StrokeBuffer()
+    for length in (1000, 1, 37, 0, 300):
+        buffer.extend(np.cumsum(rng.normal(size=(length, 3)), axis=0), np.ones((length, 3)))
+        buffer.new_stroke()
+
+    lod = stroke.StrokeLOD()
+    assert lod.update(buffer) and not lod.update(buffer)
+    assert lod.levels[0].tolist() == buffer.get_segments().tolist()
+    assert len(lod.levels) == stroke.LOD_MAX_LEVELS
+
+    offsets = buffer.offsets
+    for finer, coarser in zip(lod.levels[:-1], lod.levels[1:]):
+        assert len(finer) / 2 - len(buffer) <= len(coarser) < len(finer)
+        # segments never join strokes, and every stroke with a segment still spans its ends
+        stroke_ids = np.searchsorted(offsets, coarser, side='right') - 1
+        assert (stroke_ids[:, 0] == stroke_ids[:, 1]).all()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            if end - start > 1:
+                assert start in coarser[:, 0] and end - 1 in coarser[:, 1]
+
+    buffer.append((0.0, 0.0, 0.0), (0.0, 0.0, 1.0))
+    assert lod.update(buffer)
+
+
+def test_lod_selection_bounds_segments():
+    """Zooming out picks coarser levels, and no more segments than the limit are drawn when avoidable."""
+    t = np.linspace(0.0, 10.0, 50000)
+    buffer = stroke.StrokeBuffer()
+    buffer.extend(np.column_stack((np.cos(t), np.sin(t), t)), np.ones((len(t), 3)))
+    lod = stroke.StrokeLOD()
+    lod.update(buffer)
+
+    def perspective(distance):
+        return np.array(((1.0, 0.0, 0.0, 0.0), (0.0, 1.0, 0.0, 0.0),
+                         (0.0, 0.0, -1.0, distance - 0.2), (0.0, 0.0, -1.0, distance)))
+
+    levels = [lod.select_level(perspective(distance), 1000, max_segments=10 ** 9) for distance in (0.1, 10.0, 1000.0)]
+    assert levels == sorted(levels) and levels[0] < levels[-1]
+    assert len(lod.levels[lod.select_level(perspective(0.1), 1000)]) <= stroke.LOD_MAX_SEGMENTS
@@ -32,10 +32,10 @@ data = {
     "Adjusts active lamp\'s position and rotation to light surfaces specified by annotations": "アクティブなランプの位置と回転を注釈で指定されたライトサーフェスに調整します",
     "Method": "方法",
     "Method to determine sun direction": "太陽方向を決定する方法",
-    "Azimuth Samples": "方位角のサンプル",
-    "Samples of normals around the azimuth. ": "方位角の周りの法線のサンプル。",
-    "Elevation Samples": "仰角サンプル",
-    "Samples of normals from the horizon to the maximum elevation. ": "地平線から最大仰角までの法線のサンプル。",
+    "Ray Budget": "レイ予算",
+    "Maximum number of directions each painted point is tested against. Increasing the budget improves precision at the cost of processing time": "ペイントした各ポイントをテストする方向の最大数。予算を増やすと処理時間と引き換えに精度が向上します",
+    "Max Points": "最大ポイント数",
+    "Maximum number of painted points tested for occlusion. Beyond it, nearby points are grouped together and tested once": "遮蔽をテストするペイントしたポイントの最大数。それを超えると、近くのポイントはまとめて一度だけテストされます",
     "Max Sun Elevation": "最大太陽高度",
     "Tested normals will be scaled to at most this elevation.": "テストされた法線は、最大の高度にスケーリングされます。",
     "Angle": "角度",
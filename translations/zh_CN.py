@@ -31,10 +31,10 @@ data = {
     "Adjusts active lamp\'s position and rotation to light surfaces specified by annotations" : "调整活动灯的位置和旋转，以照亮注释指定的表面",
     "Method" : "方法",
     "Method to determine sun direction" : "确定太阳方向的方法",
-    "Azimuth Samples" : "方位角样本",
-    "Samples of normals around the azimuth. " : "方位角周围法线的采样。",
-    "Elevation Samples" : "高程样本",
-    "Samples of normals from the horizon to the maximum elevation. " : "从地平线到最大高程的法线采样。",
+    "Ray Budget" : "射线预算",
+    "Maximum number of directions each painted point is tested against. Increasing the budget improves precision at the cost of processing time" : "每个绘制点测试的最大方向数。增加预算可以提高精度，但会增加处理时间",
+    "Max Points" : "最大点数",
+    "Maximum number of painted points tested for occlusion. Beyond it, nearby points are grouped together and tested once" : "测试遮挡的最大绘制点数。超过该数量时，相邻的点会被合并并只测试一次",
     "Max Sun Elevation" : "最大太阳高度",
     "Tested normals will be scaled to at most this elevation." : "测试的法线将最多缩放到此高程。",
     "Angle" : "角度",